@@ -0,0 +1,180 @@
+"""已收盤交易日的 ticks 欄位式封存，歷史查詢以 mmap 讀取而不必掃描 DB
+
+每個交易日一個資料夾，所有股票依代號排序後串接成固定寬度的欄位檔，另以 index.json 記錄各檔的起訖位置：
+
+    <ARCHIVE_DIR>/2025-01-02/ts_sec.npy, price.npy, vol.npy, best_bid.npy, best_ask.npy, index.json
+
+    python archive.py --date 2025-01-02     # 指定日期
+    python archive.py --backfill            # ticks 表中仍保留、尚未封存的所有日期 (不含今天)
+"""
+import os
+import sys
+import json
+import shutil
+import argparse
+import threading
+import numpy as np
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from utils import taipei_day_start_ts, TAIPEI_TZ
+
+COLUMN_DTYPES = {"ts_sec": np.int64, "price": np.float64, "vol": None, "best_bid": np.float64, "best_ask": np.float64}
+
+
+class TickArchive:
+    """每日 ticks 欄位檔的讀寫；讀取回傳 np.memmap 切片 (零複製)，開啟過的日期保留在小型 LRU 中"""
+
+    def __init__(self, root_dir, max_open_days=8):
+        self.root_dir = root_dir
+        self.max_open_days = max_open_days
+        self._open_days = OrderedDict()  # date_str -> (index, {column: memmap})
+        self._lock = threading.Lock()
+        self.hits = self.misses = 0
+        os.makedirs(root_dir, exist_ok=True)
+
+    def _day_dir(self, date_str):
+        return os.path.join(self.root_dir, date_str)
+
+    def has_day(self, date_str):
+        return os.path.exists(os.path.join(self._day_dir(date_str), "index.json"))
+
+    def row_count(self, date_str):
+        """該日封存的 ticks 筆數；未封存時回傳 None"""
+        try:
+            with open(os.path.join(self._day_dir(date_str), "index.json"), encoding='utf-8') as f:
+                index = json.load(f)
+        except (OSError, ValueError):
+            return None
+        return max((stop for _, stop in index.values()), default=0)
+
+    def days(self):
+        return sorted(name for name in os.listdir(self.root_dir) if len(name) == 10 and self.has_day(name))
+
+    def write_day(self, date_str, ticks_df):
+        """寫入一個交易日所有股票的 ticks (需依 symbol、ts_sec 排序)，先寫暫存資料夾再整個改名，讀取端不會看到半成品"""
+        day_dir = self._day_dir(date_str)
+        tmp_dir = f"{day_dir}.{threading.get_ident()}.tmp"
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        os.makedirs(tmp_dir)
+
+        index = {}
+        if not ticks_df.empty:
+            symbols = ticks_df['symbol'].to_numpy()
+            # 依排序後的代號找出每檔的起訖位置
+            change = np.flatnonzero(symbols[1:] != symbols[:-1]) + 1
+            for start, stop in zip(np.r_[0, change].tolist(), np.r_[change, len(symbols)].tolist()):
+                index[str(symbols[start])] = [start, stop]
+
+        for column, dtype in COLUMN_DTYPES.items():
+            values = ticks_df[column].to_numpy() if column in ticks_df else np.array([])
+            if dtype is None:  # vol 有空值時 read_sql 會給 float，保留原型別讓輸出與 DB 查詢一致
+                dtype = np.int64 if values.dtype.kind in 'iu' else np.float64
+            np.save(os.path.join(tmp_dir, f"{column}.npy"), np.ascontiguousarray(values, dtype=dtype))
+        with open(os.path.join(tmp_dir, "index.json"), 'w', encoding='utf-8') as f:
+            json.dump(index, f)
+
+        with self._lock:
+            self._open_days.pop(date_str, None)
+        shutil.rmtree(day_dir, ignore_errors=True)
+        os.replace(tmp_dir, day_dir)
+        return len(index)
+
+    def read(self, symbol, date_str):
+        """回傳 {欄位: memmap 切片}；該日未封存時回傳 None，已封存但當日無此股票時回傳長度 0 的欄位"""
+        day = self._open_day(date_str)
+        if day is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        index, columns = day
+        start, stop = index.get(symbol, (0, 0))
+        return {column: values[start:stop] for column, values in columns.items()}
+
+    def _open_day(self, date_str):
+        with self._lock:
+            day = self._open_days.get(date_str)
+            if day is not None:
+                self._open_days.move_to_end(date_str)
+                return day
+        if not self.has_day(date_str): return None
+
+        day_dir = self._day_dir(date_str)
+        try:
+            with open(os.path.join(day_dir, "index.json"), encoding='utf-8') as f:
+                index = json.load(f)
+            columns = {column: np.load(os.path.join(day_dir, f"{column}.npy"), mmap_mode='r')
+                       for column in COLUMN_DTYPES}
+        except (OSError, ValueError) as e:
+            print(f"讀取 ticks 封存檔失敗 ({date_str}): {e}")
+            return None
+
+        with self._lock:
+            self._open_days[date_str] = (index, columns)
+            while len(self._open_days) > self.max_open_days:
+                self._open_days.popitem(last=False)
+        return index, columns
+
+    def prune(self, days_to_keep):
+        """刪除超過保留天數的封存日期"""
+        cutoff_date_str = (datetime.now() - timedelta(days=days_to_keep)).strftime('%Y-%m-%d')
+        removed = 0
+        for date_str in self.days():
+            if date_str < cutoff_date_str:
+                with self._lock:
+                    self._open_days.pop(date_str, None)
+                shutil.rmtree(self._day_dir(date_str), ignore_errors=True)
+                removed += 1
+        if removed:
+            print(f"已刪除 {removed} 個 {cutoff_date_str} 之前的 ticks 封存日期。")
+
+    def stats(self):
+        return {"days": len(self.days()), "open_days": len(self._open_days), "hits": self.hits, "misses": self.misses}
+
+
+def archive_day(db, archive, date_str):
+    """讀取指定日期所有股票的 ticks 寫入封存，回傳股票檔數"""
+    start_ts = taipei_day_start_ts(datetime.strptime(date_str, '%Y-%m-%d').date())
+    ticks_df = db.read_ticks(None, start_ts, start_ts + 86399)
+    n_symbols = archive.write_day(date_str, ticks_df)
+    print(f"{date_str} ticks 封存完成，共 {n_symbols} 檔 {len(ticks_df)} 筆。")
+    return n_symbols
+
+
+def backfill_archive(db, archive):
+    """封存 ticks 表中仍保留、但尚未封存的已收盤日期 (今天仍在交易，不封存)
+
+    已封存的日期若筆數與 DB 不同 (例如封存後才補進收盤成交)，重新封存。
+    """
+    today = datetime.now(TAIPEI_TZ).strftime('%Y-%m-%d')
+    for date_str, n_rows in sorted(db.tick_counts_by_day().items()):
+        if date_str >= today: continue
+        archived = archive.row_count(date_str)
+        if archived == n_rows: continue
+        if archived is not None:
+            print(f"{date_str} 封存筆數 {archived} 與 DB {n_rows} 不同，重新封存。")
+        archive_day(db, archive, date_str)
+
+
+if __name__ == "__main__":
+    from dotenv import load_dotenv
+    from database import create_database
+
+    parser = argparse.ArgumentParser(description="將已收盤日期的 ticks 封存為欄位檔")
+    group = parser.add_mutually_exclusive_group(required=True)
+    group.add_argument("--date", help="要封存的交易日 (YYYY-MM-DD)")
+    group.add_argument("--backfill", action="store_true", help="封存 ticks 表中所有尚未封存的日期")
+    args = parser.parse_args()
+
+    load_dotenv()
+    db_url = os.environ.get('DATABASE_URL')
+    archive_dir = os.environ.get('ARCHIVE_DIR')
+    if not db_url or not archive_dir:
+        print("錯誤：DATABASE_URL 或 ARCHIVE_DIR 環境變數未設定。")
+        sys.exit(1)
+
+    db = create_database(db_url)
+    archive = TickArchive(archive_dir)
+    if args.backfill:
+        backfill_archive(db, archive)
+    else:
+        archive_day(db, archive, args.date)
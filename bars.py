@@ -0,0 +1,260 @@
+import numpy as np
+import pandas as pd
+from utils import to_float
+
+BAR_SECONDS = 300
+TAIPEI_OFFSET_SECONDS = 8 * 3600  # 台灣無日光節約時間，固定 UTC+8
+
+
+def format_hhmm(ts_sec):
+    """epoch 秒數轉台北時間 HH:MM (以算術取代 datetime/strftime，供熱路徑使用)"""
+    minutes = (ts_sec + TAIPEI_OFFSET_SECONDS) % 86400 // 60
+    return f"{minutes // 60:02d}:{minutes % 60:02d}"
+
+
+def taipei_day_of(ts_sec):
+    """epoch 秒數對應的台北時間日序號"""
+    return (ts_sec + TAIPEI_OFFSET_SECONDS) // 86400
+
+
+def estimate_direction(price, best_bid, best_ask):
+    """依最佳買賣價推估內外盤: 'B' 外盤、'S' 內盤、'N' 無法判斷"""
+    if best_ask and price >= best_ask: return 'B'
+    if best_bid and price <= best_bid: return 'S'
+    return 'N'
+
+
+def aggregate_5m(ts_sec, price, vol, best_bid, best_ask):
+    """以 NumPy 向量化方式將單一股票的 ticks 聚合為連續的 5 分 K 欄位 (含無成交的空白區間)
+
+    回傳 dict，各欄位長度皆為時間軸上的 K 棒數；無成交區間的 OHLC/VWAP 為 NaN。
+    輸入需依 ts_sec 排序 (與 DB 查詢的 ORDER BY 一致)。
+    """
+    bars, _ = aggregate_5m_grouped(np.zeros(len(ts_sec), dtype=np.int64), 1, ts_sec, price, vol, best_bid, best_ask)
+    return bars
+
+
+def aggregate_5m_grouped(group, n_groups, ts_sec, price, vol, best_bid, best_ask):
+    """多檔股票一次完成 5 分 K 聚合
+
+    group 為每筆 tick 所屬股票的編號 (0 ~ n_groups-1)，同一檔股票的 ticks 需依 ts_sec 排序。
+    回傳 (bars, offsets)：bars 的各欄位為所有股票時間軸依序串接，
+    第 g 檔股票對應 offsets[g]:offsets[g + 1]，沒有任何 tick 的股票長度為 0。
+    """
+    group = np.asarray(group, dtype=np.int64)
+    ts_sec = np.asarray(ts_sec, dtype=np.int64)
+    price = np.asarray(price, dtype=float)
+    vol = np.nan_to_num(np.asarray(vol, dtype=float))
+    best_bid = np.asarray(best_bid, dtype=float)
+    best_ask = np.asarray(best_ask, dtype=float)
+
+    # 每檔股票各自的時間軸：從第一筆成交所在的K棒到最後一筆
+    bar_starts_per_tick = ts_sec - ts_sec % BAR_SECONDS
+    first_start = np.full(n_groups, np.iinfo(np.int64).max)
+    last_start = np.full(n_groups, np.iinfo(np.int64).min)
+    np.minimum.at(first_start, group, bar_starts_per_tick)
+    np.maximum.at(last_start, group, bar_starts_per_tick)
+    has_ticks = np.bincount(group, minlength=n_groups) > 0
+    n_bars_per_group = np.where(has_ticks, (last_start - first_start) // BAR_SECONDS + 1, 0)
+    offsets = np.r_[0, np.cumsum(n_bars_per_group)]
+    n_bars = int(offsets[-1])
+    bar_idx = offsets[group] + (bar_starts_per_tick - first_start[group]) // BAR_SECONDS
+    group_of_bar = np.repeat(np.arange(n_groups), n_bars_per_group)
+    start_ts = first_start[group_of_bar] + (np.arange(n_bars) - offsets[group_of_bar]) * BAR_SECONDS
+
+    # OHLC：忽略無價格的 tick，與 resample().ohlc() 相同
+    open_ = np.full(n_bars, np.nan)
+    high, low, close = open_.copy(), open_.copy(), open_.copy()
+    has_price = ~np.isnan(price)
+    if has_price.any():
+        order = np.argsort(bar_idx[has_price], kind='stable')
+        p, idx = price[has_price][order], bar_idx[has_price][order]
+        starts = np.flatnonzero(np.r_[True, idx[1:] != idx[:-1]])
+        ends = np.r_[starts[1:], len(idx)] - 1
+        open_[idx[starts]] = p[starts]
+        close[idx[starts]] = p[ends]
+        high[idx[starts]] = np.maximum.reduceat(p, starts)
+        low[idx[starts]] = np.minimum.reduceat(p, starts)
+
+    # 成交金額沿用 pandas 的分組加總 (補償求和)，使 VWAP 與原本 resample 的結果逐位相同
+    value = pd.Series(price * vol).groupby(bar_idx).sum()
+    value_sum = np.zeros(n_bars)
+    value_sum[value.index.to_numpy()] = value.to_numpy()
+    vol_sum = np.bincount(bar_idx, weights=vol, minlength=n_bars)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        vwap = value_sum / vol_sum
+
+    # 內外盤推估：等同逐筆 estimate_direction (0 或 NaN 的買賣價視為無報價)
+    with np.errstate(invalid='ignore'):
+        is_buy = (best_ask != 0) & (price >= best_ask)
+        is_sell = ~is_buy & (best_bid != 0) & (price <= best_bid)
+    buy_vol = np.bincount(bar_idx[is_buy], weights=vol[is_buy], minlength=n_bars)
+    sell_vol = np.bincount(bar_idx[is_sell], weights=vol[is_sell], minlength=n_bars)
+
+    bars = {
+        "start_ts": start_ts,
+        "open": open_, "high": high, "low": low, "close": close,
+        "volume": vol_sum, "vwap": vwap,
+        "buy_vol": buy_vol.astype(np.int64), "sell_vol": sell_vol.astype(np.int64),
+    }
+    return bars, offsets
+
+
+def slice_bars(bars, start, stop):
+    """取出 aggregate_5m_grouped 結果中某一檔股票的欄位 (僅為 view，不複製)"""
+    return {name: column[start:stop] for name, column in bars.items()}
+
+
+def expand_bar_rows(rows):
+    """將 bars_5m 的資料列 (依 bar_ts 排序，只含有成交的K棒) 展開成與 aggregate_5m 相同的欄位格式"""
+    bar_ts = np.array([row.bar_ts for row in rows], dtype=np.int64)
+    first_start = bar_ts[0]
+    n_bars = int((bar_ts[-1] - first_start) // BAR_SECONDS) + 1
+    idx = (bar_ts - first_start) // BAR_SECONDS
+
+    def column(name, fill, dtype=float):
+        out = np.full(n_bars, fill, dtype=dtype)
+        out[idx] = np.array([getattr(row, name) for row in rows], dtype=float)
+        return out
+
+    return {
+        "start_ts": first_start + np.arange(n_bars, dtype=np.int64) * BAR_SECONDS,
+        "open": column("open", np.nan), "high": column("high", np.nan),
+        "low": column("low", np.nan), "close": column("close", np.nan),
+        "volume": column("volume", 0.0), "vwap": column("vwap", np.nan),
+        "buy_vol": column("buy_vol", 0, np.int64), "sell_vol": column("sell_vol", 0, np.int64),
+    }
+
+
+class Bar:
+    """單根 5 分 K 棒 (含成交量、成交金額與推估買賣量)"""
+    __slots__ = ('start_ts', 'open', 'high', 'low', 'close', 'volume', 'value', 'buy_vol', 'sell_vol')
+
+    def __init__(self, start_ts, price):
+        self.start_ts = start_ts
+        self.open = self.high = self.low = self.close = price
+        self.volume = 0
+        self.value = 0.0
+        self.buy_vol = 0
+        self.sell_vol = 0
+
+    @property
+    def ts_str(self):
+        return format_hhmm(self.start_ts)
+
+    @property
+    def vwap(self):
+        return self.value / self.volume if self.volume else None
+
+
+class BarBuilder:
+    """單一股票的串流 5 分 K 建構器，逐筆 tick 更新當日 K 棒"""
+
+    def __init__(self, symbol):
+        self.symbol = symbol
+        self.day = None         # 台北時間的日序號 (epoch 天數)
+        self.bars = []          # 依時間排序，最後一根為進行中的 K 棒
+        self.last_ts = None
+        self.last_tick = None   # (price, vol, best_bid, best_ask, direction)
+        self.last_price = None
+        self.total_vol = 0
+
+    def _reset(self, day):
+        self.day = day
+        self.bars = []
+        self.last_ts = None
+        self.last_tick = None
+        self.last_price = None
+        self.total_vol = 0
+
+    def roll_to(self, day):
+        """換日時清空前一交易日的K棒 (day 為台北時間的日序號)"""
+        if self.day is None or day > self.day:
+            self._reset(day)
+
+    def add_tick(self, ts_sec, price, vol, best_bid=None, best_ask=None):
+        """加入一筆 tick，回傳 K 棒是否有變動"""
+        if price is None: return False
+        day = taipei_day_of(ts_sec)
+        if day != self.day:
+            if self.day is not None and day < self.day: return False
+            self._reset(day)
+
+        vol = vol or 0
+        direction = estimate_direction(price, best_bid, best_ask)
+
+        if self.last_ts is not None and ts_sec <= self.last_ts:
+            if ts_sec < self.last_ts: return False  # 亂序的舊資料直接忽略
+            # MIS 重複回傳同一筆成交：與 DB 的 upsert 相同，以新值取代舊值
+            tick = (price, vol, best_bid, best_ask, direction)
+            if tick == self.last_tick: return False
+            self._remove_last_contribution()
+        bar_start = ts_sec - ts_sec % BAR_SECONDS
+        if not self.bars or self.bars[-1].start_ts != bar_start:
+            self.bars.append(Bar(bar_start, price))
+        bar = self.bars[-1]
+
+        bar.high = max(bar.high, price)
+        bar.low = min(bar.low, price)
+        bar.close = price
+        bar.volume += vol
+        bar.value += price * vol
+        if direction == 'B': bar.buy_vol += vol
+        elif direction == 'S': bar.sell_vol += vol
+
+        self.last_ts = ts_sec
+        self.last_tick = (price, vol, best_bid, best_ask, direction)
+        self.last_price = price
+        self.total_vol += vol
+        return True
+
+    def _remove_last_contribution(self):
+        price, vol, _, _, direction = self.last_tick
+        bar = self.bars[-1]
+        bar.volume -= vol
+        bar.value -= price * vol
+        if direction == 'B': bar.buy_vol -= vol
+        elif direction == 'S': bar.sell_vol -= vol
+        self.total_vol -= vol
+
+    @property
+    def current_bar(self):
+        return self.bars[-1] if self.bars else None
+
+    @property
+    def completed_bars(self):
+        return self.bars[:-1]
+
+
+class BarAggregator:
+    """管理所有追蹤股票的 BarBuilder，並記錄哪些股票已從 DB 暖機"""
+
+    def __init__(self):
+        self.builders = {}
+        self.warmed = set()
+
+    def get(self, symbol):
+        builder = self.builders.get(symbol)
+        if builder is None:
+            builder = self.builders[symbol] = BarBuilder(symbol)
+        return builder
+
+    def is_warm(self, symbol):
+        return symbol in self.warmed
+
+    def warm(self, symbol, rows):
+        """以 DB 中當日已存在的 ticks (依 ts_sec 排序) 建立初始 K 棒"""
+        builder = self.get(symbol)
+        for row in rows:
+            # DECIMAL 欄位會以 Decimal 回傳，統一轉成 float 以便與即時 tick 一起計算
+            builder.add_tick(int(row.ts_sec), to_float(row.price), int(row.vol or 0),
+                             to_float(row.best_bid), to_float(row.best_ask))
+        self.warmed.add(symbol)
+
+    def forget(self, symbol):
+        """不再追蹤某檔股票 (例如分片移交給其他實例)；之後再次追蹤時會重新從 DB 暖機"""
+        self.builders.pop(symbol, None)
+        self.warmed.discard(symbol)
+
+    def add_tick(self, symbol, ts_sec, price, vol, best_bid=None, best_ask=None):
+        return self.get(symbol).add_tick(ts_sec, price, vol, best_bid, best_ask)
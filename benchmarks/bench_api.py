@@ -0,0 +1,102 @@
+"""/summary 併發吞吐量基準測試
+
+以 N 個併發客戶端 (各自使用 keep-alive 連線) 對一或多個已啟動的服務送出請求，
+輸出每秒請求數與延遲百分位數。比較新舊版本時，將舊版部署在另一個 port 後一起傳入：
+
+    python benchmarks/bench_api.py --url http://127.0.0.1:8000 --url http://127.0.0.1:8001 \
+        --clients 200 --requests 20 --symbols 2330,2317,0050
+"""
+import time
+import json
+import argparse
+import threading
+import http.client
+from urllib.parse import urlsplit, urlencode
+
+
+def percentile(sorted_values, pct):
+    if not sorted_values: return float('nan')
+    k = min(len(sorted_values) - 1, int(round(pct / 100 * (len(sorted_values) - 1))))
+    return sorted_values[k]
+
+
+def run_client(base, path_list, n_requests, latencies, errors, start_barrier):
+    parts = urlsplit(base)
+    conn = http.client.HTTPConnection(parts.hostname, parts.port or 80, timeout=60)
+    start_barrier.wait()
+    for i in range(n_requests):
+        path = path_list[i % len(path_list)]
+        started = time.perf_counter()
+        try:
+            conn.request("GET", path)
+            res = conn.getresponse()
+            res.read()
+            if res.status != 200:
+                errors.append(res.status)
+                continue
+        except (OSError, http.client.HTTPException) as e:
+            errors.append(str(e))
+            conn.close()
+            conn = http.client.HTTPConnection(parts.hostname, parts.port or 80, timeout=60)
+            continue
+        latencies.append(time.perf_counter() - started)
+    conn.close()
+
+
+def bench(base, endpoint, symbols, date, clients, n_requests):
+    if endpoint == "historical":
+        paths = [f"/summary/historical?{urlencode({'symbol': s, 'date': date})}" for s in symbols]
+    elif endpoint == "batch":
+        query = {'symbols': ','.join(symbols)}
+        if date: query['date'] = date
+        paths = [f"/summary/batch?{urlencode(query)}"]
+    else:
+        paths = [f"/summary?{urlencode({'symbol': s})}" for s in symbols]
+
+    latencies, errors = [], []
+    barrier = threading.Barrier(clients + 1)
+    threads = [threading.Thread(target=run_client, args=(base, paths[i % len(paths):] + paths[:i % len(paths)],
+                                                         n_requests, latencies, errors, barrier))
+               for i in range(clients)]
+    for t in threads: t.start()
+    barrier.wait()
+    started = time.perf_counter()
+    for t in threads: t.join()
+    elapsed = time.perf_counter() - started
+
+    latencies.sort()
+    return {
+        "url": base, "endpoint": endpoint, "clients": clients,
+        "requests": len(latencies), "errors": len(errors),
+        "throughput_rps": round(len(latencies) / elapsed, 1),
+        "p50_ms": round(percentile(latencies, 50) * 1000, 2),
+        "p95_ms": round(percentile(latencies, 95) * 1000, 2),
+        "p99_ms": round(percentile(latencies, 99) * 1000, 2),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--url", action="append", required=True, help="服務位址，可重複指定以比較多個版本")
+    parser.add_argument("--endpoint", choices=["summary", "historical", "batch"], default="summary")
+    parser.add_argument("--symbols", default="2330")
+    parser.add_argument("--date", help="endpoint=historical / batch 時查詢的日期 (YYYY-MM-DD)")
+    parser.add_argument("--clients", type=int, default=200)
+    parser.add_argument("--requests", type=int, default=20, help="每個客戶端送出的請求數")
+    parser.add_argument("--json", action="store_true", help="以 JSON 格式輸出結果")
+    args = parser.parse_args()
+    if args.endpoint == "historical" and not args.date:
+        parser.error("--endpoint historical 需要 --date")
+
+    symbols = [s.strip() for s in args.symbols.split(",") if s.strip()]
+    results = [bench(url, args.endpoint, symbols, args.date, args.clients, args.requests) for url in args.url]
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+    print(f"{'url':<28} {'rps':>8} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'errors':>7}")
+    for r in results:
+        print(f"{r['url']:<28} {r['throughput_rps']:>8} {r['p50_ms']:>8} {r['p95_ms']:>8} {r['p99_ms']:>8} {r['errors']:>7}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,182 @@
+"""msgArray 解析與 ticks 寫入的配置量 / 耗時基準測試
+
+比較舊版 (每則訊息都建立 meta / tick dict、以 text() 具名參數 executemany) 與
+parsing.parse_msg_array (先比對原始字串、Tick NamedTuple、DBAPI 位置參數 executemany)：
+
+- 每輪解析耗時 (p50)
+- 每輪解析的 Python 記憶體峰值 (tracemalloc) 與解析結果保留的記憶體區塊數 (sys.getallocatedblocks)
+- 暫存 SQLite 上 ticks upsert 的每秒筆數
+
+    python benchmarks/bench_parse.py --symbols 1000 --cycles 60 --poll-seconds 5
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import tempfile
+import tracemalloc
+from datetime import date
+
+# --- GPS 導航：確保 Python 能找到上層資料夾的模組 ---
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT not in sys.path:
+    sys.path.append(ROOT)
+
+from sqlalchemy import text
+from synthetic import MisFeed, make_symbols, SESSION_OPEN
+from bench_api import percentile
+from utils import to_float, first_px, taipei_day_start_ts
+from parsing import parse_msg_array
+from writer import ChangeFilter
+from database import create_database
+
+LEGACY_UPSERT_TICKS_SQL = """
+    INSERT INTO ticks(symbol, ts_sec, price, vol, best_bid, best_ask)
+    VALUES (:symbol, :ts_sec, :price, :vol, :best_bid, :best_ask)
+    ON CONFLICT(symbol, ts_sec) DO UPDATE SET
+        price = excluded.price, vol = excluded.vol, best_bid = excluded.best_bid, best_ask = excluded.best_ask;
+"""
+
+
+class LegacyChangeFilter:
+    """舊版 ChangeFilter：以解析後的 meta dict 與 (ts_sec, price, vol, cum_vol) 比對"""
+
+    def __init__(self):
+        self._last_meta, self._last_tick = {}, {}
+
+    def meta_changed(self, record):
+        if self._last_meta.get(record["symbol"]) == record: return False
+        self._last_meta[record["symbol"]] = record
+        return True
+
+    def tick_changed(self, record, cum_vol=None):
+        key = (record["ts_sec"], record["price"], record["vol"], cum_vol)
+        if self._last_tick.get(record["symbol"]) == key: return False
+        self._last_tick[record["symbol"]] = key
+        return True
+
+
+def legacy_parse(msg_array, today_date, change_filter):
+    """改版前 Poller.process_messages 的解析段落，保留作為比較基準"""
+    ticks_to_insert, meta_to_upsert, all_meta = [], [], []
+    for msg in msg_array:
+        code = (msg.get("c") or "").strip()
+        if not code: continue
+        meta = {
+            "symbol": code, "trade_date": today_date,
+            "day_open": to_float(msg.get("o")), "day_high": to_float(msg.get("h")),
+            "day_low": to_float(msg.get("l")), "prev_close": to_float(msg.get("y")),
+            "limit_up": to_float(msg.get("u")), "limit_down": to_float(msg.get("w")),
+            "short_name": (msg.get("n") or "").strip(), "full_name": (msg.get("nf") or "").strip(),
+            "exchange": (msg.get("ex") or "").strip(),
+        }
+        all_meta.append(meta)
+        if change_filter.meta_changed(meta):
+            meta_to_upsert.append(meta)
+        price, tlong = to_float(msg.get("z")), msg.get("tlong")
+        if price is not None and tlong:
+            tick = {
+                "symbol": code, "ts_sec": int(int(tlong) / 1000), "price": price,
+                "vol": int(to_float(msg.get("tv")) or 0),
+                "best_bid": first_px(msg.get("b")), "best_ask": first_px(msg.get("a")),
+            }
+            if change_filter.tick_changed(tick, to_float(msg.get("v"))):
+                ticks_to_insert.append(tick)
+    return all_meta, meta_to_upsert, ticks_to_insert
+
+
+def make_cycles(n_symbols, n_cycles, poll_seconds):
+    ex_ch = make_symbols(n_symbols)
+    feed = MisFeed(ex_ch, date.today(), seed=n_symbols)
+    start = taipei_day_start_ts(date.today()) + SESSION_OPEN
+    # 從 10:00 開始取樣，避開開盤時幾乎每輪都有成交的時段
+    return [feed.snapshot(ex_ch, start + 3600 + i * poll_seconds) for i in range(n_cycles)]
+
+
+def measure(parse_fn, make_filter, cycles, today):
+    """回傳 (各輪耗時, 各輪記憶體峰值, 各輪結果保留的區塊數, 最後一輪的 tick 列表)"""
+    timings, change_filter = [], make_filter()
+    results = []
+    for msgs in cycles:
+        started = time.perf_counter()
+        results.append(parse_fn(msgs, today, change_filter))
+        timings.append(time.perf_counter() - started)
+
+    peaks, blocks, change_filter = [], [], make_filter()
+    tracemalloc.start()
+    for msgs in cycles:
+        tracemalloc.reset_peak()
+        base_bytes = tracemalloc.get_traced_memory()[0]
+        base_blocks = sys.getallocatedblocks()
+        result = parse_fn(msgs, today, change_filter)
+        blocks.append(sys.getallocatedblocks() - base_blocks)
+        peaks.append(tracemalloc.get_traced_memory()[1] - base_bytes)
+        del result
+    tracemalloc.stop()
+    return timings, peaks, blocks, results
+
+
+def bench_upsert(ticks_per_cycle, legacy):
+    """以暫存 SQLite 重放每輪的新 ticks，回傳每秒寫入筆數"""
+    db = create_database(f"sqlite:///{os.path.join(tempfile.mkdtemp(prefix='bench-parse-'), 'ticks.db')}")
+    db.ensure_schema()
+    n_rows = sum(len(ticks) for ticks in ticks_per_cycle)
+    started = time.perf_counter()
+    for ticks in ticks_per_cycle:
+        if not ticks: continue
+        if legacy:
+            with db.get_session() as session:
+                session.execute(text(LEGACY_UPSERT_TICKS_SQL), ticks)
+                session.commit()
+        else:
+            db.bulk_upsert_ticks(ticks)
+    elapsed = time.perf_counter() - started
+    db.engine.dispose()
+    return round(n_rows / elapsed, 1) if elapsed else None
+
+
+def summarize(name, timings, peaks, blocks, n_rows_per_s, n_ticks):
+    timings, peaks = sorted(timings), sorted(peaks)
+    return {"version": name, "parse_p50_ms": round(percentile(timings, 50) * 1000, 3),
+            "parse_p95_ms": round(percentile(timings, 95) * 1000, 3),
+            "peak_kb_per_cycle_p50": round(percentile(peaks, 50) / 1024, 1),
+            "retained_blocks_per_cycle_avg": round(sum(blocks) / len(blocks), 1),
+            "ticks": n_ticks, "upsert_rows_per_s": n_rows_per_s}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--symbols", type=int, default=1000)
+    parser.add_argument("--cycles", type=int, default=60)
+    parser.add_argument("--poll-seconds", type=int, default=5)
+    parser.add_argument("--json", action="store_true", help="以 JSON 格式輸出結果")
+    args = parser.parse_args()
+
+    cycles = make_cycles(args.symbols, args.cycles, args.poll_seconds)
+    today = date.today().strftime('%Y-%m-%d')
+
+    legacy_t, legacy_p, legacy_b, legacy_res = measure(legacy_parse, LegacyChangeFilter, cycles, today)
+    lean_t, lean_p, lean_b, lean_res = measure(lambda m, d, f: parse_msg_array(m, d, f), ChangeFilter, cycles, today)
+    legacy_ticks = [res[2] for res in legacy_res]
+    lean_ticks = [res[2] for res in lean_res]
+    # 兩種解析的結果必須相同
+    assert [[tuple(t.values()) for t in ticks] for ticks in legacy_ticks] == [[tuple(t) for t in ticks] for ticks in lean_ticks]
+
+    n_ticks = sum(len(t) for t in lean_ticks)
+    results = [
+        summarize("legacy", legacy_t, legacy_p, legacy_b, bench_upsert(legacy_ticks, legacy=True), n_ticks),
+        summarize("lean", lean_t, lean_p, lean_b, bench_upsert(lean_ticks, legacy=False), n_ticks),
+    ]
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+    print(f"{args.symbols} 檔 × {args.cycles} 輪 (每 {args.poll_seconds} 秒)，共 {n_ticks} 筆新成交")
+    print(f"{'version':<8} {'p50 ms':>8} {'p95 ms':>8} {'peak KB':>9} {'blocks':>8} {'upsert rows/s':>14}")
+    for r in results:
+        print(f"{r['version']:<8} {r['parse_p50_ms']:>8} {r['parse_p95_ms']:>8} {r['peak_kb_per_cycle_p50']:>9} "
+              f"{r['retained_blocks_per_cycle_avg']:>8} {r['upsert_rows_per_s']:>14}")
+
+
+if __name__ == "__main__":
+    main()
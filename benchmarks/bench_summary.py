@@ -0,0 +1,118 @@
+"""SummaryService._process_summary_data 微基準測試
+
+比較舊版 (DataFrame.apply + 逐根 .loc) 與向量化版本在 1k / 10k / 100k ticks 下的耗時，
+並確認兩者輸出逐字相同。
+
+    python benchmarks/bench_summary.py [--repeat 5]
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import numpy as np
+import pandas as pd
+
+# --- GPS 導航：確保 Python 能找到上層資料夾的模組 ---
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT not in sys.path:
+    sys.path.append(ROOT)
+
+from services import SummaryService
+
+
+class FakeMeta:
+    def __init__(self, mapping):
+        self._mapping = mapping
+
+
+def make_ticks(n_ticks, seed=0):
+    """產生一個交易日 (09:00~13:30) 的隨機 ticks，買賣價有時缺漏"""
+    rng = np.random.default_rng(seed)
+    session_start = 1735779600  # 2025-01-02 09:00 台北時間
+    ts = np.sort(session_start + rng.integers(0, 16200, n_ticks))
+    price = np.round(100 + rng.normal(0, 0.05, n_ticks).cumsum(), 2)
+    spread = np.where(rng.random(n_ticks) < 0.5, 0.0, 0.05)
+    bid = np.where(rng.random(n_ticks) < 0.05, np.nan, price - spread)
+    ask = np.where(rng.random(n_ticks) < 0.05, np.nan, price + spread[::-1])
+    return pd.DataFrame({
+        "ts_sec": ts, "price": price, "vol": rng.integers(0, 30, n_ticks),
+        "best_bid": bid, "best_ask": ask,
+    })
+
+
+def legacy_process_summary_data(service, ticks_df, meta_res):
+    """向量化之前的實作，保留作為正確性與效能比較基準"""
+    meta_data = dict(meta_res._mapping) if meta_res else {}
+    response = service._empty_response(meta_data)
+    if ticks_df.empty: return response
+
+    ticks_df['datetime'] = pd.to_datetime(ticks_df['ts_sec'], unit='s', utc=True).dt.tz_convert('Asia/Taipei')
+    ticks_df.set_index('datetime', inplace=True)
+    response["最新成交價"] = ticks_df['price'].iloc[-1]
+    response["當日成交量"] = int(ticks_df['vol'].sum())
+
+    start_time = ticks_df.index.min().floor('5min')
+    end_time = ticks_df.index.max().floor('5min')
+    full_time_index = pd.date_range(start=start_time, end=end_time, freq='5min')
+    ohlc_5m = ticks_df['price'].resample('5min').ohlc().reindex(full_time_index)
+    ticks_df['value'] = ticks_df['price'] * ticks_df['vol']
+    vol_5m = ticks_df['vol'].resample('5min').sum()
+    vwap_5m = (ticks_df['value'].resample('5min').sum() / vol_5m).reindex(full_time_index)
+
+    def estimate_direction(row):
+        if row['best_ask'] and row['price'] >= row['best_ask']: return 'B'
+        if row['best_bid'] and row['price'] <= row['best_bid']: return 'S'
+        return 'N'
+
+    ticks_df['direction'] = ticks_df.apply(estimate_direction, axis=1)
+    buy_vol = ticks_df[ticks_df['direction'] == 'B']['vol'].resample('5min').sum().reindex(full_time_index, fill_value=0)
+    sell_vol = ticks_df[ticks_df['direction'] == 'S']['vol'].resample('5min').sum().reindex(full_time_index, fill_value=0)
+
+    last_close = meta_data.get("day_open")
+    for idx in full_time_index:
+        ts_str = idx.strftime('%H:%M')
+        row = ohlc_5m.loc[idx]
+        response["推估五分買賣量"].append(f"{ts_str},B:{int(buy_vol.loc[idx])},S:{int(sell_vol.loc[idx])}")
+        if pd.isna(row['open']):
+            o = h = l = last_close
+            response["即時5分"].append(f"{ts_str},O:{o},H:{h},L:{l},C:-")
+        else:
+            o, h, l, c = row['open'], row['high'], row['low'], row['close']
+            response["即時5分"].append(f"{ts_str},O:{o},H:{h},L:{l},C:{c}")
+            last_close = c
+        vwap_val = vwap_5m.get(idx)
+        if pd.notna(vwap_val):
+            response["均價"].append(f"{ts_str},{vwap_val:.2f}")
+    return response
+
+
+def best_of(fn, repeat):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn()
+        timings.append(time.perf_counter() - start)
+    return min(timings), result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--sizes", default="1000,10000,100000")
+    args = parser.parse_args()
+
+    service = SummaryService(db=None)
+    meta = FakeMeta({"symbol": "2330", "trade_date": "2025-01-02", "short_name": "台積電", "day_open": 100.0})
+    print(f"{'ticks':>8} {'legacy ms':>12} {'vectorized ms':>14} {'speedup':>8}")
+    for n_ticks in [int(n) for n in args.sizes.split(",")]:
+        ticks = make_ticks(n_ticks)
+        legacy_s, legacy_res = best_of(lambda: legacy_process_summary_data(service, ticks.copy(), meta), args.repeat)
+        new_s, new_res = best_of(lambda: service._process_summary_data(ticks.copy(), meta), args.repeat)
+        if json.dumps(legacy_res, default=str) != json.dumps(new_res, default=str):
+            raise SystemExit(f"輸出不一致 (n={n_ticks})")
+        print(f"{n_ticks:>8} {legacy_s * 1000:>12.2f} {new_s * 1000:>14.2f} {legacy_s / new_s:>7.1f}x")
+
+
+if __name__ == "__main__":
+    main()
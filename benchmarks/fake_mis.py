@@ -0,0 +1,96 @@
+"""本機模擬 MIS 伺服器 (getStockInfo.jsp)，供輪詢器基準測試與離線開發使用
+
+    python benchmarks/fake_mis.py --port 9001 --speed 60
+    # 再以 Poller.MIS_URL_BASE = "http://127.0.0.1:9001/stock/api/getStockInfo.jsp" 指向此伺服器
+
+回應內容由 synthetic.MisFeed 產生；模擬時間預設從 09:00 開始，依 --speed 倍速前進。
+"""
+import json
+import time
+import argparse
+import threading
+from datetime import datetime
+from urllib.parse import urlsplit, parse_qs
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from synthetic import MisFeed, SESSION_OPEN
+from utils import taipei_day_start_ts, TAIPEI_TZ
+
+MIS_PATH = "/stock/api/getStockInfo.jsp"
+
+
+class FakeMisServer:
+    """feed 為 MisFeed；clock 回傳模擬時間 (epoch 秒)，未指定時依 speed 倍速從當日 09:00 起算"""
+
+    def __init__(self, feed, clock=None, speed=1.0, host="127.0.0.1", port=0, latency_ms=0.0):
+        started, session_open = time.time(), taipei_day_start_ts() + SESSION_OPEN
+        self.clock = clock or (lambda: session_open + (time.time() - started) * speed)
+        self.requests = 0
+        self._lock = threading.Lock()
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+            disable_nagle_algorithm = True  # 標頭與內容分兩次寫出，避免與 delayed ACK 疊加出 40ms 延遲
+
+            def do_GET(self):
+                parts = urlsplit(self.path)
+                if parts.path != MIS_PATH:
+                    self.send_error(404)
+                    return
+                ex_ch = parse_qs(parts.query).get("ex_ch", [""])[0]
+                with server._lock:  # MisFeed 非執行緒安全
+                    server.requests += 1
+                    msgs = feed.snapshot([s for s in ex_ch.split("|") if s], server.clock())
+                if latency_ms: time.sleep(latency_ms / 1000)
+                body = json.dumps({"msgArray": msgs, "rtcode": "0000"}, ensure_ascii=False).encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json; charset=utf-8")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        self.httpd = ThreadingHTTPServer((host, port), Handler)
+        self.httpd.daemon_threads = True
+        self.url = f"http://{host}:{self.httpd.server_port}{MIS_PATH}"
+
+    def start(self):
+        threading.Thread(target=self.httpd.serve_forever, daemon=True).start()
+        return self
+
+    def close(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--port", type=int, default=9001)
+    parser.add_argument("--speed", type=float, default=1.0, help="模擬時間倍速")
+    parser.add_argument("--trades", type=int, default=2000, help="每檔全日約略成交筆數")
+    parser.add_argument("--latency-ms", type=float, default=0.0, help="每個回應額外延遲")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    # 模擬時鐘以台北日期的 09:00 起算，feed 的交易日也必須是台北日期 (本機時區可能不同)
+    today = datetime.now(TAIPEI_TZ).date()
+
+    # 接受任何 ex_ch：第一次被查詢時才建立該檔的狀態
+    class OnDemandFeed(MisFeed):
+        def snapshot(self, ex_ch_list, now):
+            missing = [s for s in ex_ch_list if s not in self.state]
+            if missing:
+                extra = MisFeed(missing, today, args.trades, seed=len(self.state) + args.seed)
+                self.state.update(extra.state)
+            return super().snapshot(ex_ch_list, now)
+
+    server = FakeMisServer(OnDemandFeed([], today, args.trades, args.seed), speed=args.speed,
+                           port=args.port, latency_ms=args.latency_ms)
+    print(f"模擬 MIS 伺服器已啟動：{server.url}")
+    server.httpd.serve_forever()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,315 @@
+"""完整基準測試：以合成行情量測 summary 計算、輪詢寫入吞吐量、DB upsert、API 端點延遲與記憶體
+
+全部使用本機資源 (暫存 SQLite、模擬 MIS 伺服器、以子行程啟動的 uvicorn)，不需外部服務。
+結果可輸出為 JSON，並與先前的結果比較：
+
+    python benchmarks/run_suite.py --out results.json
+    python benchmarks/run_suite.py --quick --compare results.json
+    python benchmarks/run_suite.py --only summary,ingest
+"""
+import os
+import sys
+import json
+import time
+import socket
+import shutil
+import argparse
+import platform
+import resource
+import tempfile
+import tracemalloc
+import subprocess
+import http.client
+from datetime import date, datetime, timedelta
+from sqlalchemy import text
+
+# --- GPS 導航：確保 Python 能找到上層資料夾的模組 ---
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT not in sys.path:
+    sys.path.append(ROOT)
+
+from synthetic import generate_ticks, make_symbols, MisFeed, SESSION_OPEN
+from fake_mis import FakeMisServer
+from bench_api import bench, percentile
+from utils import taipei_day_start_ts
+from database import create_database
+from services import SummaryService
+from live_cache import LiveCache
+from poller import Poller
+from parsing import TICK_COLUMNS
+
+
+class _NullNotifier:
+    """基準測試不送出 webhook"""
+
+    def submit(self, payload):
+        return True
+
+    def close(self, timeout=10):
+        pass
+
+
+def _ms(seconds):
+    return round(seconds * 1000, 3)
+
+
+def _codes(n_symbols):
+    return [s.split('_', 1)[1].split('.')[0] for s in make_symbols(n_symbols)]
+
+
+def tick_rows(ticks_df):
+    """DataFrame -> bulk_upsert_ticks 使用的 tuple (NaN 轉為 None)"""
+    return list(ticks_df[list(TICK_COLUMNS)].astype(object).where(ticks_df.notna(), None).itertuples(index=False, name=None))
+
+
+def _temp_db(tmp_dir, name):
+    db = create_database(f"sqlite:///{os.path.join(tmp_dir, name)}")
+    db.ensure_schema()
+    return db
+
+
+def bench_summary(sizes, repeat):
+    """_process_summary_data 在不同 ticks 數下的延遲百分位數"""
+    service = SummaryService(db=None)
+    results = []
+    for n_ticks in sizes:
+        ticks_df = generate_ticks(["1101"], date.today(), n_ticks, seed=n_ticks)
+        service._process_summary_data(ticks_df.copy(), None)  # 暖身
+        timings = []
+        for _ in range(repeat):
+            df = ticks_df.copy()
+            started = time.perf_counter()
+            service._process_summary_data(df, None)
+            timings.append(time.perf_counter() - started)
+        timings.sort()
+        results.append({"ticks": len(ticks_df), "p50_ms": _ms(percentile(timings, 50)),
+                        "p95_ms": _ms(percentile(timings, 95)), "max_ms": _ms(timings[-1])})
+    return results
+
+
+def bench_ingest(symbol_counts, cycles, poll_seconds, tmp_dir):
+    """Poller.poll_and_save 經模擬 MIS 伺服器抓取、解析、寫入與訊號偵測的吞吐量"""
+    results = []
+    for n_symbols in symbol_counts:
+        ex_ch = make_symbols(n_symbols)
+        day_open = taipei_day_start_ts(date.today()) + SESSION_OPEN
+        clock = {"now": day_open}
+        server = FakeMisServer(MisFeed(ex_ch, date.today(), seed=n_symbols), clock=lambda: clock["now"]).start()
+        db = _temp_db(tmp_dir, f"ingest-{n_symbols}.db")
+        config = {"poll_seconds": poll_seconds, "chunk_size": 50, "fetch_workers": 4,
+                  "signal_rules": "v_shape,breakout,volume_spike,vwap_cross", "log_messages": False}
+        poller = Poller(config, db, SummaryService(db, LiveCache()), LiveCache(), notifier=_NullNotifier())
+        poller.MIS_URL_BASE = server.url
+        poller.replay_clock = lambda: clock["now"]
+        symbols_str = '|'.join(ex_ch)
+
+        stages = {key: [] for key in ("fetch_ms", "parse_ms", "db_ms", "signal_ms", "total_ms")}
+        messages = 0
+        started = time.perf_counter()
+        for _ in range(cycles):
+            clock["now"] += poll_seconds
+            poller.poll_and_save(symbols_str)
+            for key in stages:
+                stages[key].append(poller.last_cycle_stats.get(key, 0.0))
+            messages += poller.last_cycle_stats.get("messages", 0)
+        elapsed = time.perf_counter() - started
+        server.close()
+        poller.fetch_pool.shutdown()
+        db.engine.dispose()
+
+        result = {"symbols": n_symbols, "cycles": cycles, "cycles_per_s": round(cycles / elapsed, 1),
+                  "messages_per_s": round(messages / elapsed, 1)}
+        for key, values in stages.items():
+            values.sort()
+            result[f"{key[:-3]}_p50_ms"] = round(percentile(values, 50), 2)
+            result[f"{key[:-3]}_p95_ms"] = round(percentile(values, 95), 2)
+        results.append(result)
+    return results
+
+
+def bench_upserts(batch_sizes, tmp_dir):
+    """bulk_upsert_ticks 每秒寫入筆數 (新資料與重複 upsert)"""
+    db = _temp_db(tmp_dir, "upserts.db")
+    results = []
+    for batch_size in batch_sizes:
+        ticks_df = generate_ticks(_codes(max(1, batch_size // 500)), date.today(), 500, seed=batch_size)
+        rows = tick_rows(ticks_df.head(batch_size))
+        result = {"rows": len(rows)}
+        for label in ("insert", "reupsert"):
+            started = time.perf_counter()
+            db.bulk_upsert_ticks(rows)
+            elapsed = time.perf_counter() - started
+            result[f"{label}_rows_per_s"] = round(len(rows) / elapsed, 1)
+        results.append(result)
+        with db.get_session() as session:
+            session.execute(text("DELETE FROM ticks"))
+            session.commit()
+    db.engine.dispose()
+    return results
+
+
+def _free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def _wait_for_server(base, proc, timeout=60):
+    deadline = time.monotonic() + timeout
+    host, port = base.rsplit("//", 1)[1].split(":")
+    while time.monotonic() < deadline:
+        if proc.poll() is not None:
+            raise RuntimeError("uvicorn 啟動失敗")
+        try:
+            conn = http.client.HTTPConnection(host, int(port), timeout=2)
+            conn.request("GET", "/")
+            conn.getresponse().read()
+            conn.close()
+            return
+        except OSError:
+            time.sleep(0.3)
+    raise RuntimeError("等待 uvicorn 啟動逾時")
+
+
+def bench_endpoints(n_symbols, ticks_per_symbol, clients, n_requests, tmp_dir):
+    """以子行程啟動 main:app (SQLite、不啟動輪詢)，量測各 /summary 端點延遲"""
+    db_path = os.path.join(tmp_dir, "api.db")
+    db = _temp_db(tmp_dir, "api.db")
+    codes = _codes(n_symbols)
+    past_day = date.today() - timedelta(days=1)
+    for day in (past_day, date.today()):
+        ticks_df = generate_ticks(codes, day, ticks_per_symbol, seed=day.toordinal())
+        db.bulk_upsert_daily_meta([{"symbol": c, "trade_date": day.strftime('%Y-%m-%d'), "short_name": f"模擬{c}",
+                                    "full_name": "", "exchange": "tse", "day_open": None, "day_high": None,
+                                    "day_low": None, "prev_close": None, "limit_up": None, "limit_down": None}
+                                   for c in codes])
+        db.bulk_upsert_ticks(tick_rows(ticks_df))
+    db.engine.dispose()
+
+    port = _free_port()
+    base = f"http://127.0.0.1:{port}"
+    env = dict(os.environ, DATABASE_URL=f"sqlite:///{db_path}", POLLER_ENABLED="false", POLLER_SYMBOLS="",
+               WRITE_BEHIND="false", ARCHIVE_DIR="", HISTORICAL_CACHE_DIR="")
+    log = open(os.path.join(tmp_dir, "uvicorn.log"), "w")
+    proc = subprocess.Popen([sys.executable, "-m", "uvicorn", "main:app", "--port", str(port), "--log-level", "warning"],
+                            cwd=ROOT, env=env, stdout=log, stderr=subprocess.STDOUT)
+    try:
+        _wait_for_server(base, proc)
+        past = past_day.strftime('%Y-%m-%d')
+        results = [
+            bench(base, "summary", codes, None, clients, n_requests),
+            bench(base, "historical", codes, past, clients, n_requests),
+            bench(base, "batch", codes[:20], past, clients, n_requests),
+        ]
+    finally:
+        proc.terminate()
+        proc.wait(timeout=10)
+        log.close()
+    for r in results:
+        r.pop("url", None)
+    return results
+
+
+def bench_memory(n_symbols, ticks_per_symbol):
+    """產生並彙總一整日 ticks 時的 Python 記憶體峰值 (tracemalloc) 與行程 RSS 峰值"""
+    service = SummaryService(db=None)
+    tracemalloc.start()
+    ticks_df = generate_ticks(_codes(n_symbols), date.today(), ticks_per_symbol)
+    for _, group in ticks_df.groupby('symbol', sort=False):
+        service._process_summary_data(group.reset_index(drop=True), None)
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    n_ticks = len(ticks_df)
+    del ticks_df
+    # Linux 的 ru_maxrss 單位為 KB，macOS 為 bytes
+    maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    rss_mb = maxrss / 1024 / 1024 if sys.platform == "darwin" else maxrss / 1024
+    return {"symbols": n_symbols, "ticks": n_ticks,
+            "traced_peak_mb": round(peak / 2**20, 2), "traced_retained_mb": round(current / 2**20, 2),
+            "max_rss_mb": round(rss_mb, 1)}
+
+
+def _git_commit():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT,
+                                       stderr=subprocess.DEVNULL, text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def _flatten(results):
+    """把結果攤平成 {"ingest.symbols=200.messages_per_s": 數值}，用於比較兩次結果"""
+    flat = {}
+    for section, value in results.items():
+        rows = value if isinstance(value, list) else [value]
+        for row in rows:
+            key_field = next((k for k in ("endpoint", "symbols", "ticks", "rows") if k in row), None)
+            prefix = f"{section}.{key_field}={row[key_field]}" if key_field else section
+            for name, metric in row.items():
+                if name != key_field and isinstance(metric, (int, float)) and not isinstance(metric, bool):
+                    flat[f"{prefix}.{name}"] = metric
+    return flat
+
+
+def compare(baseline, current):
+    """列出兩次結果的差異百分比 (延遲與記憶體越低越好，吞吐量越高越好)"""
+    old, new = _flatten(baseline["results"]), _flatten(current["results"])
+    print(f"\n與 {baseline['meta'].get('git_commit')} ({baseline['meta'].get('started_at')}) 比較:")
+    print(f"{'指標':<58} {'基準':>12} {'本次':>12} {'差異':>9}")
+    for key in sorted(old.keys() & new.keys()):
+        a, b = old[key], new[key]
+        if not a: continue
+        delta = (b - a) / a * 100
+        higher_is_better = key.endswith("_per_s") or key.endswith("_rps")
+        mark = "" if abs(delta) < 5 else (" ✓" if (delta > 0) == higher_is_better else " ✗")
+        print(f"{key:<58} {a:>12} {b:>12} {delta:>+8.1f}%{mark}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--only", help="只執行這些項目 (逗號分隔): summary,ingest,upserts,endpoints,memory")
+    parser.add_argument("--quick", action="store_true", help="縮小資料量，快速檢查用")
+    parser.add_argument("--out", help="將結果寫入此 JSON 檔")
+    parser.add_argument("--compare", help="與先前輸出的 JSON 結果比較")
+    args = parser.parse_args()
+
+    sections = {"summary", "ingest", "upserts", "endpoints", "memory"}
+    if args.only:
+        sections &= {s.strip() for s in args.only.split(",")}
+    quick = args.quick
+    tmp_dir = tempfile.mkdtemp(prefix="bench-")
+    meta = {"git_commit": _git_commit(), "started_at": datetime.now().isoformat(timespec='seconds'),
+            "python": platform.python_version(), "platform": platform.platform(), "quick": quick}
+    results = {}
+    try:
+        if "summary" in sections:
+            print("summary 計算...")
+            results["summary"] = bench_summary([1000, 10000] if quick else [1000, 10000, 100000], 5 if quick else 20)
+        if "ingest" in sections:
+            print("輪詢寫入吞吐量...")
+            results["ingest"] = bench_ingest([50, 200] if quick else [50, 200, 1000], 10 if quick else 60, 5, tmp_dir)
+        if "upserts" in sections:
+            print("DB upsert...")
+            results["upserts"] = bench_upserts([1000, 10000] if quick else [1000, 10000, 50000], tmp_dir)
+        if "endpoints" in sections:
+            print("API 端點...")
+            results["endpoints"] = bench_endpoints(20 if quick else 100, 500 if quick else 3000,
+                                                   10 if quick else 50, 10 if quick else 40, tmp_dir)
+        if "memory" in sections:
+            print("記憶體...")
+            results["memory"] = bench_memory(50 if quick else 500, 1000 if quick else 3000)
+    finally:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+
+    output = {"meta": meta, "results": results}
+    print(json.dumps(output, ensure_ascii=False, indent=2))
+    if args.out:
+        with open(args.out, 'w', encoding='utf-8') as f:
+            json.dump(output, f, ensure_ascii=False, indent=2)
+    if args.compare:
+        with open(args.compare, encoding='utf-8') as f:
+            compare(json.load(f), output)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,138 @@
+"""基準測試用的合成行情：整日 ticks 產生器與模擬 MIS 快照
+
+- 成交時間依 U 型日內量能分布 (開盤、收盤附近較密集)
+- 價格為依台股升降單位跳動的隨機漫步，委買委賣價緊貼成交價
+- MisFeed 依模擬時間推進各檔狀態，輸出與 MIS getStockInfo.jsp 相同欄位 (字串) 的 msgArray
+"""
+import os
+import sys
+import numpy as np
+import pandas as pd
+
+# --- GPS 導航：確保 Python 能找到上層資料夾的模組 ---
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT not in sys.path:
+    sys.path.append(ROOT)
+
+from utils import taipei_day_start_ts
+
+SESSION_OPEN = 9 * 3600      # 09:00 (距台北午夜秒數)
+SESSION_SECONDS = 16200      # 09:00 ~ 13:30
+
+
+def tick_size(price):
+    """台股升降單位"""
+    if price < 10: return 0.01
+    if price < 50: return 0.05
+    if price < 100: return 0.1
+    if price < 500: return 0.5
+    if price < 1000: return 1.0
+    return 5.0
+
+
+def intraday_weights(n_points):
+    """U 型日內量能：開盤後與收盤前成交較密集"""
+    t = np.linspace(0, 1, n_points)
+    return 1 + 2.5 * np.exp(-t / 0.08) + 1.5 * np.exp(-(1 - t) / 0.05)
+
+
+def make_symbols(n_symbols, start=1101):
+    """產生 n 檔模擬股票，回傳 MIS ex_ch 格式 (tse_1101.tw) 的清單"""
+    return [f"tse_{start + i}.tw" for i in range(n_symbols)]
+
+
+def _base_prices(n, rng):
+    prices = np.exp(rng.uniform(np.log(15), np.log(900), n))
+    return np.array([round(p / tick_size(p)) * tick_size(p) for p in prices])
+
+
+def generate_ticks(codes, date, ticks_per_symbol, seed=0):
+    """產生一個交易日的 ticks (依 symbol、ts_sec 排序，與 ticks 表欄位相同)"""
+    rng = np.random.default_rng(seed)
+    day_open_ts = taipei_day_start_ts(date) + SESSION_OPEN
+    weights = intraday_weights(SESSION_SECONDS)
+    cdf = np.cumsum(weights) / weights.sum()
+    frames = []
+    for code, base in zip(codes, _base_prices(len(codes), rng)):
+        offsets = np.unique(np.searchsorted(cdf, rng.random(ticks_per_symbol)))
+        n = len(offsets)
+        step = tick_size(base)
+        price = np.round(base + step * np.cumsum(rng.choice([-1, 0, 0, 1], n)), 2)
+        price = np.maximum(price, step)
+        side = rng.random(n)
+        # 45% 成交在賣價 (外盤)、45% 在買價 (內盤)，其餘在買賣價之間
+        best_bid = np.round(np.where(side < 0.45, price - step, price), 2)
+        best_ask = np.round(np.where(side < 0.45, price, price + step), 2)
+        best_bid[rng.random(n) < 0.02] = np.nan
+        frames.append(pd.DataFrame({
+            "symbol": code, "ts_sec": day_open_ts + offsets, "price": price,
+            "vol": np.maximum(1, rng.lognormal(1.0, 1.0, n).astype(np.int64)),
+            "best_bid": best_bid, "best_ask": best_ask,
+        }))
+    return pd.concat(frames, ignore_index=True)
+
+
+def _fmt(x):
+    return f"{x:.4f}"
+
+
+class MisFeed:
+    """模擬 MIS 的即時快照：每檔在兩次查詢之間依日內量能機率產生新成交，只回傳最新一筆 (與 MIS 相同)"""
+
+    def __init__(self, ex_ch_list, date, trades_per_symbol=2000, seed=0):
+        rng = self.rng = np.random.default_rng(seed)
+        self.day_open_ts = taipei_day_start_ts(date) + SESSION_OPEN
+        # 每秒成交機率，使全日成交數約為 trades_per_symbol
+        weights = intraday_weights(SESSION_SECONDS)
+        self.rate = weights / weights.sum() * trades_per_symbol
+        self.state = {}
+        for ex_ch, base in zip(ex_ch_list, _base_prices(len(ex_ch_list), rng)):
+            ex, rest = ex_ch.split('_', 1)
+            code = rest.split('.')[0]
+            self.state[ex_ch] = {
+                "c": code, "ex": ex, "n": f"模擬{code}", "nf": f"模擬股份有限公司{code}",
+                "y": base, "o": None, "h": None, "l": None, "z": None, "tv": 0, "v": 0,
+                "tlong": None, "last_ts": self.day_open_ts, "step": tick_size(base),
+            }
+
+    def _advance(self, s, now):
+        elapsed = min(max(now, self.day_open_ts), self.day_open_ts + SESSION_SECONDS)
+        if elapsed <= s["last_ts"]: return
+        lo, hi = s["last_ts"] - self.day_open_ts, elapsed - self.day_open_ts
+        s["last_ts"] = elapsed
+        expected = self.rate[lo:hi].sum()
+        n_trades = self.rng.poisson(expected)
+        if not n_trades: return
+        price = s["z"] if s["z"] is not None else s["y"]
+        price = max(s["step"], round(price + s["step"] * self.rng.integers(-2, 3), 2))
+        vols = np.maximum(1, self.rng.lognormal(1.0, 1.0, n_trades).astype(np.int64))
+        s["z"] = price
+        s["o"] = s["o"] if s["o"] is not None else price
+        s["h"] = max(s["h"] or price, price)
+        s["l"] = min(s["l"] or price, price)
+        s["tv"] = int(vols[-1])
+        s["v"] += int(vols.sum())
+        s["tlong"] = (self.day_open_ts + hi) * 1000
+
+    def snapshot(self, ex_ch_list, now):
+        """回傳指定股票在模擬時間 now (epoch 秒) 的 msgArray"""
+        msgs = []
+        for ex_ch in ex_ch_list:
+            s = self.state.get(ex_ch)
+            if s is None: continue
+            self._advance(s, now)
+            y, step = s["y"], s["step"]
+            msg = {"c": s["c"], "n": s["n"], "nf": s["nf"], "ex": s["ex"], "y": _fmt(y),
+                   "u": _fmt(round(y * 1.1, 2)), "w": _fmt(round(y * 0.9, 2)),
+                   "o": _fmt(s["o"]) if s["o"] is not None else "-",
+                   "h": _fmt(s["h"]) if s["h"] is not None else "-",
+                   "l": _fmt(s["l"]) if s["l"] is not None else "-",
+                   "z": _fmt(s["z"]) if s["z"] is not None else "-",
+                   "tv": str(s["tv"]) if s["tlong"] else "-", "v": str(s["v"])}
+            if s["tlong"]:
+                msg["tlong"] = str(s["tlong"])
+                px = s["z"]
+                msg["b"] = "_".join(_fmt(px - step * i) for i in range(5)) + "_"
+                msg["a"] = "_".join(_fmt(px + step * (i + 1)) for i in range(5)) + "_"
+            msgs.append(msg)
+        return msgs
@@ -0,0 +1,33 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+
+
+class CoalescingExecutor:
+    """在有上限的執行緒池中執行阻塞呼叫 (PyMySQL + pandas)，並讓同時進行的相同請求共用同一次計算"""
+
+    def __init__(self, max_workers, name='summary'):
+        self.max_workers = max_workers
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix=name)
+        self._inflight = {}  # key -> asyncio.Future (只在事件迴圈執行緒中存取，不需鎖)
+        self.calls = self.coalesced = 0
+
+    async def run(self, key, fn, *args):
+        """key 相同且仍在計算中的請求會直接等待既有結果，不會再排入執行緒池"""
+        self.calls += 1
+        future = self._inflight.get(key)
+        if future is not None:
+            self.coalesced += 1
+            return await asyncio.shield(future)
+
+        future = asyncio.get_running_loop().run_in_executor(self._executor, fn, *args)
+        self._inflight[key] = future
+        future.add_done_callback(lambda _: self._inflight.pop(key, None))
+        # shield：單一客戶端斷線取消時，不影響其他共用此結果的請求
+        return await asyncio.shield(future)
+
+    def stats(self):
+        return {"max_workers": self.max_workers, "inflight": len(self._inflight),
+                "calls": self.calls, "coalesced": self.coalesced}
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False)
@@ -0,0 +1,233 @@
+"""多個輪詢器實例 (多 worker 或多副本) 之間的協調：以共用 DB 做成員心跳、股票分片與租約 (leader election)
+
+- poller_nodes：每個實例定期更新 heartbeat_ts，超過 ttl_seconds 未更新即視為離線
+- 分片：以 rendezvous hashing (hash(node_id|symbol) 最大者) 決定每檔股票由哪個實例輪詢，
+  增減實例時只有約 1/N 的股票需要換手；換手期間 (最多 ttl_seconds) 可能有兩個實例同時抓同一檔，upsert 仍為冪等
+- leases：以單一 UPDATE ... WHERE (holder = 自己 OR 已過期) 做 compare-and-set，由 DB 的列鎖保證只有一個實例取得，
+  MySQL 與 SQLite 皆適用；用於只該由一個實例執行的工作 (清理舊資料、收盤彙總)
+- closing_reports / daily_jobs：收盤彙總前的屏障。每個實例完成自己分片的收盤補抓並清空 write-behind 後回報，
+  取得租約的實例等所有存活實例都回報後才彙總全部股票，完成後記錄於 daily_jobs，其他實例看到紀錄才視為當日完成
+
+- 盤中狀態：每個實例只輪詢自己的分片，其他分片由 Poller 每輪從 DB 讀取新 ticks 與 meta 更新 K 棒、盤中快取與
+  /stream 推播 (不寫入、不偵測訊號)，因此請求落在任一 worker 都能取得全部股票的即時資料，只是晚約一個輪詢間隔
+
+各實例的系統時間需同步 (NTP)，心跳與租約到期都以 epoch 秒比較。
+"""
+import os
+import time
+import hashlib
+import uuid
+import socket
+import threading
+from sqlalchemy import text
+from sqlalchemy.exc import SQLAlchemyError, IntegrityError
+from scheduler import symbol_code
+
+COORDINATION_DDL = [
+    """
+    CREATE TABLE IF NOT EXISTS poller_nodes (
+        node_id VARCHAR(64) NOT NULL PRIMARY KEY,
+        hostname VARCHAR(255) NULL,
+        started_ts BIGINT NOT NULL,
+        heartbeat_ts BIGINT NOT NULL
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS leases (
+        name VARCHAR(64) NOT NULL PRIMARY KEY,
+        holder VARCHAR(64) NULL,
+        expires_ts BIGINT NOT NULL
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS closing_reports (
+        trade_date VARCHAR(10) NOT NULL,
+        node_id VARCHAR(64) NOT NULL,
+        reported_ts BIGINT NOT NULL,
+        PRIMARY KEY (trade_date, node_id)
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS daily_jobs (
+        name VARCHAR(64) NOT NULL,
+        trade_date VARCHAR(10) NOT NULL,
+        node_id VARCHAR(64) NOT NULL,
+        done_ts BIGINT NOT NULL,
+        PRIMARY KEY (name, trade_date)
+    )
+    """,
+]
+
+
+def default_node_id():
+    return f"{socket.gethostname()}-{os.getpid()}-{uuid.uuid4().hex[:6]}"
+
+
+class Coordinator:
+    def __init__(self, db, node_id=None, heartbeat_seconds=5, ttl_seconds=20):
+        self.db = db
+        self.node_id = node_id or default_node_id()
+        self.heartbeat_seconds = heartbeat_seconds
+        self.ttl_seconds = ttl_seconds
+        self.started_ts = int(time.time())
+        self.live_nodes = (self.node_id,)
+        self._owners = {}  # code -> node_id，成員變動時清空
+        self.membership_changes = 0
+        self.heartbeat_failures = 0
+        self._stop = threading.Event()
+        self._thread = None
+
+    def _execute(self, sql, params=None):
+        with self.db.engine.begin() as conn:
+            return conn.execute(text(sql), params or {})
+
+    def ensure_schema(self):
+        for ddl in COORDINATION_DDL:
+            self._execute(ddl)
+
+    # --- 成員與心跳 ---
+    def start(self):
+        """建立資料表並先同步送出一次心跳，之後在背景執行緒定期更新"""
+        self.ensure_schema()
+        self.heartbeat()
+        self._thread = threading.Thread(target=self._run, name='coordinator', daemon=True)
+        self._thread.start()
+        print(f"協調模式已啟用：node_id={self.node_id}，目前 {len(self.live_nodes)} 個實例。")
+        return self
+
+    def stop(self):
+        """離開叢集：刪除自己的心跳，其他實例下次心跳時即接手本實例的股票 (租約則等其自然到期)"""
+        self._stop.set()
+        if self._thread is not None: self._thread.join(self.heartbeat_seconds + 1)
+        try:
+            self._execute("DELETE FROM poller_nodes WHERE node_id = :node_id", {"node_id": self.node_id})
+        except SQLAlchemyError as e:
+            print(f"離開叢集時發生錯誤: {e}")
+
+    def _run(self):
+        while not self._stop.wait(self.heartbeat_seconds):
+            self.heartbeat()
+
+    def heartbeat(self):
+        """更新自己的心跳並重新讀取存活的實例清單；DB 暫時失敗時沿用上一次的清單"""
+        now = int(time.time())
+        params = {"node_id": self.node_id, "now": now}
+        try:
+            if self._execute("UPDATE poller_nodes SET heartbeat_ts = :now WHERE node_id = :node_id", params).rowcount == 0:
+                self._execute("INSERT INTO poller_nodes (node_id, hostname, started_ts, heartbeat_ts) "
+                              "VALUES (:node_id, :hostname, :started_ts, :now)",
+                              dict(params, hostname=socket.gethostname(), started_ts=self.started_ts))
+            rows = self._execute("SELECT node_id FROM poller_nodes WHERE heartbeat_ts >= :cutoff ORDER BY node_id",
+                                 {"cutoff": now - self.ttl_seconds}).fetchall()
+            # 長時間沒有心跳的實例直接移除，避免資料表無限成長
+            self._execute("DELETE FROM poller_nodes WHERE heartbeat_ts < :cutoff", {"cutoff": now - 3600})
+        except SQLAlchemyError as e:
+            self.heartbeat_failures += 1
+            print(f"協調心跳失敗: {e}")
+            return
+        nodes = tuple(sorted({row.node_id for row in rows} | {self.node_id}))
+        if nodes != self.live_nodes:
+            self.membership_changes += 1
+            print(f"叢集成員變動：{len(self.live_nodes)} -> {len(nodes)} 個實例，重新分配股票。")
+            self._owners = {}
+            self.live_nodes = nodes
+
+    # --- 分片 ---
+    def owner(self, code):
+        owner = self._owners.get(code)
+        if owner is None:
+            # 結果快取到下次成員變動，每輪分片不必重算雜湊
+            owner = self._owners[code] = max(self.live_nodes, key=lambda node: hashlib.blake2b(
+                f"{node}|{code}".encode(), digest_size=8).digest())
+        return owner
+
+    def shard(self, ex_ch_list):
+        """回傳由本實例負責輪詢的 ex_ch"""
+        if len(self.live_nodes) == 1: return list(ex_ch_list)
+        return [ex_ch for ex_ch in ex_ch_list if self.owner(symbol_code(ex_ch)) == self.node_id]
+
+    # --- 租約 ---
+    def try_acquire(self, name, ttl_seconds, renew=True):
+        """取得 (或 renew=True 時延長自己持有的) 租約；renew=False 時即使自己持有也要等到期，適合「每段期間只做一次」的工作"""
+        now = int(time.time())
+        params = {"name": name, "node_id": self.node_id, "now": now, "expires_ts": now + ttl_seconds}
+        condition = "(holder = :node_id OR expires_ts < :now)" if renew else "expires_ts < :now"
+        try:
+            try:
+                self._execute("INSERT INTO leases (name, holder, expires_ts) VALUES (:name, NULL, 0)", params)
+            except IntegrityError:
+                pass  # 租約列已存在
+            res = self._execute(f"UPDATE leases SET holder = :node_id, expires_ts = :expires_ts "
+                                f"WHERE name = :name AND {condition}", params)
+        except SQLAlchemyError as e:
+            print(f"取得租約 {name} 失敗: {e}")
+            return False
+        return res.rowcount == 1
+
+    # --- 收盤屏障 ---
+    def _insert_once(self, sql, params):
+        """INSERT；列已存在 (主鍵衝突) 也視為成功"""
+        try:
+            try:
+                self._execute(sql, params)
+            except IntegrityError:
+                pass
+        except SQLAlchemyError as e:
+            print(f"寫入協調紀錄失敗: {e}")
+            return False
+        return True
+
+    def report_closed(self, trade_date):
+        """回報本實例已完成 trade_date 的收盤補抓且資料已寫入 DB"""
+        now = int(time.time())
+        try:
+            # 只保留最近一週的回報
+            self._execute("DELETE FROM closing_reports WHERE reported_ts < :cutoff", {"cutoff": now - 7 * 86400})
+        except SQLAlchemyError as e:
+            print(f"清理收盤回報失敗: {e}")
+        return self._insert_once("INSERT INTO closing_reports (trade_date, node_id, reported_ts) "
+                                 "VALUES (:trade_date, :node_id, :now)",
+                                 {"trade_date": trade_date, "node_id": self.node_id, "now": now})
+
+    def withdraw_closed(self, trade_date):
+        """撤回回報 (接手其他實例的股票、需要重新補抓收盤成交時)"""
+        try:
+            self._execute("DELETE FROM closing_reports WHERE trade_date = :trade_date AND node_id = :node_id",
+                          {"trade_date": trade_date, "node_id": self.node_id})
+        except SQLAlchemyError as e:
+            print(f"撤回收盤回報失敗: {e}")
+            return False
+        return True
+
+    def pending_closing_reports(self, trade_date):
+        """回傳尚未回報 trade_date 收盤的存活實例 (直接以 DB 中的心跳判斷)；查詢失敗時回傳 None"""
+        try:
+            rows = self._execute("""
+                SELECT n.node_id FROM poller_nodes n
+                LEFT JOIN closing_reports r ON r.node_id = n.node_id AND r.trade_date = :trade_date
+                WHERE n.heartbeat_ts >= :cutoff AND r.node_id IS NULL
+                ORDER BY n.node_id
+            """, {"trade_date": trade_date, "cutoff": int(time.time()) - self.ttl_seconds}).fetchall()
+        except SQLAlchemyError as e:
+            print(f"讀取收盤回報失敗: {e}")
+            return None
+        return [row.node_id for row in rows]
+
+    def is_done(self, name, trade_date):
+        try:
+            row = self._execute("SELECT 1 FROM daily_jobs WHERE name = :name AND trade_date = :trade_date",
+                                {"name": name, "trade_date": trade_date}).fetchone()
+        except SQLAlchemyError as e:
+            print(f"讀取每日工作紀錄失敗: {e}")
+            return False
+        return row is not None
+
+    def mark_done(self, name, trade_date):
+        return self._insert_once("INSERT INTO daily_jobs (name, trade_date, node_id, done_ts) "
+                                 "VALUES (:name, :trade_date, :node_id, :now)",
+                                 {"name": name, "trade_date": trade_date, "node_id": self.node_id,
+                                  "now": int(time.time())})
+
+    def stats(self):
+        return {"node_id": self.node_id, "nodes": len(self.live_nodes), "membership_changes": self.membership_changes,
+                "heartbeat_failures": self.heartbeat_failures}
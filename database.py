@@ -1,24 +1,18 @@
-from sqlalchemy import create_engine, text
+import os
+import json
+import time
+import pandas as pd
+from sqlalchemy import create_engine, text, bindparam, event
 from sqlalchemy.orm import sessionmaker
 from sqlalchemy.exc import SQLAlchemyError
 from datetime import datetime, timedelta
+from utils import taipei_day_start_ts, TAIPEI_TZ
+from metrics import timed, DB_SECONDS, DB_ROWS_TOTAL, DB_ERRORS_TOTAL
 
 class Database:
-    def __init__(self, db_url):
-        try:
-            self.engine = create_engine(db_url, pool_recycle=3600, echo=False)
-            self.Session = sessionmaker(bind=self.engine)
-            print("資料庫連線成功 (Database connection successful).")
-        except Exception as e:
-            print(f"資料庫連線失敗 (Error connecting to database): {e}")
-            raise
-
-    def get_session(self):
-        return self.Session()
+    """MySQL (pymysql) 儲存後端；各 SQL 以類別屬性定義，其他後端 (如 SQLiteDatabase) 覆寫即可"""
 
-    def bulk_upsert_daily_meta(self, records):
-        if not records: return
-        stmt = text("""
+    UPSERT_DAILY_META_SQL = """
             INSERT INTO daily_meta(symbol, trade_date, day_open, day_high, day_low, prev_close, limit_up, limit_down, short_name, full_name, exchange)
             VALUES (:symbol, :trade_date, :day_open, :day_high, :day_low, :prev_close, :limit_up, :limit_down, :short_name, :full_name, :exchange)
             ON DUPLICATE KEY UPDATE
@@ -31,54 +25,426 @@ class Database:
                 short_name = VALUES(short_name),
                 full_name = VALUES(full_name),
                 exchange = VALUES(exchange);
-        """)
-        with self.get_session() as session:
-            try:
-                session.execute(stmt, records)
-                session.commit()
-            except SQLAlchemyError as e:
-                print(f"Error in bulk_upsert_daily_meta: {e}")
-                session.rollback()
+        """
 
-    def bulk_upsert_ticks(self, records):
-        if not records: return
-        stmt = text("""
+    # ticks 以位置參數 (DBAPI paramstyle) 直接 executemany，欄位順序同 parsing.TICK_COLUMNS
+    UPSERT_TICKS_SQL = """
             INSERT INTO ticks(symbol, ts_sec, price, vol, best_bid, best_ask)
-            VALUES (:symbol, :ts_sec, :price, :vol, :best_bid, :best_ask)
+            VALUES (%s, %s, %s, %s, %s, %s)
             ON DUPLICATE KEY UPDATE
                 price = VALUES(price),
                 vol = VALUES(vol),
                 best_bid = VALUES(best_bid),
                 best_ask = VALUES(best_ask);
+        """
+
+    UPSERT_BARS_SQL = """
+            INSERT INTO bars_5m(symbol, trade_date, bar_ts, open, high, low, close, volume, vwap, buy_vol, sell_vol)
+            VALUES (:symbol, :trade_date, :bar_ts, :open, :high, :low, :close, :volume, :vwap, :buy_vol, :sell_vol)
+            ON DUPLICATE KEY UPDATE
+                open = VALUES(open),
+                high = VALUES(high),
+                low = VALUES(low),
+                close = VALUES(close),
+                volume = VALUES(volume),
+                vwap = VALUES(vwap),
+                buy_vol = VALUES(buy_vol),
+                sell_vol = VALUES(sell_vol);
+        """
+
+    SCHEMA_DDL = ["""
+            CREATE TABLE IF NOT EXISTS bars_5m (
+                symbol VARCHAR(16) NOT NULL,
+                trade_date DATE NOT NULL,
+                bar_ts INT NOT NULL,
+                open DOUBLE NOT NULL,
+                high DOUBLE NOT NULL,
+                low DOUBLE NOT NULL,
+                close DOUBLE NOT NULL,
+                volume BIGINT NOT NULL,
+                vwap DOUBLE NULL,
+                buy_vol BIGINT NOT NULL,
+                sell_vol BIGINT NOT NULL,
+                PRIMARY KEY (symbol, trade_date, bar_ts),
+                KEY idx_bars_5m_trade_date (trade_date)
+            )
+        """]
+
+    PRUNE_TICKS_SQL = "DELETE FROM ticks WHERE symbol = :symbol AND ts_sec < :cutoff_ts ORDER BY ts_sec LIMIT :batch_size"
+    PRUNE_META_SQL = "DELETE FROM daily_meta WHERE trade_date < :bar_cutoff_date_str LIMIT :batch_size"
+    PRUNE_BARS_SQL = "DELETE FROM bars_5m WHERE trade_date < :bar_cutoff_date_str LIMIT :batch_size"
+    # 台北時間 (UTC+8，無日光節約) 的日序號 (epoch 天數) 與當日 ticks 筆數
+    TICK_DAY_COUNTS_SQL = "SELECT (ts_sec + 28800) DIV 86400 AS day, COUNT(*) AS n FROM ticks GROUP BY day"
+
+    def __init__(self, db_url):
+        try:
+            self.engine = self._create_engine(db_url)
+            self.Session = sessionmaker(bind=self.engine)
+            # prune_old_data 刪除資料後會以 cutoff 日期字串呼叫這些函式 (例如讓快取失效)
+            self.prune_listeners = []
+            self.prune_status = None
+            print("資料庫連線成功 (Database connection successful).")
+        except Exception as e:
+            print(f"資料庫連線失敗 (Error connecting to database): {e}")
+            raise
+
+    def _create_engine(self, db_url):
+        return create_engine(db_url, pool_recycle=3600, echo=False)
+
+    def get_session(self):
+        return self.Session()
+
+    def read_ticks(self, symbols, start_ts, end_ts=None):
+        """以 (symbol, ts_sec) 主鍵做範圍掃描，回傳依 symbol、ts_sec 排序的 DataFrame；symbols 為 None 時讀取全部股票"""
+        conditions = ["ts_sec >= :start_ts"]
+        params = {"start_ts": start_ts}
+        if symbols is not None:
+            conditions.append("symbol IN :symbols")
+            params["symbols"] = list(symbols)
+        if end_ts is not None:
+            conditions.append("ts_sec <= :end_ts")
+            params["end_ts"] = end_ts
+        stmt = text(f"""
+            SELECT symbol, ts_sec, price, vol, best_bid, best_ask
+            FROM ticks
+            WHERE {" AND ".join(conditions)}
+            ORDER BY symbol, ts_sec ASC
         """)
-        with self.get_session() as session:
+        if symbols is not None:
+            stmt = stmt.bindparams(bindparam("symbols", expanding=True))
+        with self.engine.connect() as conn:
+            return pd.read_sql(stmt, conn, params=params)
+
+    def tick_counts_by_day(self):
+        """回傳 {台北日期字串: ticks 筆數}；掃描整張 ticks，只供每日一次的封存補齊使用"""
+        with self.engine.connect() as conn:
+            rows = conn.execute(text(self.TICK_DAY_COUNTS_SQL)).fetchall()
+        return {(datetime(1970, 1, 1) + timedelta(days=int(row.day))).strftime('%Y-%m-%d'): row.n for row in rows}
+
+    def _bulk_upsert(self, table, sql, records):
+        """以 executemany 批次 upsert，並記錄耗時、筆數與失敗次數 (/metrics)"""
+        if not records: return
+        DB_ROWS_TOTAL.inc(len(records), table=table)
+        with timed(DB_SECONDS, table=table), self.get_session() as session:
             try:
-                session.execute(stmt, records)
+                session.execute(text(sql), records)
                 session.commit()
+                return True
             except SQLAlchemyError as e:
-                print(f"Error in bulk_upsert_ticks: {e}")
+                print(f"Error in bulk upsert ({table}): {e}")
+                DB_ERRORS_TOTAL.inc(table=table)
                 session.rollback()
+                return False
 
-    def prune_old_data(self, days_to_keep=60):
-        """刪除超過指定天數的舊資料"""
-        cutoff_date = datetime.now() - timedelta(days=days_to_keep)
-        cutoff_date_str = cutoff_date.strftime('%Y-%m-%d')
-        cutoff_ts = int(cutoff_date.timestamp())
+    def bulk_upsert_daily_meta(self, records):
+        return self._bulk_upsert("daily_meta", self.UPSERT_DAILY_META_SQL, records)
 
-        print(f"開始清理 {days_to_keep} 天前的舊資料 (cutoff: {cutoff_date_str})...")
-        
+    def bulk_upsert_ticks(self, rows):
+        """rows 為 parsing.Tick 或相同欄位順序的 tuple；直接交給 DBAPI executemany，略過 SQLAlchemy 逐列的參數處理
+        (pymysql 會將 INSERT ... VALUES 的 executemany 合併成多列 INSERT)"""
+        if not rows: return
+        DB_ROWS_TOTAL.inc(len(rows), table="ticks")
+        try:
+            with timed(DB_SECONDS, table="ticks"), self.engine.begin() as conn:
+                conn.exec_driver_sql(self.UPSERT_TICKS_SQL, rows if isinstance(rows, list) else list(rows))
+            return True
+        except SQLAlchemyError as e:
+            print(f"Error in bulk upsert (ticks): {e}")
+            DB_ERRORS_TOTAL.inc(table="ticks")
+            return False
+
+    def ensure_schema(self):
+        """建立本服務自行管理的資料表 (MySQL 上為 5 分 K 彙總表，ticks / daily_meta 由外部建立)"""
         with self.get_session() as session:
             try:
-                # 刪除舊的 ticks
-                ticks_stmt = text("DELETE FROM ticks WHERE ts_sec < :cutoff_ts")
-                ticks_res = session.execute(ticks_stmt, {"cutoff_ts": cutoff_ts})
-                
-                # 刪除舊的 daily_meta
-                meta_stmt = text("DELETE FROM daily_meta WHERE trade_date < :cutoff_date_str")
-                meta_res = session.execute(meta_stmt, {"cutoff_date_str": cutoff_date_str})
-                
+                for ddl in self.SCHEMA_DDL:
+                    session.execute(text(ddl))
                 session.commit()
-                print(f"清理完成。刪除了 {ticks_res.rowcount} 筆 tick 資料和 {meta_res.rowcount} 筆 meta 資料。")
             except SQLAlchemyError as e:
-                print(f"清理舊資料時發生錯誤: {e}")
+                print(f"Error in ensure_schema: {e}")
                 session.rollback()
+
+    def bulk_upsert_bars(self, records):
+        return self._bulk_upsert("bars_5m", self.UPSERT_BARS_SQL, records)
+
+    def prune_old_data(self, days_to_keep=60, bar_days_to_keep=730, batch_size=5000, pause_seconds=0.2,
+                       use_partitions=False, state_path=None):
+        """刪除超過指定天數的舊資料 (5 分 K 彙總表保留較久)
+
+        ticks 依主鍵 (symbol, ts_sec) 逐檔、每批最多 batch_size 筆刪除並各自 commit，批次間暫停 pause_seconds，
+        避免長時間鎖表與撐大 undo log。進度記錄在 self.prune_status (及 state_path 檔案)，
+        同一 cutoff 日期中斷後再次執行會略過已完成的股票。
+        use_partitions=True 且 ticks 為每日 RANGE 分區時，先直接 DROP 過期分區，分區外殘留的過期資料再以批次 DELETE 清理。
+        """
+        # cutoff 為台北日界：早於 cutoff 日期的 ticks 整天刪除，歷史快取清除相同的日期範圍 (不含 cutoff 當日)
+        today = datetime.now(TAIPEI_TZ).date()
+        cutoff_date = today - timedelta(days=days_to_keep)
+        cutoff_date_str = cutoff_date.strftime('%Y-%m-%d')
+        cutoff_ts = taipei_day_start_ts(cutoff_date)
+        bar_cutoff_date_str = (today - timedelta(days=bar_days_to_keep)).strftime('%Y-%m-%d')
+
+        print(f"開始清理 {days_to_keep} 天前的舊資料 (cutoff: {cutoff_date_str})...")
+        status = self._load_prune_status(cutoff_date_str, state_path)
+        self.prune_status = status
+
+        try:
+            # 刪除舊的 ticks：每日分區先整個 DROP；分區外的資料 (舊的非每日分區等) 仍以批次 DELETE 清理，
+            # 此時剩下的過期資料很少，逐檔的主鍵範圍刪除幾乎不花時間
+            if use_partitions and not self._drop_tick_partitions(cutoff_date, status):
+                print("ticks 沒有每日分區 (pYYYYMMDD)，改以批次 DELETE 清理。")
+            with self.get_session() as session:
+                symbols = [row[0] for row in session.execute(text("SELECT DISTINCT symbol FROM ticks"))]
+            ticks_stmt = text(self.PRUNE_TICKS_SQL)
+            for n, symbol in enumerate(symbols, 1):
+                if symbol in status["symbols_done"]: continue
+                deleted = self._delete_in_batches(ticks_stmt, {"symbol": symbol, "cutoff_ts": cutoff_ts},
+                                                  batch_size, pause_seconds)
+                status["ticks_deleted"] += deleted
+                status["symbols_done"].append(symbol)
+                self._save_prune_status(status, state_path)
+                if deleted:
+                    print(f"  [{n}/{len(symbols)}] {symbol}: 刪除 {deleted} 筆 tick (累計 {status['ticks_deleted']})")
+
+            # 刪除舊的 daily_meta (與 5 分 K 保留相同天數，歷史查詢才有當日的開高低收)
+            meta_stmt = text(self.PRUNE_META_SQL)
+            meta_deleted = self._delete_in_batches(meta_stmt, {"bar_cutoff_date_str": bar_cutoff_date_str},
+                                                   batch_size, pause_seconds)
+
+            # 刪除超過保留期限的 5 分 K
+            bars_stmt = text(self.PRUNE_BARS_SQL)
+            bars_deleted = self._delete_in_batches(bars_stmt, {"bar_cutoff_date_str": bar_cutoff_date_str},
+                                                   batch_size, pause_seconds)
+        except SQLAlchemyError as e:
+            print(f"清理舊資料時發生錯誤 (下次執行會從中斷處繼續): {e}")
+            return
+
+        status["finished"] = True
+        self._save_prune_status(status, state_path)
+        print(f"清理完成。刪除了 {status['ticks_deleted']} 筆 tick 資料、{meta_deleted} 筆 meta 資料和 {bars_deleted} 筆 5 分 K。")
+
+        for listener in self.prune_listeners:
+            listener(cutoff_date_str)
+
+    def _delete_in_batches(self, stmt, params, batch_size, pause_seconds):
+        """重複執行帶 LIMIT 的 DELETE，每批獨立 commit，直到沒有資料可刪"""
+        total = 0
+        while True:
+            with self.get_session() as session:
+                try:
+                    deleted = session.execute(stmt, dict(params, batch_size=batch_size)).rowcount
+                    session.commit()
+                except SQLAlchemyError:
+                    session.rollback()
+                    raise
+            total += deleted
+            if deleted < batch_size: return total
+            time.sleep(pause_seconds)
+
+    def _drop_tick_partitions(self, cutoff_date, status):
+        """ticks 若以每日 RANGE 分區 (分區名 pYYYYMMDD)，DROP 整天早於 cutoff 的分區
+
+        回傳是否有每日分區 (沒有時回傳 False，由呼叫端以批次 DELETE 清理)。
+        """
+        stmt = text("""
+            SELECT PARTITION_NAME FROM information_schema.PARTITIONS
+            WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = 'ticks' AND PARTITION_NAME IS NOT NULL
+        """)
+        with self.get_session() as session:
+            names = [row[0] for row in session.execute(stmt)]
+        daily = sorted(name for name in names if len(name) == 9 and name[0] == 'p' and name[1:].isdigit())
+        if not daily: return False
+
+        cutoff_name = cutoff_date.strftime('p%Y%m%d')
+        for name in daily:
+            if name >= cutoff_name: break
+            with self.get_session() as session:
+                session.execute(text(f"ALTER TABLE ticks DROP PARTITION {name}"))
+            status["partitions_dropped"].append(name)
+            print(f"  已刪除 ticks 分區 {name}")
+        return True
+
+    def add_tick_partitions(self, days_ahead=7):
+        """為每日分區的 ticks 預先切出未來幾天的分區 (由 pmax 分割)，供 use_partitions 清理使用；失敗時只記錄，不中斷清理"""
+        stmt = text("""
+            SELECT PARTITION_NAME FROM information_schema.PARTITIONS
+            WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = 'ticks' AND PARTITION_NAME IS NOT NULL
+        """)
+        try:
+            with self.get_session() as session:
+                existing = {row[0] for row in session.execute(stmt)}
+                if 'pmax' not in existing:
+                    print("ticks 沒有 pmax 分區，無法自動新增每日分區。")
+                    return
+                new_parts = []
+                # 分區名與分區界線都以台北日期計算
+                today = datetime.now(TAIPEI_TZ).date()
+                for offset in range(days_ahead + 1):
+                    day = today + timedelta(days=offset)
+                    name = day.strftime('p%Y%m%d')
+                    if name in existing: continue
+                    upper_ts = taipei_day_start_ts(day + timedelta(days=1))
+                    new_parts.append(f"PARTITION {name} VALUES LESS THAN ({upper_ts})")
+                if not new_parts: return
+                session.execute(text(
+                    f"ALTER TABLE ticks REORGANIZE PARTITION pmax INTO ({', '.join(new_parts)}, "
+                    f"PARTITION pmax VALUES LESS THAN MAXVALUE)"))
+                print(f"已新增 {len(new_parts)} 個 ticks 每日分區。")
+        except SQLAlchemyError as e:
+            print(f"新增 ticks 分區時發生錯誤: {e}")
+
+    def _load_prune_status(self, cutoff_date_str, state_path):
+        status = self.prune_status
+        if state_path and os.path.exists(state_path):
+            try:
+                with open(state_path, encoding='utf-8') as f:
+                    status = json.load(f)
+            except (OSError, ValueError):
+                status = None
+        if status and status.get("cutoff_date") == cutoff_date_str and not status.get("finished"):
+            print(f"延續先前中斷的清理進度：已完成 {len(status['symbols_done'])} 檔。")
+            return status
+        return {"cutoff_date": cutoff_date_str, "symbols_done": [], "partitions_dropped": [],
+                "ticks_deleted": 0, "finished": False}
+
+    def _save_prune_status(self, status, state_path):
+        if not state_path: return
+        try:
+            with open(state_path, 'w', encoding='utf-8') as f:
+                json.dump(status, f)
+        except OSError as e:
+            print(f"無法寫入清理進度檔: {e}")
+
+
+class SQLiteDatabase(Database):
+    """嵌入式 SQLite 儲存後端 (WAL 模式)，供單機部署、開發與基準測試使用，不需要 MySQL
+
+    ticks 以 WITHOUT ROWID 建表，資料依主鍵 (symbol, ts_sec) 叢集存放，單檔單日的查詢為連續範圍掃描。
+    WAL 模式下讀取不會被輪詢器的寫入阻擋；不支援分區，use_partitions 會退回逐批刪除。
+    """
+
+    UPSERT_DAILY_META_SQL = """
+            INSERT INTO daily_meta(symbol, trade_date, day_open, day_high, day_low, prev_close, limit_up, limit_down, short_name, full_name, exchange)
+            VALUES (:symbol, :trade_date, :day_open, :day_high, :day_low, :prev_close, :limit_up, :limit_down, :short_name, :full_name, :exchange)
+            ON CONFLICT(symbol, trade_date) DO UPDATE SET
+                day_open = COALESCE(excluded.day_open, day_open),
+                day_high = COALESCE(excluded.day_high, day_high),
+                day_low = COALESCE(excluded.day_low, day_low),
+                prev_close = COALESCE(excluded.prev_close, prev_close),
+                limit_up = COALESCE(excluded.limit_up, limit_up),
+                limit_down = COALESCE(excluded.limit_down, limit_down),
+                short_name = excluded.short_name,
+                full_name = excluded.full_name,
+                exchange = excluded.exchange;
+        """
+
+    UPSERT_TICKS_SQL = """
+            INSERT INTO ticks(symbol, ts_sec, price, vol, best_bid, best_ask)
+            VALUES (?, ?, ?, ?, ?, ?)
+            ON CONFLICT(symbol, ts_sec) DO UPDATE SET
+                price = excluded.price,
+                vol = excluded.vol,
+                best_bid = excluded.best_bid,
+                best_ask = excluded.best_ask;
+        """
+
+    UPSERT_BARS_SQL = """
+            INSERT INTO bars_5m(symbol, trade_date, bar_ts, open, high, low, close, volume, vwap, buy_vol, sell_vol)
+            VALUES (:symbol, :trade_date, :bar_ts, :open, :high, :low, :close, :volume, :vwap, :buy_vol, :sell_vol)
+            ON CONFLICT(symbol, trade_date, bar_ts) DO UPDATE SET
+                open = excluded.open,
+                high = excluded.high,
+                low = excluded.low,
+                close = excluded.close,
+                volume = excluded.volume,
+                vwap = excluded.vwap,
+                buy_vol = excluded.buy_vol,
+                sell_vol = excluded.sell_vol;
+        """
+
+    SCHEMA_DDL = [
+        """
+            CREATE TABLE IF NOT EXISTS ticks (
+                symbol TEXT NOT NULL,
+                ts_sec INTEGER NOT NULL,
+                price REAL,
+                vol INTEGER,
+                best_bid REAL,
+                best_ask REAL,
+                PRIMARY KEY (symbol, ts_sec)
+            ) WITHOUT ROWID
+        """,
+        """
+            CREATE TABLE IF NOT EXISTS daily_meta (
+                symbol TEXT NOT NULL,
+                trade_date TEXT NOT NULL,
+                day_open REAL,
+                day_high REAL,
+                day_low REAL,
+                prev_close REAL,
+                limit_up REAL,
+                limit_down REAL,
+                short_name TEXT,
+                full_name TEXT,
+                exchange TEXT,
+                PRIMARY KEY (symbol, trade_date)
+            )
+        """,
+        """
+            CREATE TABLE IF NOT EXISTS bars_5m (
+                symbol TEXT NOT NULL,
+                trade_date TEXT NOT NULL,
+                bar_ts INTEGER NOT NULL,
+                open REAL NOT NULL,
+                high REAL NOT NULL,
+                low REAL NOT NULL,
+                close REAL NOT NULL,
+                volume INTEGER NOT NULL,
+                vwap REAL,
+                buy_vol INTEGER NOT NULL,
+                sell_vol INTEGER NOT NULL,
+                PRIMARY KEY (symbol, trade_date, bar_ts)
+            ) WITHOUT ROWID
+        """,
+        "CREATE INDEX IF NOT EXISTS idx_bars_5m_trade_date ON bars_5m (trade_date)",
+    ]
+
+    # 不是每個 SQLite 版本都編譯了 DELETE ... LIMIT，改以主鍵子查詢限制每批筆數
+    PRUNE_TICKS_SQL = """
+        DELETE FROM ticks WHERE symbol = :symbol AND ts_sec IN (
+            SELECT ts_sec FROM ticks WHERE symbol = :symbol AND ts_sec < :cutoff_ts ORDER BY ts_sec LIMIT :batch_size)
+    """
+    PRUNE_META_SQL = """
+        DELETE FROM daily_meta WHERE (symbol, trade_date) IN (
+            SELECT symbol, trade_date FROM daily_meta WHERE trade_date < :bar_cutoff_date_str LIMIT :batch_size)
+    """
+    PRUNE_BARS_SQL = """
+        DELETE FROM bars_5m WHERE (symbol, trade_date, bar_ts) IN (
+            SELECT symbol, trade_date, bar_ts FROM bars_5m WHERE trade_date < :bar_cutoff_date_str LIMIT :batch_size)
+    """
+    TICK_DAY_COUNTS_SQL = "SELECT (ts_sec + 28800) / 86400 AS day, COUNT(*) AS n FROM ticks GROUP BY day"
+
+    def _create_engine(self, db_url):
+        engine = create_engine(db_url, echo=False, connect_args={"check_same_thread": False, "timeout": 30})
+
+        @event.listens_for(engine, "connect")
+        def _set_pragmas(dbapi_conn, _):
+            cursor = dbapi_conn.cursor()
+            cursor.execute("PRAGMA journal_mode=WAL")
+            cursor.execute("PRAGMA synchronous=NORMAL")  # WAL 下 NORMAL 仍可保證一致性，只在斷電時可能遺失最後幾筆
+            cursor.execute("PRAGMA busy_timeout=30000")
+            cursor.close()
+
+        return engine
+
+    def _drop_tick_partitions(self, cutoff_date, status):
+        return False
+
+    def add_tick_partitions(self, days_ahead=7):
+        print("SQLite 不支援分區，略過新增 ticks 分區。")
+
+
+def create_database(db_url):
+    """依 DATABASE_URL 的 scheme 選擇儲存後端 (sqlite:/// 使用 SQLiteDatabase，其餘為 MySQL)"""
+    if db_url.startswith("sqlite"):
+        return SQLiteDatabase(db_url)
+    return Database(db_url)
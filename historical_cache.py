@@ -0,0 +1,97 @@
+import os
+import gzip
+import json
+import shutil
+import threading
+from collections import OrderedDict
+from datetime import date, datetime
+from decimal import Decimal
+
+
+def _json_default(obj):
+    if hasattr(obj, 'item'):  # numpy types
+        return obj.item()
+    if isinstance(obj, Decimal):
+        return float(obj)
+    if isinstance(obj, (date, datetime)):
+        return obj.isoformat()
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+
+class HistoricalSummaryCache:
+    """已收盤交易日的 summary 快取：記憶體 LRU + 可選的磁碟層 (每日一個資料夾，每檔一個 .json.gz)
+
+    歷史資料收盤後不再變動，因此只有在 Database.prune_old_data 刪除該日資料時才失效。
+    回傳的 dict 由多個請求共用，呼叫端不應修改。
+    """
+
+    def __init__(self, max_entries=512, disk_dir=None):
+        self.max_entries = max_entries
+        self.disk_dir = disk_dir
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = self.disk_hits = self.misses = 0
+        if disk_dir:
+            os.makedirs(disk_dir, exist_ok=True)
+
+    def _disk_path(self, symbol, date_str):
+        return os.path.join(self.disk_dir, date_str, f"{symbol}.json.gz")
+
+    def get(self, symbol, date_str):
+        key = (symbol, date_str)
+        with self._lock:
+            summary = self._entries.get(key)
+            if summary is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return summary
+
+        if self.disk_dir:
+            try:
+                with gzip.open(self._disk_path(symbol, date_str), 'rt', encoding='utf-8') as f:
+                    summary = json.load(f)
+            except (OSError, ValueError):
+                summary = None
+            if summary is not None:
+                self.disk_hits += 1
+                self._remember(key, summary)
+                return summary
+
+        self.misses += 1
+        return None
+
+    def put(self, symbol, date_str, summary):
+        self._remember((symbol, date_str), summary)
+        if not self.disk_dir: return
+
+        path = self._disk_path(symbol, date_str)
+        tmp_path = f"{path}.{threading.get_ident()}.tmp"
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with gzip.open(tmp_path, 'wt', encoding='utf-8') as f:
+                json.dump(summary, f, ensure_ascii=False, default=_json_default)
+            os.replace(tmp_path, path)
+        except (OSError, TypeError) as e:
+            print(f"寫入歷史快取檔案失敗 ({symbol} {date_str}): {e}")
+
+    def _remember(self, key, summary):
+        with self._lock:
+            self._entries[key] = summary
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def invalidate_before(self, cutoff_date_str):
+        """清除早於 cutoff 日期 (不含) 的快取，供 Database.prune_old_data 刪除資料後呼叫"""
+        with self._lock:
+            stale = [key for key in self._entries if key[1] < cutoff_date_str]
+            for key in stale:
+                del self._entries[key]
+
+        removed_dirs = 0
+        if self.disk_dir and os.path.isdir(self.disk_dir):
+            for name in os.listdir(self.disk_dir):
+                if name < cutoff_date_str:
+                    shutil.rmtree(os.path.join(self.disk_dir, name), ignore_errors=True)
+                    removed_dirs += 1
+        print(f"歷史快取已清除 {cutoff_date_str} 之前的資料 ({len(stale)} 筆記憶體, {removed_dirs} 個日期資料夾)。")
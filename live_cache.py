@@ -0,0 +1,69 @@
+import threading
+
+# 與 Database.bulk_upsert_daily_meta 的 COALESCE 語意一致：新值為 None 時保留舊值
+COALESCE_META_FIELDS = ("day_open", "day_high", "day_low", "prev_close", "limit_up", "limit_down")
+
+
+class SymbolSnapshot:
+    """單一股票某個時間點的盤中狀態快照 (建立後不再修改，可安全跨執行緒讀取)"""
+    __slots__ = ('trade_date', 'meta', 'bars', 'last_price', 'total_vol', 'bars_ready')
+
+    def __init__(self, trade_date, meta, bars, last_price, total_vol, bars_ready):
+        self.trade_date = trade_date
+        self.meta = meta
+        # 每根 K 棒: (start_ts, open, high, low, close, volume, vwap, buy_vol, sell_vol)
+        self.bars = bars
+        self.last_price = last_price
+        self.total_vol = total_vol
+        self.bars_ready = bars_ready
+
+
+def freeze_bar(bar):
+    return (bar.start_ts, bar.open, bar.high, bar.low, bar.close,
+            bar.volume, bar.vwap, bar.buy_vol, bar.sell_vol)
+
+
+class LiveCache:
+    """行程內共用的盤中狀態快取：輪詢執行緒寫入，/summary 讀取"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._snapshots = {}
+
+    def get(self, symbol, trade_date):
+        """取得指定交易日的快照；尚未暖機或日期不符時回傳 None"""
+        snapshot = self._snapshots.get(symbol)
+        if snapshot is None or snapshot.trade_date != trade_date or not snapshot.bars_ready:
+            return None
+        return snapshot
+
+    def discard(self, symbol):
+        """移除某檔股票的快照，之後 /summary 改由 DB 查詢"""
+        with self._lock:
+            self._snapshots.pop(symbol, None)
+
+    def publish(self, symbol, trade_date, meta=None, builder=None):
+        """更新某檔股票的 meta 及/或 K 棒，以新的快照整個替換舊快照"""
+        with self._lock:
+            prev = self._snapshots.get(symbol)
+            if prev is not None and prev.trade_date != trade_date:
+                prev = None
+
+            merged_meta = dict(prev.meta) if prev else {}
+            if meta:
+                for key, value in meta.items():
+                    if value is None and key in COALESCE_META_FIELDS and key in merged_meta: continue
+                    merged_meta[key] = value
+
+            if builder is not None:
+                # 已完成的 K 棒不會再變動，沿用上一份快照中已凍結的部分
+                n_done = len(builder.bars) - 1
+                reused = prev.bars[:max(0, min(len(prev.bars) - 1, n_done))] if prev else ()
+                bars = reused + tuple(freeze_bar(bar) for bar in builder.bars[len(reused):])
+                last_price, total_vol, bars_ready = builder.last_price, builder.total_vol, True
+            elif prev is not None:
+                bars, last_price, total_vol, bars_ready = prev.bars, prev.last_price, prev.total_vol, prev.bars_ready
+            else:
+                bars, last_price, total_vol, bars_ready = (), None, 0, False
+
+            self._snapshots[symbol] = SymbolSnapshot(trade_date, merged_meta, bars, last_price, total_vol, bars_ready)
@@ -4,6 +4,7 @@ import threading
 import time
 import uvicorn
 from fastapi import FastAPI, HTTPException, Header, Depends
+from fastapi.responses import StreamingResponse, PlainTextResponse
 from pydantic import BaseModel, Field
 from typing import Optional
 from dotenv import load_dotenv
@@ -16,9 +17,19 @@ if current_path not in sys.path:
 # --- GPS 導航結束 ---
 
 # 載入我們原有的商業邏輯
-from database import Database
-from poller import Poller
+from database import create_database
+from poller import Poller, N8N_WEBHOOK_URL
 from services import SummaryService
+from live_cache import LiveCache
+from historical_cache import HistoricalSummaryCache
+from concurrency import CoalescingExecutor
+from writer import WriteBehindWriter
+from archive import TickArchive, backfill_archive
+from streaming import EventBroker
+from notifier import NotificationDispatcher
+from metrics import REGISTRY
+from scheduler import TradingCalendar
+from coordination import Coordinator
 
 # 讀取 .env 檔案中的環境變數 (主要用於本機)
 load_dotenv()
@@ -44,6 +55,9 @@ app = FastAPI(
 - `/config`: 動態更新輪詢設定
 - `/summary`: 查詢指定股票**當日**的即時行情
 - `/summary/historical`: 查詢指定股票在**特定歷史日期**的行情
+- `/summary/batch`: 一次查詢多檔股票的行情 (可指定日期)
+- `/stream`: 以 Server-Sent Events 訂閱多檔股票的盤中 K 棒與成交推播
+- `/metrics`: Prometheus 格式的效能指標 (各階段耗時、輪詢延遲、DB / webhook / summary 延遲)
     """,
     version="7.0.0"
 )
@@ -59,6 +73,17 @@ poller_config = {
     'enabled': os.environ.get('POLLER_ENABLED', 'true').lower() == 'true',
     'symbols': process_symbols(initial_symbols), # 在啟動時就進行轉換
     'poll_seconds': int(os.environ.get('POLLER_SECONDS', 5)),
+    # 每個 MIS 請求最多帶幾檔 (ex_ch 分段)，以及併發抓取的執行緒數
+    'chunk_size': int(os.environ.get('POLLER_CHUNK_SIZE', 50)),
+    'fetch_workers': int(os.environ.get('POLLER_FETCH_WORKERS', 4)),
+    # 啟用的訊號規則 (逗號分隔)：v_shape, breakout, volume_spike, vwap_cross
+    'signal_rules': os.environ.get('SIGNAL_RULES', 'v_shape'),
+    # 設定時把每輪原始 msgArray 記錄到此資料夾 (每日一個 .jsonl)，供 replay.py 重播
+    'record_dir': os.environ.get('POLLER_RECORD_DIR') or None,
+    # 盤前試撮 (08:30~09:00) 與收盤集合競價 (13:25~13:30) 的輪詢間隔
+    'auction_poll_seconds': float(os.environ.get('POLLER_AUCTION_SECONDS', 2)),
+    # 盤中報價久未變動的股票最多每幾輪才抓一次；預設 1 = 每輪都抓全部股票，大於 1 (例如 4) 時才啟用自適應略過
+    'adaptive_max_skip': int(os.environ.get('POLLER_ADAPTIVE_MAX_SKIP', 1)),
 }
 ADMIN_TOKEN = os.environ.get('ADMIN_TOKEN', 'your-secret-token')
 
@@ -68,21 +93,113 @@ if not db_url:
     print("錯誤：DATABASE_URL 環境變數未設定。")
     sys.exit(1)
 
-db = Database(db_url)
-summary_service = SummaryService(db)
+# DATABASE_URL 為 sqlite:///path.db 時使用嵌入式 SQLite (WAL)，否則為 MySQL
+db = create_database(db_url)
+db.ensure_schema()
+# 行程內共用的盤中快取：輪詢器寫入、/summary 讀取
+live_cache = LiveCache()
+# 歷史日期的 summary 快取 (HISTORICAL_CACHE_DIR 有設定時另存壓縮檔於磁碟)
+historical_cache = HistoricalSummaryCache(
+    max_entries=int(os.environ.get('HISTORICAL_CACHE_SIZE', 512)),
+    disk_dir=os.environ.get('HISTORICAL_CACHE_DIR') or None,
+)
+db.prune_listeners.append(historical_cache.invalidate_before)
+# 已收盤日期的 ticks 欄位式封存 (ARCHIVE_DIR 有設定時啟用)，歷史查詢以 mmap 讀取，不再掃描 DB
+archive_dir = os.environ.get('ARCHIVE_DIR')
+tick_archive = TickArchive(archive_dir) if archive_dir else None
+summary_service = SummaryService(db, live_cache, historical_cache, tick_archive)
+# 輪詢資料先進 write-behind 緩衝區，由專屬執行緒合併多輪後批次寫入 DB
+writer = WriteBehindWriter(
+    db,
+    flush_rows=int(os.environ.get('WRITER_FLUSH_ROWS', 2000)),
+    flush_seconds=float(os.environ.get('WRITER_FLUSH_SECONDS', 1.0)),
+    max_pending_rows=int(os.environ.get('WRITER_MAX_PENDING_ROWS', 50000)),
+) if os.environ.get('WRITE_BEHIND', 'true').lower() == 'true' else None
+# /stream 的一對多推播：輪詢器發佈，各 SSE 連線各自一個有上限的佇列
+event_broker = EventBroker(max_queue=int(os.environ.get('STREAM_MAX_QUEUE', 1000)))
+# 訊號通知在背景佇列發送 (重試失敗的寫入 NOTIFY_DEAD_LETTER_FILE)，輪詢執行緒不等待 webhook
+notifier = NotificationDispatcher(
+    os.environ.get('N8N_WEBHOOK_URL', N8N_WEBHOOK_URL),
+    workers=int(os.environ.get('NOTIFY_WORKERS', 2)),
+    batch_size=int(os.environ.get('NOTIFY_BATCH_SIZE', 1)),
+    max_retries=int(os.environ.get('NOTIFY_MAX_RETRIES', 3)),
+    backoff_seconds=float(os.environ.get('NOTIFY_BACKOFF_SECONDS', 1.0)),
+    dead_letter_path=os.environ.get('NOTIFY_DEAD_LETTER_FILE') or None,
+)
+# /summary 系列端點的阻塞查詢改在獨立、有上限的執行緒池執行，避免佔滿 FastAPI 預設執行緒池
+summary_executor = CoalescingExecutor(max_workers=int(os.environ.get('SUMMARY_CONCURRENCY', 8)))
+
+# 多個 worker / 副本同時執行時 (POLLER_COORDINATION=true)，以 DB 心跳分配股票分片，清理與收盤彙總由取得租約的實例執行
+# 其他實例負責的股票由 DB 追上，任一 worker 都能回應 /summary 與 /stream (比負責的實例晚約一個輪詢間隔)
+coordinator = Coordinator(
+    db,
+    node_id=os.environ.get('POLLER_NODE_ID') or None,
+    heartbeat_seconds=float(os.environ.get('POLLER_HEARTBEAT_SECONDS', 5)),
+    ttl_seconds=float(os.environ.get('POLLER_NODE_TTL_SECONDS', 20)),
+) if os.environ.get('POLLER_COORDINATION', 'false').lower() == 'true' else None
+
+# /metrics 輸出前，把各元件 metrics() 中的數值寫入 component_stat 量表
+component_stat = REGISTRY.gauge("component_stat", "Numeric stats reported by internal components.", ["component", "stat"])
+
+def collect_component_metrics():
+    components = {"write_behind": writer.metrics() if writer else {}, "notifier": notifier.metrics(),
+                  "stream": event_broker.metrics(), "summary_executor": summary_executor.stats(),
+                  "change_filter": poller.change_filter.stats if poller else {},
+                  "coordination": coordinator.stats() if coordinator else {}}
+    for component, stats in components.items():
+        for stat, value in stats.items():
+            if isinstance(value, (int, float)) and not isinstance(value, bool):
+                component_stat.set(value, component=component, stat=stat)
+
+REGISTRY.add_collector(collect_component_metrics)
 
 # --- 背景任務 ---
+def prune_once():
+    use_partitions = os.environ.get('PRUNE_USE_PARTITIONS', 'false').lower() == 'true'
+    if use_partitions:
+        db.add_tick_partitions(days_ahead=7)
+    if tick_archive is not None:
+        # 刪除 ticks 前先補齊尚未封存的已收盤日期
+        try:
+            backfill_archive(db, tick_archive)
+            tick_archive.prune(int(os.environ.get('ARCHIVE_DAYS_TO_KEEP', 730)))
+        except Exception as e:
+            print(f"封存 ticks 時發生錯誤: {e}")
+    db.prune_old_data(
+        days_to_keep=60,
+        bar_days_to_keep=int(os.environ.get('BARS_DAYS_TO_KEEP', 730)),
+        batch_size=int(os.environ.get('PRUNE_BATCH_SIZE', 5000)),
+        pause_seconds=float(os.environ.get('PRUNE_PAUSE_SECONDS', 0.2)),
+        use_partitions=use_partitions,
+        state_path=os.environ.get('PRUNE_STATE_FILE') or None,
+    )
+
 def run_pruner():
     """定期清理舊資料的背景任務"""
     while True:
-        db.prune_old_data(days_to_keep=60)
-        # 睡 24 小時
-        time.sleep(86400)
+        # 任何錯誤都只記錄，不能讓背景執行緒結束而永久停止清理
+        try:
+            # 協調模式下每小時嘗試取得為期 24 小時的租約：整個叢集每天只有一個實例執行清理
+            if coordinator is None or coordinator.try_acquire("pruner", 86400, renew=False):
+                prune_once()
+        except Exception as e:
+            print(f"清理舊資料時發生錯誤: {e}")
+        # 單一實例時睡 24 小時
+        time.sleep(3600 if coordinator is not None else 86400)
+
+poller = None
 
 @app.on_event("startup")
 def startup_event():
+    global poller
     # *** 核心修改：將 summary_service 注入 Poller ***
-    poller = Poller(poller_config, db, summary_service)
+    # 休市日由 TWSE_HOLIDAYS (逗號分隔 YYYY-MM-DD) 或 TWSE_HOLIDAYS_FILE 提供，週末一律不輪詢
+    calendar = TradingCalendar.from_env()
+    print(f"交易日曆：已載入 {len(calendar.holidays)} 個休市日。")
+    if coordinator is not None:
+        coordinator.start()
+    poller = Poller(poller_config, db, summary_service, live_cache, writer, tick_archive, event_broker, notifier,
+                    calendar, coordinator)
     poller_thread = threading.Thread(target=poller.run, daemon=True)
     poller_thread.start()
     print("背景輪詢器已啟動。")
@@ -91,11 +208,21 @@ def startup_event():
     pruner_thread.start()
     print("背景資料清理器已啟動 (每 24 小時執行一次)。")
 
+@app.on_event("shutdown")
+def shutdown_event():
+    summary_executor.shutdown()
+    notifier.close()
+    if writer is not None:
+        writer.close()
+    if coordinator is not None:
+        coordinator.stop()
+
 # --- API 端點 (Endpoints) ---
 class ConfigModel(BaseModel):
     enabled: Optional[bool] = None
     symbols: Optional[str] = None # API 接收的仍然是逗號分隔的字串
     poll_seconds: Optional[int] = Field(None, gt=0)
+    chunk_size: Optional[int] = Field(None, gt=0)
 
 async def verify_token(x_admin_token: str = Header(...)):
     if x_admin_token != ADMIN_TOKEN:
@@ -103,7 +230,25 @@ async def verify_token(x_admin_token: str = Header(...)):
 
 @app.get("/")
 def health_check():
-    return {"status": "ok", "poller_config": poller_config}
+    poller_stats = {
+        "last_cycle": poller.last_cycle_stats, "cycles": poller.cycle_count,
+        "over_budget_cycles": poller.over_budget_count,
+        "change_filter": poller.change_filter.stats,
+        "skipped_ticks": poller.ticker.skipped,
+        "adaptive_polling": poller.symbol_scheduler.stats(),
+        "coordination": dict(coordinator.stats(), owned_symbols=len(poller.owned_codes or ())) if coordinator else None,
+    } if poller else None
+    return {"status": "ok", "poller_config": poller_config, "poller_stats": poller_stats,
+            "write_behind": writer.metrics() if writer else None,
+            "prune_status": db.prune_status,
+            "tick_archive": tick_archive.stats() if tick_archive else None,
+            "stream": event_broker.metrics(),
+            "notifier": notifier.metrics(),
+            "summary_executor": summary_executor.stats()}
+
+@app.get("/metrics", response_class=PlainTextResponse)
+def metrics():
+    return PlainTextResponse(REGISTRY.render(), media_type="text/plain; version=0.0.4")
 
 @app.put("/config", dependencies=[Depends(verify_token)])
 def update_config(config: ConfigModel):
@@ -114,19 +259,24 @@ def update_config(config: ConfigModel):
         poller_config['symbols'] = process_symbols(config.symbols)
     if config.poll_seconds is not None:
         poller_config['poll_seconds'] = config.poll_seconds
+    if config.chunk_size is not None:
+        poller_config['chunk_size'] = config.chunk_size
     print(f"設定已更新: {poller_config}")
     return {"status": "success", "new_config": poller_config}
 
 @app.get("/summary")
-def get_summary(symbol: str):
+async def get_summary(symbol: str):
     if not symbol:
         raise HTTPException(status_code=400, detail="Query parameter 'symbol' is required.")
     clean_symbol = symbol.split('.')[0]
-    summary_data = summary_service.get_summary(clean_symbol)
+    # 快取命中時直接在事件迴圈回應，未命中才交給執行緒池查 DB
+    summary_data = summary_service.get_live_summary(clean_symbol)
+    if summary_data is None:
+        summary_data = await summary_executor.run(("summary", clean_symbol), summary_service.get_summary, clean_symbol)
     return summary_data
 
 @app.get("/summary/historical")
-def get_historical_summary(symbol: str, date: str):
+async def get_historical_summary(symbol: str, date: str):
     """查詢歷史日期的行情摘要"""
     if not symbol or not date:
         raise HTTPException(status_code=400, detail="Query parameters 'symbol' and 'date' are required.")
@@ -138,9 +288,46 @@ def get_historical_summary(symbol: str, date: str):
         raise HTTPException(status_code=400, detail="Invalid date format. Please use YYYY-MM-DD.")
 
     clean_symbol = symbol.split('.')[0]
-    summary_data = summary_service.get_historical_summary(clean_symbol, date)
+    summary_data = await summary_executor.run(("historical", clean_symbol, date),
+                                              summary_service.get_historical_summary, clean_symbol, date)
     return summary_data
 
+MAX_BATCH_SYMBOLS = int(os.environ.get('MAX_BATCH_SYMBOLS', 200))
+
+def parse_symbol_list(symbols: str):
+    # 去除 .TW 等後綴並去重，保留原本順序
+    clean_symbols = list(dict.fromkeys(s.strip().split('.')[0] for s in symbols.split(',') if s.strip()))
+    if not clean_symbols:
+        raise HTTPException(status_code=400, detail="Query parameter 'symbols' is required.")
+    if len(clean_symbols) > MAX_BATCH_SYMBOLS:
+        raise HTTPException(status_code=400, detail=f"At most {MAX_BATCH_SYMBOLS} symbols per request.")
+    return clean_symbols
+
+@app.get("/summary/batch")
+async def get_batch_summary(symbols: str, date: Optional[str] = None):
+    """一次查詢多檔股票的行情摘要 (symbols 以逗號分隔)，回傳以股票代號為 key 的結果"""
+    clean_symbols = parse_symbol_list(symbols)
+    if date is not None:
+        try:
+            datetime.strptime(date, '%Y-%m-%d')
+        except ValueError:
+            raise HTTPException(status_code=400, detail="Invalid date format. Please use YYYY-MM-DD.")
+
+    return await summary_executor.run(("batch", tuple(clean_symbols), date),
+                                      summary_service.get_batch_summary, clean_symbols, date)
+
+@app.get("/stream")
+async def stream(symbols: str):
+    """以 Server-Sent Events 訂閱多檔股票 (symbols 以逗號分隔)
+
+    連線後先收到每檔的 snapshot (與 /summary 相同格式，尚未暖機時為 null)，
+    之後每輪輪詢收到 tick (新成交) 與 bar (變動的 5 分 K，final 表示已完成) 事件。
+    """
+    clean_symbols = parse_symbol_list(symbols)
+    return StreamingResponse(event_broker.stream(clean_symbols, summary_service.get_live_summary),
+                             media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
 # --- 本機測試啟動點 ---
 if __name__ == "__main__":
     print("正在以 uvicorn 啟動伺服器...")
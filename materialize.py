@@ -0,0 +1,83 @@
+"""收盤後將當日 ticks 彙總寫入 bars_5m，並提供回補既有 ticks 的命令列工具
+
+    python materialize.py --date 2025-01-02     # 指定日期
+    python materialize.py --backfill            # ticks 表中仍保留的所有日期
+"""
+import os
+import sys
+import argparse
+import numpy as np
+import pandas as pd
+from datetime import datetime, timedelta
+from sqlalchemy import text
+from bars import aggregate_5m_grouped
+from utils import taipei_day_start_ts, TAIPEI_TZ
+
+
+def build_bar_records(date_str, ticks_df):
+    """以 aggregate_5m_grouped 一次計算所有股票的 5 分 K，只保留有成交的K棒"""
+    symbols = list(pd.unique(ticks_df['symbol']))
+    codes = pd.Categorical(ticks_df['symbol'], categories=symbols).codes.astype(np.int64)
+    bars, offsets = aggregate_5m_grouped(codes, len(symbols), ticks_df['ts_sec'].to_numpy(), ticks_df['price'].to_numpy(),
+                                         ticks_df['vol'].to_numpy(), ticks_df['best_bid'].to_numpy(), ticks_df['best_ask'].to_numpy())
+    bar_symbols = np.repeat(np.array(symbols, dtype=object), np.diff(offsets))
+    traded = np.flatnonzero(~np.isnan(bars["open"]))
+    vwap = bars["vwap"]
+    return [{
+        "symbol": bar_symbols[i], "trade_date": date_str, "bar_ts": int(bars["start_ts"][i]),
+        "open": float(bars["open"][i]), "high": float(bars["high"][i]),
+        "low": float(bars["low"][i]), "close": float(bars["close"][i]),
+        "volume": int(bars["volume"][i]),
+        "vwap": float(vwap[i]) if np.isfinite(vwap[i]) else None,
+        "buy_vol": int(bars["buy_vol"][i]), "sell_vol": int(bars["sell_vol"][i]),
+    } for i in traded]
+
+
+def materialize_bars(db, date_str):
+    """讀取指定日期所有股票的 ticks，彙總後一次批次寫入 bars_5m，回傳寫入筆數"""
+    start_ts = taipei_day_start_ts(datetime.strptime(date_str, '%Y-%m-%d').date())
+    ticks_df = db.read_ticks(None, start_ts, start_ts + 86399)
+
+    records = build_bar_records(date_str, ticks_df) if not ticks_df.empty else []
+    db.bulk_upsert_bars(records)
+    print(f"{date_str} 5 分 K 彙總完成，共 {ticks_df['symbol'].nunique()} 檔 {len(records)} 根。")
+    return len(records)
+
+
+def backfill_bars(db):
+    """替 ticks 表中仍保留的每一個日期補建 bars_5m"""
+    with db.get_session() as session:
+        min_ts, max_ts = session.execute(text("SELECT MIN(ts_sec), MAX(ts_sec) FROM ticks")).fetchone()
+    if min_ts is None:
+        print("ticks 表沒有資料，無需回補。")
+        return
+
+    day = datetime.fromtimestamp(min_ts, TAIPEI_TZ).date()
+    last_day = datetime.fromtimestamp(max_ts, TAIPEI_TZ).date()
+    while day <= last_day:
+        materialize_bars(db, day.strftime('%Y-%m-%d'))
+        day += timedelta(days=1)
+
+
+if __name__ == "__main__":
+    from dotenv import load_dotenv
+    from database import create_database
+
+    parser = argparse.ArgumentParser(description="彙總 ticks 為 bars_5m")
+    group = parser.add_mutually_exclusive_group(required=True)
+    group.add_argument("--date", help="要彙總的交易日 (YYYY-MM-DD)")
+    group.add_argument("--backfill", action="store_true", help="回補 ticks 表中所有日期")
+    args = parser.parse_args()
+
+    load_dotenv()
+    db_url = os.environ.get('DATABASE_URL')
+    if not db_url:
+        print("錯誤：DATABASE_URL 環境變數未設定。")
+        sys.exit(1)
+
+    db = create_database(db_url)
+    db.ensure_schema()
+    if args.backfill:
+        backfill_bars(db)
+    else:
+        materialize_bars(db, args.date)
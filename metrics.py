@@ -0,0 +1,200 @@
+"""行程內的效能指標 (計數器、量表、直方圖)，以 Prometheus 文字格式由 /metrics 輸出
+
+不依賴 prometheus_client：每個指標以 dict[標籤值 tuple] 保存數值，更新時持有該指標自己的鎖，
+輪詢、寫入與通知執行緒都可以直接呼叫。熱點程式以 timed() 量測耗時：
+
+    with timed(STAGE_SECONDS, stage="fetch"):
+        ...
+
+    @timed(SUMMARY_SECONDS, method="get_summary")
+    def get_summary(self, symbol): ...
+"""
+import math
+import time
+import threading
+from contextlib import ContextDecorator
+
+# 秒；涵蓋單次 upsert (毫秒級) 到整輪輪詢 (數秒)
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def _format_value(value):
+    if value == math.inf: return "+Inf"
+    if float(value).is_integer(): return str(int(value))
+    return repr(float(value))
+
+
+def _format_labels(names, values, extra=()):
+    pairs = list(zip(names, values)) + list(extra)
+    if not pairs: return ""
+    escaped = (str(v).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for _, v in pairs)
+    return "{" + ",".join(f'{k}="{v}"' for (k, _), v in zip(pairs, escaped)) + "}"
+
+
+class _Metric:
+    kind = None
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        self._values = {}
+
+    def _key(self, labels):
+        if len(labels) != len(self.labelnames):
+            raise ValueError(f"{self.name} 需要標籤 {self.labelnames}，收到 {tuple(labels)}")
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        with self._lock:
+            items = sorted(self._values.items())
+        lines.extend(self._render_samples(items))
+        return lines
+
+    def _render_samples(self, items):
+        return [f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}" for key, value in items]
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+
+class Gauge(_Metric):
+    kind = "gauge"
+
+    def set(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+
+class Histogram(_Metric):
+    """累積式 bucket；每組標籤保存 [各 bucket 計數..., 總和, 次數]"""
+    kind = "histogram"
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                state = self._values[key] = [0] * (len(self.buckets) + 2)
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    state[i] += 1
+                    break
+            state[-2] += value
+            state[-1] += 1
+
+    def _render_samples(self, items):
+        lines = []
+        for key, state in items:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (math.inf,), state[:-2] + [state[-1] - sum(state[:-2])]):
+                cumulative += count
+                le = (("le", _format_value(bound)),)
+                lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, key, le)} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(self.labelnames, key)} {_format_value(state[-2])}")
+            lines.append(f"{self.name}_count{_format_labels(self.labelnames, key)} {state[-1]}")
+        return lines
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self._metrics = {}
+        self._collectors = []
+        self._lock = threading.Lock()
+
+    def _register(self, metric):
+        with self._lock:
+            existing = self._metrics.get(metric.name)
+            if existing is not None: return existing
+            self._metrics[metric.name] = metric
+            return metric
+
+    def counter(self, name, documentation, labelnames=()):
+        return self._register(Counter(name, documentation, labelnames))
+
+    def gauge(self, name, documentation, labelnames=()):
+        return self._register(Gauge(name, documentation, labelnames))
+
+    def histogram(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        return self._register(Histogram(name, documentation, labelnames, buckets))
+
+    def add_collector(self, fn):
+        """fn 在每次輸出前被呼叫，用來把其他元件的 metrics() 數值寫入量表"""
+        self._collectors.append(fn)
+
+    def render(self):
+        for fn in self._collectors:
+            try:
+                fn()
+            except Exception as e:
+                print(f"收集指標時發生錯誤: {e}")
+        with self._lock:
+            metrics = list(self._metrics.values())
+        lines = []
+        for metric in metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+class timed(ContextDecorator):
+    """量測區塊或函式的耗時 (秒) 並記錄到直方圖；例外時同樣記錄"""
+
+    def __init__(self, histogram, **labels):
+        self.histogram = histogram
+        self.labels = labels
+        self._local = threading.local()
+
+    def __enter__(self):
+        # 同一個裝飾器物件可能被多個執行緒同時進入
+        starts = getattr(self._local, "starts", None)
+        if starts is None: starts = self._local.starts = []
+        starts.append(time.perf_counter())
+        return self
+
+    def __exit__(self, *exc):
+        self.histogram.observe(time.perf_counter() - self._local.starts.pop(), **self.labels)
+        return False
+
+
+REGISTRY = MetricsRegistry()
+
+# --- 輪詢器 ---
+STAGE_SECONDS = REGISTRY.histogram(
+    "poller_stage_seconds", "Time spent in each poll-cycle stage.", ["stage"])
+CYCLE_SECONDS = REGISTRY.histogram(
+    "poller_cycle_seconds", "Wall time of a full poll cycle.",
+    buckets=(0.05, 0.1, 0.25, 0.5, 1.0, 2.0, 3.0, 4.0, 5.0, 7.5, 10.0, 15.0, 30.0))
+CYCLE_LAG_SECONDS = REGISTRY.gauge(
+    "poller_cycle_lag_seconds", "Last cycle duration minus poll_seconds (positive means the budget was exceeded).")
+CYCLE_BUDGET_SECONDS = REGISTRY.gauge("poller_cycle_budget_seconds", "Configured poll_seconds.")
+CYCLES_TOTAL = REGISTRY.counter("poller_cycles_total", "Poll cycles run.")
+OVER_BUDGET_TOTAL = REGISTRY.counter("poller_over_budget_cycles_total", "Poll cycles that took longer than poll_seconds.")
+FETCH_CHUNKS_TOTAL = REGISTRY.counter("poller_fetch_chunks_total", "MIS requests by outcome.", ["outcome"])
+MESSAGES_TOTAL = REGISTRY.counter("poller_messages_total", "msgArray entries processed.")
+TICKS_TOTAL = REGISTRY.counter("poller_ticks_total", "New ticks written or submitted to the write-behind buffer.")
+SIGNALS_TOTAL = REGISTRY.counter("poller_signals_total", "Signals fired.", ["rule"])
+
+# --- DB ---
+DB_SECONDS = REGISTRY.histogram("db_upsert_seconds", "Time spent in bulk upserts.", ["table"])
+DB_ROWS_TOTAL = REGISTRY.counter("db_upsert_rows_total", "Rows passed to bulk upserts.", ["table"])
+DB_ERRORS_TOTAL = REGISTRY.counter("db_upsert_errors_total", "Failed bulk upserts.", ["table"])
+
+# --- 通知 ---
+WEBHOOK_SECONDS = REGISTRY.histogram(
+    "notifier_request_seconds", "Webhook POST latency by outcome.", ["outcome"])
+
+# --- SummaryService ---
+SUMMARY_SECONDS = REGISTRY.histogram("summary_seconds", "SummaryService call latency.", ["method"])
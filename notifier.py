@@ -0,0 +1,145 @@
+import json
+import time
+import queue
+import threading
+import requests
+from datetime import datetime
+from requests.adapters import HTTPAdapter
+from metrics import WEBHOOK_SECONDS
+
+
+class LazyPayload:
+    """在 worker 執行緒中才組裝的通知內容；stub 為組裝前即可取得的摘要，無法送出或組裝失敗時寫入 dead-letter"""
+
+    def __init__(self, build, stub):
+        self.build = build
+        self.stub = stub
+
+    def __call__(self):
+        return self.build()
+
+
+class NotificationDispatcher:
+    """webhook 通知的背景發送佇列：輪詢執行緒只負責 submit，發送、重試與失敗記錄都在專屬執行緒中進行
+
+    - 每個 worker 各自一個 keep-alive 的 requests.Session
+    - batch_size > 1 時，佇列中累積的多則通知會合併成一個 JSON 陣列送出 (接收端需支援陣列)
+    - 連線錯誤、逾時、429 與 5xx 以指數退避重試 max_retries 次；仍失敗或 4xx 時寫入 dead-letter 檔 (JSON Lines)
+    - 佇列已滿時直接寫入 dead-letter，不阻塞呼叫端
+    """
+
+    def __init__(self, url, workers=2, batch_size=1, max_queue=1000, max_retries=3, backoff_seconds=1.0,
+                 timeout=5, dead_letter_path=None):
+        self.url = url
+        self.batch_size = max(1, batch_size)
+        self.max_retries = max_retries
+        self.backoff_seconds = backoff_seconds
+        self.timeout = timeout
+        self.dead_letter_path = dead_letter_path
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._dead_letter_lock = threading.Lock()
+        self._stats_lock = threading.Lock()
+        self.stats = {"submitted": 0, "sent": 0, "requests": 0, "retries": 0, "dead_lettered": 0, "queue_full": 0}
+        self._workers = [threading.Thread(target=self._run, name=f'notifier-{i}', daemon=True)
+                         for i in range(max(1, workers))]
+        for worker in self._workers: worker.start()
+
+    def submit(self, payload):
+        """payload 為 dict，或在 worker 執行緒中才呼叫以產生 dict 的 LazyPayload (延後較耗時的組裝)"""
+        try:
+            self._queue.put_nowait(payload)
+        except queue.Full:
+            self._count("queue_full")
+            self._dead_letter([payload], "queue full")
+            return False
+        self._count("submitted")
+        return True
+
+    def close(self, timeout=10):
+        """送出佇列中剩餘的通知後停止 worker"""
+        for _ in self._workers:
+            try:
+                self._queue.put(None, timeout=timeout)
+            except queue.Full:
+                break
+        deadline = time.monotonic() + timeout
+        for worker in self._workers:
+            worker.join(max(0, deadline - time.monotonic()))
+
+    def metrics(self):
+        with self._stats_lock:
+            return dict(self.stats, pending=self._queue.qsize())
+
+    def _count(self, key, n=1):
+        with self._stats_lock:
+            self.stats[key] += n
+
+    def _run(self):
+        session = requests.Session()
+        session.mount('https://', HTTPAdapter(pool_connections=1, pool_maxsize=1))
+        session.mount('http://', HTTPAdapter(pool_connections=1, pool_maxsize=1))
+        while True:
+            item = self._queue.get()
+            if item is None: return
+            batch = [item]
+            stop = False
+            while len(batch) < self.batch_size:
+                try:
+                    item = self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                if item is None:
+                    stop = True
+                    break
+                batch.append(item)
+
+            payloads = []
+            for item in batch:
+                try:
+                    payloads.append(item() if callable(item) else item)
+                except Exception as e:
+                    print(f"組裝通知內容失敗: {e}")
+                    self._dead_letter([item], f"build failed: {e}")
+            if payloads:
+                self._send(session, payloads)
+            if stop: return
+
+    def _send(self, session, payloads):
+        body = payloads[0] if self.batch_size == 1 else payloads
+        error = None
+        for attempt in range(self.max_retries + 1):
+            if attempt:
+                self._count("retries")
+                time.sleep(self.backoff_seconds * (2 ** (attempt - 1)))
+            self._count("requests")
+            started = time.perf_counter()
+            try:
+                res = session.post(self.url, json=body, timeout=self.timeout)
+            except requests.RequestException as e:
+                WEBHOOK_SECONDS.observe(time.perf_counter() - started, outcome="error")
+                error = str(e)
+                continue
+            WEBHOOK_SECONDS.observe(time.perf_counter() - started, outcome="ok" if res.ok else f"{res.status_code // 100}xx")
+            if res.ok:
+                self._count("sent", len(payloads))
+                return True
+            error = f"HTTP {res.status_code}"
+            if res.status_code != 429 and res.status_code < 500:
+                break  # 其他 4xx 重試也不會成功
+        print(f"發送通知失敗 ({len(payloads)} 則): {error}")
+        self._dead_letter(payloads, error)
+        return False
+
+    def _dead_letter(self, payloads, error):
+        self._count("dead_lettered", len(payloads))
+        if not self.dead_letter_path: return
+        try:
+            with self._dead_letter_lock, open(self.dead_letter_path, 'a', encoding='utf-8') as f:
+                for payload in payloads:
+                    if callable(payload):
+                        # 尚未組裝的通知只記錄摘要，不在此處呼叫 (可能很耗時或正是失敗原因)
+                        payload = {"unbuilt": True, **getattr(payload, "stub", {"repr": repr(payload)})}
+                    f.write(json.dumps({"failed_at": datetime.now().isoformat(timespec='seconds'), "error": error,
+                                        "url": self.url, "payload": payload}, ensure_ascii=False, default=str) + "\n")
+        except OSError as e:
+            print(f"無法寫入 dead-letter 檔: {e}")
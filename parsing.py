@@ -0,0 +1,75 @@
+"""msgArray 解析的精簡路徑
+
+- 先以 MIS 回傳的原始字串 (tlong、z、tv、v 與 meta 欄位) 和上一輪比對，沒有變動的股票不做任何數值轉換，也不建立 dict
+- 新成交以 Tick (NamedTuple，欄位順序與 ticks 資料表相同) 表示，可直接作為 DBAPI executemany 的位置參數
+- 數值直接交給 float() / int() 轉換 (兩者本身即會略過前後空白)，"-" 或空字串等無法轉換的值為 None
+"""
+from typing import NamedTuple, Optional
+
+
+class Tick(NamedTuple):
+    symbol: str
+    ts_sec: int
+    price: float
+    vol: int
+    best_bid: Optional[float]
+    best_ask: Optional[float]
+
+
+TICK_COLUMNS = Tick._fields
+
+
+def parse_px(s):
+    """MIS 價格字串 -> float；"-"、空字串或 None 回傳 None"""
+    try:
+        return float(s)
+    except (ValueError, TypeError):
+        return None
+
+
+def parse_qty(s):
+    """MIS 張數字串 -> int (無法轉換時為 0)"""
+    try:
+        return int(s)
+    except (ValueError, TypeError):
+        px = parse_px(s)
+        return int(px) if px is not None else 0
+
+
+def first_level(levels):
+    """五檔字串 "101.5_101_100.5_" 的第一檔"""
+    if not levels or not isinstance(levels, str): return None
+    return parse_px(levels.partition("_")[0])
+
+
+def parse_msg_array(msg_array, trade_date, change_filter):
+    """回傳 (本輪出現的股票代號, 有變動的 meta dict, 新成交 Tick)；沒有變動的快照只花一次 tuple 比對"""
+    codes, meta_records, ticks = [], [], []
+    meta_changed, tick_changed = change_filter.meta_changed, change_filter.tick_changed
+    for msg in msg_array:
+        get = msg.get
+        code = get("c")
+        if not code: continue
+        code = code.strip()
+        if not code: continue
+        codes.append(code)
+
+        o, h, l, y, u, w = get("o"), get("h"), get("l"), get("y"), get("u"), get("w")
+        n, nf, ex = get("n"), get("nf"), get("ex")
+        if meta_changed(code, (trade_date, o, h, l, y, u, w, n, nf, ex)):
+            meta_records.append({
+                "symbol": code, "trade_date": trade_date,
+                "day_open": parse_px(o), "day_high": parse_px(h), "day_low": parse_px(l),
+                "prev_close": parse_px(y), "limit_up": parse_px(u), "limit_down": parse_px(w),
+                "short_name": (n or "").strip(), "full_name": (nf or "").strip(), "exchange": (ex or "").strip(),
+            })
+
+        z, tlong = get("z"), get("tlong")
+        if not tlong or not z or z == "-": continue
+        # 同一筆成交 (tlong、價格、單量、累積量皆相同) 只送出一次；之後僅委買委賣變動的快照不再重寫
+        tv = get("tv")
+        if not tick_changed(code, (tlong, z, tv, get("v"))): continue
+        price = parse_px(z)
+        if price is None: continue
+        ticks.append(Tick(code, int(tlong) // 1000, price, parse_qty(tv), first_level(get("b")), first_level(get("a"))))
+    return codes, meta_records, ticks
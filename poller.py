@@ -1,70 +1,53 @@
+import os
 import time
 import requests
+from concurrent.futures import ThreadPoolExecutor
+from requests.adapters import HTTPAdapter
 import json
 import pandas as pd
-from datetime import datetime, time as dt_time
-from pytz import timezone
-from collections import deque
-from sqlalchemy import text  # 添加缺失的 text 導入
-from utils import to_float, first_px, get_today_date_str
+from datetime import datetime
+from sqlalchemy import text, bindparam  # 添加缺失的 text 導入
+from utils import to_float, get_today_date_str, taipei_day_start_ts, TAIPEI_TZ
+from bars import BarAggregator, taipei_day_of
+from materialize import materialize_bars
+from archive import archive_day
+from streaming import bar_event
+from signals import SignalEngine, build_rules
+from notifier import NotificationDispatcher, LazyPayload
+from writer import ChangeFilter
+from parsing import parse_msg_array, Tick
+from scheduler import (TradingCalendar, FixedRateTicker, AdaptiveSymbolScheduler, symbol_code, REGULAR, CLOSED,
+                       PRE_OPEN, CLOSE_AUCTION)
+from metrics import (STAGE_SECONDS, CYCLE_SECONDS, CYCLE_LAG_SECONDS, CYCLE_BUDGET_SECONDS, CYCLES_TOTAL,
+                     OVER_BUDGET_TOTAL, FETCH_CHUNKS_TOTAL, MESSAGES_TOTAL, TICKS_TOTAL, SIGNALS_TOTAL)
 
 # --- 設定與常數 ---
-TAIPEI_TZ = timezone('Asia/Taipei')
 N8N_WEBHOOK_URL = "https://ooschool2.zeabur.app/webhook/80260f05-240c-4091-9f0a-772ad18993fd"
+# 追蹤其他實例的股票時，每輪從已讀到的最新成交時間往前重疊讀取的秒數 (涵蓋 write-behind 的寫入延遲)
+FOLLOW_OVERLAP_SECONDS = 30
 
 # --- 輔助函式與類別 ---
 
-def is_trading_hours():
-    """判斷目前是否為台股交易時間 (週一到週五, 09:00 ~ 13:30)"""
-    now_tw = datetime.now(TAIPEI_TZ)
-    if now_tw.weekday() > 4: return False # 排除週末
-    
-    current_time = now_tw.time()
-    start_time = dt_time(9, 0)
-    end_time = dt_time(13, 30)
-    
-    return start_time <= current_time <= end_time
-
-class VshapeDetector:
-    """V型反轉偵測器"""
-    def __init__(self, summary_service):
+class SignalNotifier:
+    """將訊號引擎觸發的訊號連同完整 summary 交給 NotificationDispatcher 在背景發送到 n8n"""
+    def __init__(self, summary_service, dispatcher):
         self.summary_service = summary_service
-        # 儲存格式: { 'symbol': deque([{'ts': '11:05', 'low': 58.4}, ...], maxlen=3) }
-        self.recent_lows = {}
-        # 儲存格式: { 'symbol': '11:15' } # 記錄上次發送V轉通知的時間點
-        self.last_notification_time = {}
-
-    def check_and_notify(self, symbol, name, ohlc_df):
-        if ohlc_df.shape[0] < 3: return # 需要至少三根K棒才能判斷
-
-        # 初始化該股票的deque
-        if symbol not in self.recent_lows:
-            self.recent_lows[symbol] = deque(maxlen=3)
-
-        # 更新最近的低點數據
-        for idx, row in ohlc_df.iterrows():
-            ts_str = idx.strftime('%H:%M')
-            # 避免重複加入同一個時間點的資料
-            if not any(d['ts'] == ts_str for d in self.recent_lows[symbol]):
-                 self.recent_lows[symbol].append({'ts': ts_str, 'low': row['low']})
-
-        # 檢查是否有V轉模式
-        if len(self.recent_lows[symbol]) == 3:
-            p1, p2, p3 = list(self.recent_lows[symbol])
-            
-            # V轉條件: l1 > l2 and l3 > l2
-            if p1['low'] > p2['low'] and p3['low'] > p2['low']:
-                # 檢查是否已為此時間點發送過通知
-                if self.last_notification_time.get(symbol) != p3['ts']:
-                    print(f"*** 偵測到V型反轉: {name} at {p3['ts']} ***")
-                    # *** 核心修改：傳入 symbol 以便獲取完整 summary ***
-                    self._send_notification(symbol, name, p1, p2, p3)
-                    self.last_notification_time[symbol] = p3['ts']
-
-    def _send_notification(self, symbol, name, p1, p2, p3):
-        # *** 核心修改：在發送前，先呼叫 SummaryService 獲取最完整的即時資料 ***
-        full_summary = self.summary_service.get_summary(symbol)
-        
+        self.dispatcher = dispatcher
+
+    def notify(self, signal, name):
+        # v_shape 的 payload 與先前 VshapeDetector 相同 ("v_shape_signal")，其他規則依此類推
+        header = {"股票代號": signal["symbol"], "股票名稱": name, **signal["detail"]}
+        # 盤中快取已有剛計算好的K棒，直接取用；快取尚未暖機時才在 worker 執行緒中查 DB，不阻塞輪詢
+        full_summary = self.summary_service.get_live_summary(signal["symbol"], get_today_date_str(signal["bar_ts"]))
+        if full_summary is not None:
+            self.dispatcher.submit(self._payload(signal, header, full_summary))
+        else:
+            stub = {"symbol": signal["symbol"], "rule": signal["rule"], "detail": header}
+            self.dispatcher.submit(LazyPayload(
+                lambda: self._payload(signal, header, self.summary_service.get_summary(signal["symbol"])), stub))
+
+    @staticmethod
+    def _payload(signal, header, full_summary):
         def make_json_serializable(obj):
             if isinstance(obj, (pd.Timestamp, datetime)):
                 return obj.strftime('%Y-%m-%d') if hasattr(obj, 'strftime') else str(obj)
@@ -76,123 +59,435 @@ class VshapeDetector:
                 return [make_json_serializable(item) for item in obj]
             return obj
 
-        payload = {
-            "v_shape_signal": {
-                "股票代號": symbol,
-                "股票名稱": name,
-                "時間": f"{p1['ts']}-{p3['ts']}",
-                "價格": f"{p1['low']} > {p2['low']} > {p3['low']}",
-            },
-            "full_summary": make_json_serializable(full_summary)
-        }
-        try:
-            res = requests.post(N8N_WEBHOOK_URL, json=payload, timeout=5)
-            res.raise_for_status()
-            print(f"成功發送V轉通知到n8n for {name}.")
-        except requests.RequestException as e:
-            print(f"發送V轉通知失敗 for {name}: {e}")
+        return {f"{signal['rule']}_signal": header, "full_summary": make_json_serializable(full_summary)}
 
 
 class Poller:
-    def __init__(self, config, db, summary_service):
+    def __init__(self, config, db, summary_service, live_cache=None, writer=None, tick_archive=None,
+                 event_broker=None, notifier=None, calendar=None, coordinator=None):
         self.config = config
         self.db = db
+        # 串流推播 (/stream)：每輪把新成交與變動的 K 棒交給 EventBroker 分送
+        self.event_broker = event_broker
+        self._streamed_bars = {}  # symbol -> 上次推播時的 K 棒數
+        # 收盤後除了彙總 5 分 K，也把當日 ticks 寫入欄位式封存 (未設定 ARCHIVE_DIR 時為 None)
+        self.tick_archive = tick_archive
+        # 有 write-behind writer 時，輪詢執行緒只把資料交給它，不直接等待 DB 寫入
+        self.writer = writer
         self.summary_service = summary_service
+        self.live_cache = live_cache
+        # 分段併發抓取 MIS：連線池大小與抓取執行緒數一致，讓每個分段都能重用 keep-alive 連線
+        fetch_workers = max(1, int(config.get('fetch_workers', 4)))
+        self.fetch_pool = ThreadPoolExecutor(max_workers=fetch_workers, thread_name_prefix='mis-fetch')
         self.session = requests.Session()
         self.session.headers.update({'User-Agent': 'Mozilla/5.0'})
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=fetch_workers)
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
         self.MIS_URL_BASE = "https://mis.twse.com.tw/stock/api/getStockInfo.jsp"
-        # *** 核心修改：將 summary_service 傳遞給偵測器 ***
-        self.v_shape_detector = VshapeDetector(self.summary_service)
+        # 訊號引擎 (SIGNAL_RULES 指定啟用的規則) 與通知發送
+        self.signal_engine = SignalEngine(build_rules(config.get('signal_rules', 'v_shape')))
+        self.notifier = notifier if notifier is not None else NotificationDispatcher(N8N_WEBHOOK_URL)
+        self.signal_notifier = SignalNotifier(self.summary_service, self.notifier)
+        # 每檔股票的即時 5 分 K，取代每次輪詢都從 DB 重讀整日 ticks
+        self.bar_aggregator = BarAggregator()
+        self.materialized_date = None
+        # 濾掉與上次相同的 meta / tick 快照，不再重複 upsert
+        self.change_filter = ChangeFilter()
+        # 每輪輪詢的耗時統計
+        self.last_cycle_stats = {}
+        self.cycle_count = 0
+        self.over_budget_count = 0
+        # replay.py 以歷史資料重播時設定的模擬時鐘 (回傳 epoch 秒)，None 表示使用系統時間
+        self.replay_clock = None
+        # 交易日曆 (週末與 TWSE_HOLIDAYS 休市日不輪詢)、固定頻率計時，以及依報價變動調整的個股輪詢
+        self.calendar = calendar if calendar is not None else TradingCalendar()
+        self.ticker = FixedRateTicker()
+        self.symbol_scheduler = AdaptiveSymbolScheduler(max_skip=int(config.get('adaptive_max_skip', 1)))
+        self.closing_poll_date = None
+        self._closing_membership = 0
+        # 協調模式 (POLLER_COORDINATION) 下只輪詢分配給本實例的股票，收盤彙總只由取得租約的實例執行
+        self.coordinator = coordinator
+        self.owned_codes = None
+        self._follow_since = None
 
     def run(self):
         while True:
             symbols_str = self.config.get('symbols', '').strip()
             if not self.config.get('enabled') or not symbols_str:
                 print(f"[{datetime.now(TAIPEI_TZ).strftime('%H:%M:%S')}] 輪詢器已啟用但無追蹤標的，暫停 60 秒。")
+                self.ticker.reset()
                 time.sleep(60)
                 continue
 
-            if is_trading_hours():
-                try:
-                    self.poll_and_save(symbols_str)
-                except Exception as e:
-                    print(f"輪詢迴圈發生錯誤: {e}")
-                time.sleep(self.config.get('poll_seconds', 5))
+            now_tw = datetime.now(TAIPEI_TZ)
+            phase = self.calendar.phase(now_tw)
+            if phase == CLOSED:
+                self.ticker.reset()
+                self._run_closed(symbols_str, now_tw)
+                continue
+
+            try:
+                self.poll_and_save(symbols_str, phase)
+            except Exception as e:
+                print(f"輪詢迴圈發生錯誤: {e}")
+            # 盤前試撮與收盤集合競價期間以較短的間隔輪詢；間隔從上一輪的預定時間起算，不因抓取與寫入耗時而漂移
+            if phase in (PRE_OPEN, CLOSE_AUCTION):
+                self.ticker.wait(self.config.get('auction_poll_seconds', 2))
             else:
-                # 非交易時間，每小時抓一次
-                print(f"[{datetime.now(TAIPEI_TZ).strftime('%H:%M:%S')}] 非交易時間，輪詢器節能模式，每小時執行一次。")
-                try:
-                    self.poll_and_save(symbols_str)
-                except Exception as e:
-                    print(f"輪詢迴圈發生錯誤: {e}")
-                time.sleep(3600)
-
-    def _get_ticks_for_today(self, symbol):
-        """從DB獲取指定股票當日的全部ticks"""
+                self.ticker.wait(self.config.get('poll_seconds', 5))
+
+    def _run_closed(self, symbols_str, now_tw):
+        """非交易時段：交易日收盤後補抓最終成交並彙總 5 分 K，之後睡到下一個交易日盤前"""
+        today = now_tw.strftime('%Y-%m-%d')
+        if self.calendar.is_after_close(now_tw) and self.materialized_date != today:
+            try:
+                membership = self.coordinator.membership_changes if self.coordinator is not None else 0
+                if self.closing_poll_date != today or self._closing_membership != membership:
+                    self._closing_poll(symbols_str, today, membership)
+                self._materialize_after_close()
+            except Exception as e:
+                print(f"輪詢迴圈發生錯誤: {e}")
+            if self.closing_poll_date != today:
+                # 收盤成交尚未到齊，以集合競價的間隔繼續補抓
+                time.sleep(self.config.get('auction_poll_seconds', 2))
+                return
+            if self.materialized_date != today:
+                time.sleep(60)  # 彙總未完成 (write-behind 尚未清空或等待其他實例回報)，稍後重試
+                return
+
+        next_start = self.calendar.next_session_start(now_tw)
+        print(f"[{now_tw.strftime('%H:%M:%S')}] 非交易時段，下次輪詢於 {next_start.strftime('%Y-%m-%d %H:%M')}。")
+        # 最多睡一小時，讓 /config 的變更與日期切換能被及時反映
+        time.sleep(max(1, min(3600, (next_start - now_tw).total_seconds())))
+
+    def _closing_poll(self, symbols_str, today, membership):
+        """收盤後補抓最終成交，直到每檔都有 13:30 之後的成交或超過 CLOSING_SETTLE_END，完成時記錄於 closing_poll_date
+
+        協調模式下成員變動 (接手離線實例的股票) 時重新補抓，並先撤回已送出的收盤回報。
+        """
+        if self.closing_poll_date == today:
+            if not self.coordinator.withdraw_closed(today): return
+            self.closing_poll_date = None
+        self._closing_membership = membership
+        self.poll_and_save(symbols_str, CLOSED)
+        now_tw = datetime.now(TAIPEI_TZ)
+        missing = self._missing_closing_trades(symbols_str, now_tw.date())
+        if missing and not self.calendar.closing_settled(now_tw):
+            print(f"[{now_tw.strftime('%H:%M:%S')}] 尚有 {missing} 檔未收到收盤成交，繼續補抓。")
+            return
+        self.closing_poll_date = today
+
+    def _missing_closing_trades(self, symbols_str, day):
+        """本實例負責的股票中，最後一筆成交早於收盤 (13:30) 的檔數"""
+        if self.coordinator is not None and self.owned_codes is not None:
+            codes = self.owned_codes
+        else:
+            codes = {symbol_code(s) for s in symbols_str.split('|') if s}
+        close_ts = self.calendar.close_ts(day)
+        missing = 0
+        for code in codes:
+            builder = self.bar_aggregator.builders.get(code)
+            if builder is None or builder.last_ts is None or builder.last_ts < close_ts:
+                missing += 1
+        return missing
+
+    def _materialize_after_close(self):
+        """交易日收盤 (13:30) 後每天一次將當日 ticks 彙總寫入 bars_5m，並封存當日 ticks
+
+        bars_5m 寫入後歷史查詢即不再掃描 ticks，因此必須等收盤補抓完成 (closing_poll_date) 才彙總。
+        協調模式下先回報本實例的收盤補抓已寫入 DB；所有存活實例都回報後，取得租約的實例才彙總全部股票。
+        其他實例等到 daily_jobs 出現完成紀錄才視為當日完成，租約持有者中途離線時由其他實例在租約到期後接手。
+        """
+        now_tw = datetime.now(TAIPEI_TZ)
+        today = now_tw.strftime('%Y-%m-%d')
+        if not self.calendar.is_after_close(now_tw) or self.materialized_date == today:
+            return
+        if self.closing_poll_date != today:
+            return
+        # 彙總讀取的是 DB 中的 ticks，先確保 write-behind 緩衝區已寫入
+        if self.writer is not None and not self.writer.flush():
+            print("write-behind 緩衝區尚未清空，延後彙總 5 分 K。")
+            return
+        if self.coordinator is not None:
+            # 補抓完成後成員沒有變動，才回報本實例的收盤資料已寫入
+            if self._closing_membership != self.coordinator.membership_changes: return
+            if not self.coordinator.report_closed(today): return
+            if self.coordinator.is_done("materialize", today):
+                self.materialized_date = today
+                return
+            pending = self.coordinator.pending_closing_reports(today)
+            if pending is None: return
+            if pending:
+                print(f"等待 {len(pending)} 個實例完成收盤補抓後再彙總 5 分 K: {', '.join(pending)}")
+                return
+            if not self.coordinator.try_acquire("materialize", 1800): return
+        materialize_bars(self.db, today)
+        if self.tick_archive is not None:
+            archive_day(self.db, self.tick_archive, today)
+        if self.coordinator is not None and not self.coordinator.mark_done("materialize", today): return
+        self.materialized_date = today
+
+    def _warm_bar_builders(self, symbols, now=None):
+        """首次追蹤某檔股票時，從DB一次性載入其當日ticks以暖機K棒建構器"""
+        day = datetime.fromtimestamp(now, TAIPEI_TZ).date() if now is not None else None
+        rows_by_symbol = {symbol: [] for symbol in symbols}
+        for row in self._read_tick_rows(symbols, taipei_day_start_ts(day)):
+            rows_by_symbol[row.symbol].append(row)
+        for symbol, rows in rows_by_symbol.items():
+            self.bar_aggregator.warm(symbol, rows)
+
+    def _read_tick_rows(self, symbols, start_ts):
+        stmt = text("""
+            SELECT symbol, ts_sec, price, vol, best_bid, best_ask
+            FROM ticks
+            WHERE symbol IN :symbols AND ts_sec >= :start_ts
+            ORDER BY symbol, ts_sec ASC
+        """).bindparams(bindparam("symbols", expanding=True))
         with self.db.get_session() as session:
-            today_start_ts = int(datetime.combine(datetime.now(TAIPEI_TZ).date(), dt_time.min).timestamp())
-            stmt = text("SELECT ts_sec, price FROM ticks WHERE symbol = :symbol AND ts_sec >= :start_ts ORDER BY ts_sec ASC")
-            df = pd.read_sql(stmt, session.connection(), params={"symbol": symbol, "start_ts": today_start_ts})
-            if df.empty: return pd.DataFrame()
-            
-            df['datetime'] = pd.to_datetime(df['ts_sec'], unit='s', utc=True).dt.tz_convert(TAIPEI_TZ)
-            df.set_index('datetime', inplace=True)
-            return df
-
-    def poll_and_save(self, symbols_str):
+            return session.execute(stmt, {"symbols": list(symbols), "start_ts": start_ts}).fetchall()
+
+    def _publish_live_state(self, today_date, codes, meta_records, changed_symbols, now=None):
+        """將最新的 meta 與K棒快照發佈到共用快取，供 /summary 直接讀取 (沒有變動的股票不重建快照)
+
+        meta 沒有變動的股票不傳 meta，快取沿用上一份快照中的 meta。
+        """
+        today = taipei_day_of(int(now if now is not None else time.time()))
+        changed_meta = {meta["symbol"]: meta for meta in meta_records}
+        for symbol in codes:
+            publish_bars = symbol in changed_symbols or self.live_cache.get(symbol, today_date) is None
+            meta = changed_meta.get(symbol)
+            if not publish_bars and meta is None: continue
+
+            builder = self.bar_aggregator.get(symbol)
+            builder.roll_to(today)
+            self.live_cache.publish(symbol, today_date, meta=meta, builder=builder if publish_bars else None)
+
+    def _publish_stream_events(self, ticks, changed_symbols):
+        """將本輪的新成交與變動的 K 棒推播給串流訂閱者 (只處理有人訂閱的股票)"""
+        broker = self.event_broker
+        events = []
+        for tick in ticks:
+            symbol = tick.symbol
+            if broker.has_subscribers(symbol):
+                events.append((symbol, "tick", dict(tick._asdict(), total_vol=self.bar_aggregator.get(symbol).total_vol)))
+
+        for symbol in changed_symbols:
+            if not broker.has_subscribers(symbol): continue
+            bars = self.bar_aggregator.get(symbol).bars
+            start = self._streamed_bars.get(symbol, len(bars))
+            if start > len(bars): start = 0  # 已換日
+            # 上一輪進行中的 K 棒可能已完成，從它開始重送 (final=True 表示不會再變動)
+            for i in range(max(0, start - 1), len(bars)):
+                events.append((symbol, "bar", bar_event(symbol, bars[i], final=i < len(bars) - 1)))
+            self._streamed_bars[symbol] = len(bars)
+        if events: broker.publish(events)
+
+    def _fetch_chunk(self, chunk):
+        """抓取一個分段的 MIS 資料，失敗時回傳 None"""
         timestamp = int(time.time() * 1000)
-        full_url = f"{self.MIS_URL_BASE}?ex_ch={symbols_str}&json=1&delay=0&_={timestamp}"
+        full_url = f"{self.MIS_URL_BASE}?ex_ch={'|'.join(chunk)}&json=1&delay=0&_={timestamp}"
 
         try:
             res = self.session.get(full_url, timeout=4)
             res.raise_for_status()
             data = res.json()
         except (requests.RequestException, ValueError) as e:
-            print(f"無法獲取 MIS 資料: {e}")
-            return
+            print(f"無法獲取 MIS 資料 ({len(chunk)} 檔): {e}")
+            return None
+        return data.get('msgArray') or []
+
+    def fetch_msg_array(self, symbols_str):
+        """將追蹤清單切成多個分段併發抓取，合併為單一 msgArray；回傳 (msg_array, 分段數, 失敗分段數)"""
+        symbols = [s for s in symbols_str.split('|') if s]
+        chunk_size = max(1, int(self.config.get('chunk_size', 50)))
+        chunks = [symbols[i:i + chunk_size] for i in range(0, len(symbols), chunk_size)]
+        if len(chunks) == 1:
+            results = [self._fetch_chunk(chunks[0])]
+        else:
+            results = list(self.fetch_pool.map(self._fetch_chunk, chunks))
+
+        msg_array = [msg for result in results if result for msg in result]
+        return msg_array, len(chunks), sum(result is None for result in results)
+
+    def poll_and_save(self, symbols_str, phase=REGULAR):
+        cycle_start = time.perf_counter()
+        symbols = [s for s in symbols_str.split('|') if s]
+        all_symbols = symbols
+        if self.coordinator is not None:
+            symbols = self._own_shard(symbols)
+        # 盤中報價久未變動的股票降低抓取頻率 (adaptive_max_skip > 1 時)
+        due = self.symbol_scheduler.due(symbols, phase)
+        msg_array, n_chunks, failed_chunks = self.fetch_msg_array('|'.join(due))
+        stats = {"phase": phase, "symbols": len(symbols), "polled": len(due), "chunks": n_chunks,
+                 "failed_chunks": failed_chunks, "messages": len(msg_array)}
+        self._record_stage(stats, "fetch", cycle_start)
+        FETCH_CHUNKS_TOTAL.inc(n_chunks - failed_chunks, outcome="ok")
+        if failed_chunks: FETCH_CHUNKS_TOTAL.inc(failed_chunks, outcome="failed")
+        changed_codes = set()
+        if msg_array:
+            if self.config.get('record_dir'): self._record_msg_array(msg_array)
+            changed_codes = self.process_messages(msg_array, stats)
+        self.symbol_scheduler.observe(due, changed_codes)
+        if self.coordinator is not None and len(self.coordinator.live_nodes) > 1:
+            follow_start = time.perf_counter()
+            self._follow_other_shards(all_symbols)
+            self._record_stage(stats, "follow", follow_start)
+        self._record_cycle_stats(stats, cycle_start)
+
+    def _follow_other_shards(self, symbols):
+        """協調模式下，其他實例負責的股票改由 DB 追上最新 ticks 與 meta，更新本實例的 K 棒、盤中快取與串流推播
+
+        多個 worker 時 /summary 與 /stream 的請求可能落在任一 worker，每個 worker 都需要全部股票的盤中狀態；
+        這些股票不寫入 DB，也不執行訊號偵測 (由負責的實例執行)。資料比負責的實例晚約一個輪詢間隔加上
+        write-behind 的寫入間隔；成交時間早於已讀取的最新成交 FOLLOW_OVERLAP_SECONDS 以上才寫入 DB 的 ticks 不會被讀到。
+        """
+        codes = {symbol_code(s) for s in symbols} - (self.owned_codes or set())
+        if not codes: return
+        now = self.replay_clock() if self.replay_clock else None
+        today_date = get_today_date_str(now)
+        cold = [code for code in codes if not self.bar_aggregator.is_warm(code)]
+        if cold: self._warm_bar_builders(cold, now)
+
+        since = max(self._follow_since or 0, taipei_day_start_ts(
+            datetime.fromtimestamp(now, TAIPEI_TZ).date() if now is not None else None))
+        ticks, changed_symbols, max_ts = [], set(), None
+        for row in self._read_tick_rows(sorted(codes), since):
+            # DECIMAL 欄位統一轉成 float，與即時 tick 相同
+            tick = Tick(row.symbol, int(row.ts_sec), to_float(row.price), int(row.vol or 0),
+                        to_float(row.best_bid), to_float(row.best_ask))
+            max_ts = tick.ts_sec if max_ts is None else max(max_ts, tick.ts_sec)
+            if self.bar_aggregator.add_tick(*tick):
+                ticks.append(tick)
+                changed_symbols.add(tick.symbol)
+        if max_ts is not None:
+            self._follow_since = max_ts - FOLLOW_OVERLAP_SECONDS
+
+        if self.live_cache is not None:
+            refresh = changed_symbols | set(cold)
+            meta_records = self._read_daily_meta(refresh, today_date) if refresh else []
+            self._publish_live_state(today_date, refresh, meta_records, changed_symbols, now)
+        if self.event_broker is not None and changed_symbols:
+            self._publish_stream_events(ticks, changed_symbols)
+
+    def _read_daily_meta(self, symbols, trade_date):
+        """讀取 daily_meta，轉成與 parse_msg_array 相同格式的 meta dict"""
+        stmt = text("""
+            SELECT symbol, day_open, day_high, day_low, prev_close, limit_up, limit_down, short_name, full_name, exchange
+            FROM daily_meta WHERE symbol IN :symbols AND trade_date = :trade_date
+        """).bindparams(bindparam("symbols", expanding=True))
+        with self.db.get_session() as session:
+            rows = session.execute(stmt, {"symbols": sorted(symbols), "trade_date": trade_date}).fetchall()
+        return [{"symbol": row.symbol, "trade_date": trade_date,
+                 "day_open": to_float(row.day_open), "day_high": to_float(row.day_high), "day_low": to_float(row.day_low),
+                 "prev_close": to_float(row.prev_close), "limit_up": to_float(row.limit_up),
+                 "limit_down": to_float(row.limit_down), "short_name": row.short_name or "",
+                 "full_name": row.full_name or "", "exchange": row.exchange or ""} for row in rows]
+
+    def _own_shard(self, symbols):
+        """取出本實例負責的股票；移交出去的股票清除記憶體中的 K 棒與快取，避免之後接回時沿用過期狀態"""
+        owned = self.coordinator.shard(symbols)
+        owned_codes = {symbol_code(s) for s in owned}
+        if self.owned_codes is not None:
+            for code in self.owned_codes - owned_codes:
+                self.bar_aggregator.forget(code)
+                self.change_filter.forget(code)
+                self._streamed_bars.pop(code, None)
+                if self.live_cache is not None: self.live_cache.discard(code)
+        self.owned_codes = owned_codes
+        return owned
+
+    def _record_msg_array(self, msg_array):
+        """將原始 msgArray 附加到 record_dir/YYYY-MM-DD.jsonl，供 replay.py 重播"""
+        now = time.time()
+        path = os.path.join(self.config['record_dir'], f"{get_today_date_str(now)}.jsonl")
+        try:
+            os.makedirs(self.config['record_dir'], exist_ok=True)
+            with open(path, 'a', encoding='utf-8') as f:
+                f.write(json.dumps({"ts": now, "msgArray": msg_array}, ensure_ascii=False) + "\n")
+        except OSError as e:
+            print(f"無法記錄 msgArray: {e}")
+
+    def _record_stage(self, stats, stage, phase_start):
+        """記錄一個階段的耗時 (stats 的 <stage>_ms 與 poller_stage_seconds)，回傳下一階段的起點"""
+        now = time.perf_counter()
+        stats[f"{stage}_ms"] = round((now - phase_start) * 1000, 1)
+        STAGE_SECONDS.observe(now - phase_start, stage=stage)
+        return now
+
+    def _record_cycle_stats(self, stats, cycle_start):
+        """記錄本輪耗時與相對 poll_seconds 的延遲，超過 poll_seconds 時輸出警告"""
+        elapsed = time.perf_counter() - cycle_start
+        stats["total_ms"] = round(elapsed * 1000, 1)
+        budget = self.config.get('poll_seconds', 5)
+        budget_ms = budget * 1000
+        stats["lag_ms"] = round(stats["total_ms"] - budget_ms, 1)
+        stats["over_budget"] = stats["total_ms"] > budget_ms
+        self.cycle_count += 1
+        CYCLES_TOTAL.inc()
+        CYCLE_SECONDS.observe(elapsed)
+        CYCLE_BUDGET_SECONDS.set(budget)
+        CYCLE_LAG_SECONDS.set(elapsed - budget)
+        if stats["over_budget"]:
+            self.over_budget_count += 1
+            OVER_BUDGET_TOTAL.inc()
+            print(f"輪詢耗時 {stats['total_ms']:.0f}ms 超過 poll_seconds ({budget_ms}ms): {stats}")
+        self.last_cycle_stats = stats
+
+    def process_messages(self, msg_array, stats=None):
+        """解析 msgArray、寫入 DB、更新K棒與快取並執行訊號偵測；回傳有新成交或 meta 變動的股票代號"""
+        stats = stats if stats is not None else {}
+        phase_start = time.perf_counter()
+        now = self.replay_clock() if self.replay_clock else None
+        today_date = get_today_date_str(now)
+
+        # 與上一輪相同的快照在比對原始字串後即略過；有變動的才轉成 meta dict 與 Tick
+        codes, meta_to_upsert, ticks_to_insert = parse_msg_array(msg_array, today_date, self.change_filter)
+        cold_symbols = [c for c in set(codes) if not self.bar_aggregator.is_warm(c)]
+        if cold_symbols: self._warm_bar_builders(cold_symbols, now)
+        MESSAGES_TOTAL.inc(len(msg_array))
+        TICKS_TOTAL.inc(len(ticks_to_insert))
+        phase_start = self._record_stage(stats, "parse", phase_start)
+
+        # 所有分段的結果合併後，一次批次寫入
+        if self.writer is not None:
+            self.writer.submit(meta_to_upsert, ticks_to_insert)
+        else:
+            # 寫入失敗時讓 ChangeFilter 忘記這些股票，下一輪相同的快照才會再送出一次
+            if meta_to_upsert and self.db.bulk_upsert_daily_meta(meta_to_upsert) is False:
+                for meta in meta_to_upsert: self.change_filter.forget(meta["symbol"])
+            if ticks_to_insert and self.db.bulk_upsert_ticks(ticks_to_insert) is False:
+                for tick in ticks_to_insert: self.change_filter.forget(tick.symbol)
+        phase_start = self._record_stage(stats, "db", phase_start)
+
+        changed_symbols = set()
+        for tick in ticks_to_insert:
+            if self.bar_aggregator.add_tick(*tick):
+                changed_symbols.add(tick.symbol)
+        phase_start = self._record_stage(stats, "bars", phase_start)
+
+        if self.live_cache is not None:
+            self._publish_live_state(today_date, codes, meta_to_upsert, changed_symbols, now)
+        if self.event_broker is not None and changed_symbols:
+            self._publish_stream_events(ticks_to_insert, changed_symbols)
+        phase_start = self._record_stage(stats, "publish", phase_start)
+
+        if self.config.get('log_messages', True):
+            ts_str = datetime.now(TAIPEI_TZ).strftime('%H:%M:%S')
+            for msg in msg_array:
+                # 日誌輸出
+                summary_log = f"[{msg.get('n', 'N/A')} {msg.get('c', 'N/A')}] 開:{msg.get('o','-')} 高:{msg.get('h','-')} 低:{msg.get('l','-')} 收:{msg.get('z','-')} (昨收:{msg.get('y','-')})"
+                print(f"[{ts_str}] {summary_log}")
 
-        if 'msgArray' not in data or not data['msgArray']: return
-
-        ticks_to_insert, meta_to_upsert = [], []
-        today_date = get_today_date_str()
-
-        for msg in data['msgArray']:
-            code = (msg.get("c") or "").strip()
-            if not code: continue
-
-            meta_to_upsert.append({
-                "symbol": code, "trade_date": today_date,
-                "day_open": to_float(msg.get("o")), "day_high": to_float(msg.get("h")),
-                "day_low": to_float(msg.get("l")), "prev_close": to_float(msg.get("y")),
-                "limit_up": to_float(msg.get("u")), "limit_down": to_float(msg.get("w")),
-                "short_name": (msg.get("n") or "").strip(), "full_name": (msg.get("nf") or "").strip(),
-                "exchange": (msg.get("ex") or "").strip(),
-            })
-
-            price, tlong = to_float(msg.get("z")), msg.get("tlong")
-            if price is not None and tlong:
-                ticks_to_insert.append({
-                    "symbol": code, "ts_sec": int(int(tlong) / 1000), "price": price,
-                    "vol": int(to_float(msg.get("tv")) or 0),
-                    "best_bid": first_px(msg.get("b")), "best_ask": first_px(msg.get("a")),
-                })
-        
-        if meta_to_upsert: self.db.bulk_upsert_daily_meta(meta_to_upsert)
-        if ticks_to_insert: self.db.bulk_upsert_ticks(ticks_to_insert)
-        
-        ts_str = datetime.now(TAIPEI_TZ).strftime('%H:%M:%S')
-        for msg in data['msgArray']:
-            # 日誌輸出
-            name = msg.get('n', 'N/A')
-            code = msg.get('c', 'N/A')
-            summary_log = f"[{name} {code}] 開:{msg.get('o','-')} 高:{msg.get('h','-')} 低:{msg.get('l','-')} 收:{msg.get('z','-')} (昨收:{msg.get('y','-')})"
-            print(f"[{ts_str}] {summary_log}")
-
-            # V轉偵測
-            symbol = msg.get("c")
-            if not symbol: continue
-            
-            ticks_df = self._get_ticks_for_today(symbol)
-            if not ticks_df.empty:
-                ohlc_df = ticks_df['price'].resample('5min').ohlc().dropna()
-                self.v_shape_detector.check_and_notify(symbol, name, ohlc_df)
+        # 訊號偵測：只更新有變動股票的 K 棒視窗，再一次評估所有規則 (直接使用記憶體中的K棒，不回查DB)
+        for symbol in changed_symbols:
+            self.signal_engine.update(symbol, self.bar_aggregator.get(symbol).bars)
+        signals = self.signal_engine.evaluate(changed_symbols)
+        names = {(msg.get("c") or "").strip(): msg.get('n', 'N/A') for msg in msg_array} if signals else {}
+        for signal in signals:
+            name = names.get(signal["symbol"], signal["symbol"])
+            print(f"*** 偵測到{signal['label']}: {name} at {signal['detail']['時間']} ***")
+            SIGNALS_TOTAL.inc(rule=signal["rule"])
+            self.signal_notifier.notify(signal, name)
+        self._record_stage(stats, "signal", phase_start)
+        return {meta["symbol"] for meta in meta_to_upsert} | {tick.symbol for tick in ticks_to_insert}
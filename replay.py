@@ -0,0 +1,219 @@
+"""以歷史資料重播輪詢流程 (解析、寫入、K 棒、快取、訊號與通知)，用於離線驗證訊號規則與效能測試
+
+資料來源：
+- ticks：DATABASE_URL 中已儲存的 ticks，依 --poll-seconds 切成一輪一輪的 msgArray
+- record：輪詢器設定 POLLER_RECORD_DIR 時記錄的原始 msgArray (每日一個 .jsonl)
+
+重播結果寫入另一個資料庫 (預設為暫存的 SQLite 檔)，webhook 由本機的替身伺服器接收，不會送到 n8n。
+
+    python replay.py --source ticks --start 2025-01-02 --end 2025-01-03 --symbols 2330,2317 --signal-rules v_shape,breakout
+    python replay.py --source record --record-dir ./records --start 2025-01-02 --speed 10
+"""
+import os
+import json
+import time
+import argparse
+import tempfile
+import threading
+from collections import Counter
+from datetime import datetime, timedelta
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from sqlalchemy import text
+from utils import taipei_day_start_ts
+from database import create_database
+from live_cache import LiveCache
+from services import SummaryService
+from notifier import NotificationDispatcher
+from writer import WriteBehindWriter
+from poller import Poller
+
+
+class WebhookStandIn:
+    """本機 webhook 替身：接收並保留所有通知內容"""
+
+    def __init__(self):
+        self.payloads = []
+        stand_in = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def do_POST(self):
+                body = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+                payload = json.loads(body)
+                stand_in.payloads.extend(payload if isinstance(payload, list) else [payload])
+                self.send_response(200)
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.url = f"http://127.0.0.1:{self.server.server_port}/webhook"
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def close(self):
+        self.server.shutdown()
+
+
+def date_range(start, end):
+    day = datetime.strptime(start, '%Y-%m-%d').date()
+    last = datetime.strptime(end, '%Y-%m-%d').date()
+    while day <= last:
+        yield day
+        day += timedelta(days=1)
+
+
+def _px(value):
+    return "-" if value is None or value != value else f"{value}"
+
+
+def tick_cycles(db, day, symbols, poll_seconds):
+    """將某日儲存的 ticks 依輪詢間隔分組，轉為 MIS msgArray 格式；產生 (模擬時間, msgArray)"""
+    start_ts = taipei_day_start_ts(day)
+    ticks_df = db.read_ticks(symbols, start_ts, start_ts + 86399)
+    if ticks_df.empty: return
+
+    with db.get_session() as session:
+        meta_rows = session.execute(text("SELECT * FROM daily_meta WHERE trade_date = :trade_date"),
+                                    {"trade_date": day.strftime('%Y-%m-%d')}).fetchall()
+    meta_by_symbol = {row.symbol: dict(row._mapping) for row in meta_rows}
+
+    ticks_df = ticks_df.sort_values(['ts_sec', 'symbol'], kind='stable')
+    ticks_df['cum_vol'] = ticks_df.groupby('symbol')['vol'].cumsum()
+    cycle_end, msgs = None, []
+    for row in ticks_df.itertuples(index=False):
+        if cycle_end is not None and row.ts_sec > cycle_end:
+            yield cycle_end, msgs
+            msgs = []
+        if not msgs:
+            cycle_end = row.ts_sec - row.ts_sec % poll_seconds + poll_seconds
+        meta = meta_by_symbol.get(row.symbol, {})
+        msgs.append({
+            "c": row.symbol, "n": meta.get("short_name") or row.symbol, "nf": meta.get("full_name") or "",
+            "ex": meta.get("exchange") or "", "o": _px(meta.get("day_open")), "h": _px(meta.get("day_high")),
+            "l": _px(meta.get("day_low")), "y": _px(meta.get("prev_close")),
+            "u": _px(meta.get("limit_up")), "w": _px(meta.get("limit_down")),
+            "z": _px(row.price), "tlong": str(int(row.ts_sec) * 1000), "tv": str(int(row.vol or 0)),
+            "v": str(int(row.cum_vol or 0)), "b": f"{_px(row.best_bid)}_", "a": f"{_px(row.best_ask)}_",
+        })
+    if msgs:
+        yield cycle_end, msgs
+
+
+def record_cycles(record_dir, day, symbols):
+    """讀取 POLLER_RECORD_DIR 記錄的原始 msgArray；產生 (記錄時間, msgArray)"""
+    path = os.path.join(record_dir, f"{day.strftime('%Y-%m-%d')}.jsonl")
+    if not os.path.exists(path): return
+    wanted = set(symbols) if symbols else None
+    with open(path, encoding='utf-8') as f:
+        for line in f:
+            record = json.loads(line)
+            msgs = record["msgArray"]
+            if wanted is not None:
+                msgs = [msg for msg in msgs if (msg.get("c") or "").strip() in wanted]
+            if msgs:
+                yield record["ts"], msgs
+
+
+def replay(cycles, poller, speed=0.0):
+    """依序重播每一輪；speed > 0 時依模擬時間等比例等待 (1 = 實際速度)，0 為不限速"""
+    clock = {"now": None}
+    poller.replay_clock = lambda: clock["now"]
+    totals = Counter()
+    sim_start = wall_start = None
+    started = time.perf_counter()
+    for sim_now, msgs in cycles:
+        if speed > 0:
+            if sim_start is None:
+                sim_start, wall_start = sim_now, time.perf_counter()
+            delay = (sim_now - sim_start) / speed - (time.perf_counter() - wall_start)
+            if delay > 0: time.sleep(delay)
+        clock["now"] = sim_now
+        stats = {}
+        poller.process_messages(msgs, stats)
+        totals["cycles"] += 1
+        totals["messages"] += len(msgs)
+        for key in ("parse_ms", "db_ms", "signal_ms"):
+            totals[key] += stats.get(key, 0)
+    totals["elapsed_s"] = time.perf_counter() - started
+    return totals
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--source", choices=["ticks", "record"], default="ticks")
+    parser.add_argument("--start", required=True, help="起始日期 (YYYY-MM-DD)")
+    parser.add_argument("--end", help="結束日期 (YYYY-MM-DD，預設同起始日期)")
+    parser.add_argument("--symbols", help="只重播這些股票 (逗號分隔)，預設全部")
+    parser.add_argument("--record-dir", default=os.environ.get('POLLER_RECORD_DIR'), help="--source record 的資料夾")
+    parser.add_argument("--poll-seconds", type=int, default=5, help="--source ticks 時每輪涵蓋的秒數")
+    parser.add_argument("--speed", type=float, default=0.0, help="重播倍速 (1 = 實際速度，0 = 不限速)")
+    parser.add_argument("--signal-rules", default=os.environ.get('SIGNAL_RULES', 'v_shape'))
+    parser.add_argument("--target-db", help="重播寫入的資料庫 URL (預設為暫存的 SQLite 檔)")
+    parser.add_argument("--write-behind", action="store_true", help="經由 write-behind 緩衝區寫入")
+    parser.add_argument("--signals-out", help="將收到的通知寫入此 .jsonl 檔")
+    parser.add_argument("--json", action="store_true", help="以 JSON 格式輸出結果")
+    args = parser.parse_args()
+
+    from dotenv import load_dotenv
+    load_dotenv()
+    symbols = [s.strip() for s in args.symbols.split(",") if s.strip()] if args.symbols else None
+    if args.source == "ticks":
+        db_url = os.environ.get('DATABASE_URL')
+        if not db_url:
+            parser.error("--source ticks 需要設定 DATABASE_URL")
+        source_db = create_database(db_url)
+    elif not args.record_dir:
+        parser.error("--source record 需要 --record-dir 或 POLLER_RECORD_DIR")
+
+    target_url = args.target_db or f"sqlite:///{os.path.join(tempfile.mkdtemp(prefix='replay-'), 'replay.db')}"
+    target_db = create_database(target_url)
+    target_db.ensure_schema()
+
+    stand_in = WebhookStandIn()
+    notifier = NotificationDispatcher(stand_in.url, workers=1)
+    writer = WriteBehindWriter(target_db) if args.write_behind else None
+    live_cache = LiveCache()
+    summary_service = SummaryService(target_db, live_cache)
+    config = {"poll_seconds": args.poll_seconds, "signal_rules": args.signal_rules, "log_messages": False}
+    poller = Poller(config, target_db, summary_service, live_cache, writer, notifier=notifier)
+
+    def cycles():
+        for day in date_range(args.start, args.end or args.start):
+            if args.source == "ticks":
+                yield from tick_cycles(source_db, day, symbols, args.poll_seconds)
+            else:
+                yield from record_cycles(args.record_dir, day, symbols)
+
+    totals = replay(cycles(), poller, args.speed)
+    if writer is not None: writer.close()
+    notifier.close()
+    stand_in.close()
+
+    elapsed = totals["elapsed_s"] or 1e-9
+    signals = Counter(key for payload in stand_in.payloads for key in payload if key.endswith("_signal"))
+    result = {
+        "cycles": totals["cycles"], "messages": totals["messages"], "elapsed_s": round(elapsed, 3),
+        "messages_per_s": round(totals["messages"] / elapsed, 1), "cycles_per_s": round(totals["cycles"] / elapsed, 1),
+        "parse_ms": round(totals["parse_ms"], 1), "db_ms": round(totals["db_ms"], 1),
+        "signal_ms": round(totals["signal_ms"], 1), "signals": dict(signals),
+        "notifier": notifier.metrics(), "target_db": target_url,
+    }
+    if args.signals_out:
+        with open(args.signals_out, 'w', encoding='utf-8') as f:
+            for payload in stand_in.payloads:
+                f.write(json.dumps(payload, ensure_ascii=False) + "\n")
+
+    if args.json:
+        print(json.dumps(result, ensure_ascii=False, indent=2))
+        return
+    print(f"重播 {result['cycles']} 輪、{result['messages']} 則訊息，耗時 {result['elapsed_s']} 秒 "
+          f"({result['messages_per_s']} 則/秒，{result['cycles_per_s']} 輪/秒)")
+    print(f"各階段累計: 解析 {result['parse_ms']} ms、寫入 {result['db_ms']} ms、訊號 {result['signal_ms']} ms")
+    print(f"訊號: {result['signals'] or '無'} (通知 {result['notifier']})")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,165 @@
+"""輪詢排程：台股交易日曆、固定頻率 (不累積漂移) 的計時器，以及依報價變動頻率調整的個股輪詢
+
+交易時段 (台北時間)：
+- 08:30 ~ 09:00 盤前試撮 (pre_open)
+- 09:00 ~ 13:25 盤中逐筆 (regular)
+- 13:25 ~ 13:30 收盤集合競價 (close_auction)
+- 13:30 之後 MIS 常延遲數秒才發佈收盤成交，收盤後持續補抓到 13:35 (CLOSING_SETTLE_END) 或每檔都已收到收盤成交
+週末與 TWSE_HOLIDAYS / TWSE_HOLIDAYS_FILE 列出的休市日整天不輪詢。休市日需自行依證交所公告維護。
+"""
+import os
+import re
+import time
+from datetime import datetime, timedelta, time as dt_time
+from utils import TAIPEI_TZ
+
+PRE_OPEN, REGULAR, CLOSE_AUCTION, CLOSED = "pre_open", "regular", "close_auction", "closed"
+
+PRE_OPEN_START = dt_time(8, 30)
+REGULAR_START = dt_time(9, 0)
+CLOSE_AUCTION_START = dt_time(13, 25)
+SESSION_END = dt_time(13, 30)
+CLOSING_SETTLE_END = dt_time(13, 35)
+
+_DATE_RE = re.compile(r"\d{4}-\d{2}-\d{2}")
+
+
+def load_holidays(spec=None, path=None):
+    """讀取休市日：spec 為逗號分隔的 YYYY-MM-DD，path 為檔案 (每行或以逗號分隔皆可，# 之後為註解)"""
+    text = spec or ""
+    if path:
+        try:
+            with open(path, encoding='utf-8') as f:
+                text += "\n" + "\n".join(line.split('#', 1)[0] for line in f)
+        except OSError as e:
+            print(f"無法讀取休市日檔案 {path}: {e}")
+    holidays = set()
+    for token in re.split(r"[\s,]+", text):
+        if not token: continue
+        if not _DATE_RE.fullmatch(token):
+            print(f"略過無法解析的休市日: {token}")
+            continue
+        holidays.add(datetime.strptime(token, '%Y-%m-%d').date())
+    return holidays
+
+
+class TradingCalendar:
+    def __init__(self, holidays=()):
+        self.holidays = set(holidays)
+
+    @classmethod
+    def from_env(cls):
+        return cls(load_holidays(os.environ.get('TWSE_HOLIDAYS'), os.environ.get('TWSE_HOLIDAYS_FILE')))
+
+    def is_trading_day(self, day):
+        return day.weekday() < 5 and day not in self.holidays
+
+    def phase(self, now_tw):
+        """now_tw 為台北時間的 datetime，回傳所在的交易時段"""
+        if not self.is_trading_day(now_tw.date()): return CLOSED
+        t = now_tw.time()
+        if PRE_OPEN_START <= t < REGULAR_START: return PRE_OPEN
+        if REGULAR_START <= t < CLOSE_AUCTION_START: return REGULAR
+        if CLOSE_AUCTION_START <= t <= SESSION_END: return CLOSE_AUCTION
+        return CLOSED
+
+    def is_after_close(self, now_tw):
+        """交易日收盤 (13:30) 之後"""
+        return self.is_trading_day(now_tw.date()) and now_tw.time() > SESSION_END
+
+    def close_ts(self, day):
+        """該日收盤 (13:30) 的 epoch 秒；收盤集合競價的成交時間 (tlong) 不早於此"""
+        return int(TAIPEI_TZ.localize(datetime.combine(day, SESSION_END)).timestamp())
+
+    def closing_settled(self, now_tw):
+        """收盤後的補抓期限已過"""
+        return now_tw.time() >= CLOSING_SETTLE_END
+
+    def next_session_start(self, now_tw):
+        """下一個交易日盤前試撮開始 (08:30) 的台北時間；今日尚未開始時回傳今日"""
+        day = now_tw.date()
+        if now_tw.time() >= PRE_OPEN_START: day += timedelta(days=1)
+        for _ in range(366):
+            if self.is_trading_day(day):
+                return TAIPEI_TZ.localize(datetime.combine(day, PRE_OPEN_START))
+            day += timedelta(days=1)
+        raise ValueError("一年內沒有交易日，請檢查休市日設定")
+
+
+class FixedRateTicker:
+    """固定頻率計時：下一次的時間點以上一次的預定時間累加，不受每輪工作耗時影響
+
+    某輪耗時超過間隔時立即開始下一輪並以現在重新起算，不補跑錯過的輪次 (記錄於 skipped)。
+    """
+
+    def __init__(self, clock=time.monotonic, sleep=time.sleep):
+        self.clock = clock
+        self.sleep = sleep
+        self.next_at = None
+        self.skipped = 0
+
+    def reset(self):
+        self.next_at = None
+
+    def wait(self, interval):
+        """等待到下一個時間點，回傳實際睡眠秒數"""
+        now = self.clock()
+        if self.next_at is None:
+            self.next_at = now
+        self.next_at += interval
+        if self.next_at < now:
+            # 本輪超時：立即開始下一輪，並以現在為新的起點
+            self.skipped += int((now - self.next_at) // interval)
+            self.next_at = now
+        delay = self.next_at - now
+        if delay > 0: self.sleep(delay)
+        return delay
+
+
+def symbol_code(ex_ch):
+    """tse_2330.tw -> 2330"""
+    return ex_ch.split('_', 1)[-1].split('.', 1)[0]
+
+
+class AdaptiveSymbolScheduler:
+    """依報價變動頻率決定每輪要抓哪些股票
+
+    每檔股票連續 idle_cycles 輪沒有新成交或 meta 變動後，輪詢間隔加倍 (每 2、4... 輪抓一次)，
+    最多 max_skip 輪抓一次；一有變動立即回到每輪抓取。盤前試撮與收盤集合競價時全部股票每輪都抓。
+    """
+
+    def __init__(self, max_skip=4, idle_cycles=3):
+        self.max_skip = max(1, max_skip)
+        self.idle_cycles = max(1, idle_cycles)
+        self._state = {}  # code -> [間隔輪數, 連續無變動輪數, 距下次抓取輪數]
+
+    def due(self, ex_ch_list, phase=REGULAR):
+        """回傳本輪要抓取的 ex_ch"""
+        if phase != REGULAR or self.max_skip == 1: return list(ex_ch_list)
+        selected = []
+        for ex_ch in ex_ch_list:
+            state = self._state.get(symbol_code(ex_ch))
+            if state is None or state[2] <= 1:
+                selected.append(ex_ch)
+            else:
+                state[2] -= 1
+        return selected
+
+    def observe(self, polled, changed_codes):
+        """polled 為本輪抓取的 ex_ch；changed_codes 為有新成交或 meta 變動的股票代號"""
+        for ex_ch in polled:
+            code = symbol_code(ex_ch)
+            state = self._state.setdefault(code, [1, 0, 1])
+            if code in changed_codes:
+                state[:] = [1, 0, 1]
+                continue
+            state[1] += 1
+            if state[1] >= self.idle_cycles and state[0] < self.max_skip:
+                state[0] = min(self.max_skip, state[0] * 2)
+                state[1] = 0
+            state[2] = state[0]
+
+    def stats(self):
+        intervals = [state[0] for state in self._state.values()]
+        return {"symbols": len(intervals), "backed_off": sum(i > 1 for i in intervals),
+                "max_interval": max(intervals, default=1)}
@@ -1,49 +1,230 @@
+import numpy as np
 import pandas as pd
-from sqlalchemy import text
+from sqlalchemy import text, bindparam
 from datetime import datetime, time
+from bars import BAR_SECONDS, format_hhmm, aggregate_5m, aggregate_5m_grouped, slice_bars, expand_bar_rows
+from utils import get_today_date_str
+from metrics import timed, SUMMARY_SECONDS
 
 class SummaryService:
-    def __init__(self, db):
+    def __init__(self, db, live_cache=None, historical_cache=None, tick_archive=None):
         self.db = db
+        self.live_cache = live_cache
+        self.historical_cache = historical_cache
+        self.tick_archive = tick_archive
 
+    @timed(SUMMARY_SECONDS, method="get_live_summary")
+    def get_live_summary(self, symbol, trade_date=None):
+        """只從盤中快取取得當日 (或指定交易日) 總結，快取尚未暖機時回傳 None (不會查詢 DB)"""
+        if self.live_cache is None: return None
+        snapshot = self.live_cache.get(symbol, trade_date or get_today_date_str())
+        return self._build_live_summary(snapshot) if snapshot is not None else None
+
+    @timed(SUMMARY_SECONDS, method="get_summary")
     def get_summary(self, symbol):
         """獲取指定股票當日的即時總結"""
+        summary = self.get_live_summary(symbol)
+        if summary is not None: return summary
+
+        # 快取尚未暖機 (例如剛啟動或非追蹤標的)，退回 DB 查詢
         with self.db.get_session() as session:
             today_start_ts = int(datetime.combine(datetime.today(), time.min).timestamp())
             
-            ticks_stmt = text("SELECT ts_sec, price, vol, best_bid, best_ask FROM ticks WHERE symbol = :symbol AND ts_sec >= :start_ts ORDER BY ts_sec ASC")
-            ticks_df = pd.read_sql(ticks_stmt, session.connection(), params={"symbol": symbol, "start_ts": today_start_ts})
+            ticks_df = self.db.read_ticks([symbol], today_start_ts)
             
             meta_stmt = text("SELECT * FROM daily_meta WHERE symbol = :symbol ORDER BY trade_date DESC LIMIT 1")
             meta_res = session.execute(meta_stmt, {"symbol": symbol}).fetchone()
             
             return self._process_summary_data(ticks_df, meta_res)
 
+    @timed(SUMMARY_SECONDS, method="get_historical_summary")
     def get_historical_summary(self, symbol, date_str):
         """獲取指定股票在特定歷史日期的總結"""
+        # 已收盤的交易日資料不會再變動，可直接使用快取
+        cacheable = self.historical_cache is not None and date_str < get_today_date_str()
+        if cacheable:
+            summary = self.historical_cache.get(symbol, date_str)
+            if summary is not None: return summary
+
+        summary = self._query_historical_summary(symbol, date_str)
+        if cacheable: self.historical_cache.put(symbol, date_str, summary)
+        return summary
+
+    def _query_historical_summary(self, symbol, date_str):
         target_date = datetime.strptime(date_str, '%Y-%m-%d')
         start_ts = int(datetime.combine(target_date, time.min).timestamp())
         end_ts = int(datetime.combine(target_date, time.max).timestamp())
 
         with self.db.get_session() as session:
-            ticks_stmt = text("""
-                SELECT ts_sec, price, vol, best_bid, best_ask 
-                FROM ticks 
-                WHERE symbol = :symbol AND ts_sec BETWEEN :start_ts AND :end_ts 
-                ORDER BY ts_sec ASC
-            """)
-            ticks_df = pd.read_sql(ticks_stmt, session.connection(), params={"symbol": symbol, "start_ts": start_ts, "end_ts": end_ts})
-
             meta_stmt = text("SELECT * FROM daily_meta WHERE symbol = :symbol AND trade_date = :trade_date")
             meta_res = session.execute(meta_stmt, {"symbol": symbol, "trade_date": date_str}).fetchone()
 
-            return self._process_summary_data(ticks_df, meta_res)
+            # 優先讀取收盤後彙總好的 5 分 K (約 54 筆)，尚未彙總的日期才掃描 ticks
+            bars_stmt = text("""
+                SELECT bar_ts, open, high, low, close, volume, vwap, buy_vol, sell_vol
+                FROM bars_5m
+                WHERE symbol = :symbol AND trade_date = :trade_date
+                ORDER BY bar_ts ASC
+            """)
+            bar_rows = session.execute(bars_stmt, {"symbol": symbol, "trade_date": date_str}).fetchall()
+            if bar_rows:
+                return self._process_bar_rows(bar_rows, meta_res)
 
-    def _process_summary_data(self, ticks_df, meta_res):
-        """共用的資料處理邏輯"""
+        # 尚未彙總但已封存的日期，直接以 mmap 讀取欄位檔，不掃描 DB 的 ticks
+        if self.tick_archive is not None:
+            columns = self.tick_archive.read(symbol, date_str)
+            if columns is not None:
+                return self._process_tick_columns(columns, meta_res)
+
+        ticks_df = self.db.read_ticks([symbol], start_ts, end_ts)
+        return self._process_summary_data(ticks_df, meta_res)
+
+    def _process_bar_rows(self, bar_rows, meta_res):
+        """以 bars_5m 的資料列組出與 _process_summary_data 相同格式的回應"""
         meta_data = dict(meta_res._mapping) if meta_res else {}
+        response = self._empty_response(meta_data)
+
+        response["最新成交價"] = bar_rows[-1].close
+        response["當日成交量"] = int(sum(row.volume for row in bar_rows))
+        self._append_bar_strings(response, expand_bar_rows(bar_rows), meta_data.get("day_open"))
+        return response
+
+    @timed(SUMMARY_SECONDS, method="get_batch_summary")
+    def get_batch_summary(self, symbols, date_str=None):
+        """一次查詢多檔股票的總結 (date_str 為 None 時為當日即時資料)，回傳以股票代號為 key 的 dict"""
+        results = {}
+        today = get_today_date_str()
+        if date_str is None and self.live_cache is not None:
+            for symbol in symbols:
+                snapshot = self.live_cache.get(symbol, today)
+                if snapshot is not None: results[symbol] = self._build_live_summary(snapshot)
+
+        cacheable = date_str is not None and self.historical_cache is not None and date_str < today
+        if cacheable:
+            for symbol in symbols:
+                summary = self.historical_cache.get(symbol, date_str)
+                if summary is not None: results[symbol] = summary
+
+        pending = [symbol for symbol in symbols if symbol not in results]
+        if pending:
+            computed = self._query_batch_summary(pending, date_str)
+            if cacheable:
+                for symbol, summary in computed.items():
+                    self.historical_cache.put(symbol, date_str, summary)
+            results.update(computed)
+        return {symbol: results[symbol] for symbol in symbols}
+
+    def _query_batch_summary(self, symbols, date_str):
+        """以 IN (...) 一次取出所有股票的 meta / K 棒 / ticks，再以分組方式一次聚合"""
+        if date_str is None:
+            start_ts = int(datetime.combine(datetime.today(), time.min).timestamp())
+            end_ts = None
+        else:
+            target_date = datetime.strptime(date_str, '%Y-%m-%d')
+            start_ts = int(datetime.combine(target_date, time.min).timestamp())
+            end_ts = int(datetime.combine(target_date, time.max).timestamp())
+
+        bar_rows_by_symbol = {}
+        with self.db.get_session() as session:
+            if date_str is None:
+                meta_stmt = text("""
+                    SELECT m.* FROM daily_meta m
+                    JOIN (
+                        SELECT symbol, MAX(trade_date) AS trade_date FROM daily_meta
+                        WHERE symbol IN :symbols GROUP BY symbol
+                    ) latest ON m.symbol = latest.symbol AND m.trade_date = latest.trade_date
+                """).bindparams(bindparam("symbols", expanding=True))
+                meta_rows = session.execute(meta_stmt, {"symbols": symbols}).fetchall()
+            else:
+                meta_stmt = text("SELECT * FROM daily_meta WHERE symbol IN :symbols AND trade_date = :trade_date") \
+                    .bindparams(bindparam("symbols", expanding=True))
+                meta_rows = session.execute(meta_stmt, {"symbols": symbols, "trade_date": date_str}).fetchall()
+
+                bars_stmt = text("""
+                    SELECT symbol, bar_ts, open, high, low, close, volume, vwap, buy_vol, sell_vol
+                    FROM bars_5m
+                    WHERE symbol IN :symbols AND trade_date = :trade_date
+                    ORDER BY symbol, bar_ts ASC
+                """).bindparams(bindparam("symbols", expanding=True))
+                for row in session.execute(bars_stmt, {"symbols": symbols, "trade_date": date_str}):
+                    bar_rows_by_symbol.setdefault(row.symbol, []).append(row)
+
+        meta_by_symbol = {row.symbol: row for row in meta_rows}
+        results = {symbol: self._process_bar_rows(rows, meta_by_symbol.get(symbol))
+                   for symbol, rows in bar_rows_by_symbol.items()}
+
+        tick_symbols = [symbol for symbol in symbols if symbol not in bar_rows_by_symbol]
+        if tick_symbols and date_str is not None and self.tick_archive is not None \
+                and self.tick_archive.has_day(date_str):
+            # 封存檔中讀不到的股票與單檔查詢相同，改由 DB 的 ticks 計算
+            missing = []
+            for symbol in tick_symbols:
+                columns = self.tick_archive.read(symbol, date_str)
+                if columns is None:
+                    missing.append(symbol)
+                else:
+                    results[symbol] = self._process_tick_columns(columns, meta_by_symbol.get(symbol))
+            tick_symbols = missing
 
-        response = {
+        if tick_symbols:
+            ticks_df = self.db.read_ticks(tick_symbols, start_ts, end_ts)
+            results.update(self._process_grouped_ticks(tick_symbols, ticks_df, meta_by_symbol))
+        return results
+
+    def _process_grouped_ticks(self, symbols, ticks_df, meta_by_symbol):
+        """多檔股票的 ticks 以 aggregate_5m_grouped 一次聚合，再切分為各自的回應"""
+        codes = pd.Categorical(ticks_df['symbol'], categories=symbols).codes.astype(np.int64)
+        price = ticks_df['price'].to_numpy(dtype=float)
+        vol = ticks_df['vol'].to_numpy()
+        bars, offsets = aggregate_5m_grouped(codes, len(symbols), ticks_df['ts_sec'].to_numpy(), price, vol,
+                                             ticks_df['best_bid'].to_numpy(), ticks_df['best_ask'].to_numpy())
+        total_vol = np.bincount(codes, weights=np.nan_to_num(vol.astype(float)), minlength=len(symbols))
+        last_pos = np.full(len(symbols), -1)
+        np.maximum.at(last_pos, codes, np.arange(len(codes)))
+
+        results = {}
+        for g, symbol in enumerate(symbols):
+            meta_res = meta_by_symbol.get(symbol)
+            meta_data = dict(meta_res._mapping) if meta_res else {}
+            response = self._empty_response(meta_data)
+            if offsets[g] < offsets[g + 1]:
+                response["最新成交價"] = price[last_pos[g]]
+                response["當日成交量"] = int(total_vol[g])
+                self._append_bar_strings(response, slice_bars(bars, offsets[g], offsets[g + 1]), meta_data.get("day_open"))
+            results[symbol] = response
+        return results
+
+    def _build_live_summary(self, snapshot):
+        """以快取中的K棒快照組出與 _process_summary_data 相同格式的回應"""
+        response = self._empty_response(snapshot.meta)
+        response["資料來源"] = "Cache"
+        if not snapshot.bars: return response
+
+        response["最新成交價"] = snapshot.last_price
+        response["當日成交量"] = int(snapshot.total_vol)
+
+        last_close = snapshot.meta.get("day_open")
+        bars_iter = iter(snapshot.bars)
+        bar = next(bars_iter)
+        for start_ts in range(snapshot.bars[0][0], snapshot.bars[-1][0] + 1, BAR_SECONDS):
+            ts_str = format_hhmm(start_ts)
+            if bar is None or bar[0] != start_ts:
+                # 這是一個沒有成交的區間
+                response["推估五分買賣量"].append(f"{ts_str},B:0,S:0")
+                response["即時5分"].append(f"{ts_str},O:{last_close},H:{last_close},L:{last_close},C:-")
+                continue
+
+            _, o, h, l, c, _, vwap, b_vol, s_vol = bar
+            response["推估五分買賣量"].append(f"{ts_str},B:{b_vol},S:{s_vol}")
+            response["即時5分"].append(f"{ts_str},O:{o},H:{h},L:{l},C:{c}")
+            last_close = c
+            if vwap is not None:
+                response["均價"].append(f"{ts_str},{vwap:.2f}")
+            bar = next(bars_iter, None)
+        return response
+
+    def _empty_response(self, meta_data):
+        return {
             "查詢日期": str(meta_data.get("trade_date", "N/A")),
             "股票代號": meta_data.get("symbol"), "公司簡稱": meta_data.get("short_name"),
             "最新成交價": None, "當日開盤價": meta_data.get("day_open"),
@@ -52,63 +233,43 @@ class SummaryService:
             "資料來源": "DB", "即時5分": [], "推估五分買賣量": [], "均價": []
         }
 
-        if ticks_df.empty: return response
-
-        ticks_df['datetime'] = pd.to_datetime(ticks_df['ts_sec'], unit='s', utc=True).dt.tz_convert('Asia/Taipei')
-        ticks_df.set_index('datetime', inplace=True)
-
-        response["最新成交價"] = ticks_df['price'].iloc[-1]
-        response["當日成交量"] = int(ticks_df['vol'].sum())
-
-        # 1. 產生一個完整的 5 分鐘時間軸，從第一筆成交到最後一筆
-        start_time = ticks_df.index.min().floor('5min')
-        end_time = ticks_df.index.max().floor('5min')
-        full_time_index = pd.date_range(start=start_time, end=end_time, freq='5min')
-
-        # 2. 重新取樣，並將其對齊到完整的時間軸上
-        ohlc_5m = ticks_df['price'].resample('5min').ohlc().reindex(full_time_index)
-        
-        ticks_df['value'] = ticks_df['price'] * ticks_df['vol']
-        vol_5m = ticks_df['vol'].resample('5min').sum()
-        vwap_5m = (ticks_df['value'].resample('5min').sum() / vol_5m).reindex(full_time_index)
-
-        def estimate_direction(row):
-            if row['best_ask'] and row['price'] >= row['best_ask']: return 'B'
-            if row['best_bid'] and row['price'] <= row['best_bid']: return 'S'
-            return 'N'
-        
-        ticks_df['direction'] = ticks_df.apply(estimate_direction, axis=1)
-        # 對齊買賣量，空缺值填 0
-        buy_vol = ticks_df[ticks_df['direction'] == 'B']['vol'].resample('5min').sum().reindex(full_time_index, fill_value=0)
-        sell_vol = ticks_df[ticks_df['direction'] == 'S']['vol'].resample('5min').sum().reindex(full_time_index, fill_value=0)
-        
-        # 3. 迭代完整的時間軸，填補空缺
-        last_close = meta_data.get("day_open") # 初始值設為開盤價
-
-        for idx in full_time_index:
-            ts_str = idx.strftime('%H:%M')
-            row = ohlc_5m.loc[idx]
-            
-            # 處理推估買賣量 (因為已填0，可直接取用)
-            b_vol = int(buy_vol.loc[idx])
-            s_vol = int(sell_vol.loc[idx])
-            response["推估五分買賣量"].append(f"{ts_str},B:{b_vol},S:{s_vol}")
+    def _process_summary_data(self, ticks_df, meta_res):
+        """共用的資料處理邏輯"""
+        return self._process_tick_columns({column: ticks_df[column].to_numpy() for column in
+                                           ("ts_sec", "price", "vol", "best_bid", "best_ask")}, meta_res)
 
-            # 處理 5分K
-            if pd.isna(row['open']):
-                # 這是一個沒有成交的區間
-                o = h = l = last_close
-                c = '-'
-                response["即時5分"].append(f"{ts_str},O:{o},H:{h},L:{l},C:{c}")
-            else:
-                # 這是一個有成交的區間
-                o, h, l, c = row['open'], row['high'], row['low'], row['close']
-                response["即時5分"].append(f"{ts_str},O:{o},H:{h},L:{l},C:{c}")
-                last_close = c # 更新最後收盤價
-
-            # 處理均價 (只有在有成交時才加入)
-            vwap_val = vwap_5m.get(idx)
-            if pd.notna(vwap_val):
-                response["均價"].append(f"{ts_str},{vwap_val:.2f}")
-        
+    def _process_tick_columns(self, columns, meta_res):
+        """以單一股票的 ticks 欄位陣列 (DataFrame 欄位或封存檔的 memmap) 組出回應"""
+        meta_data = dict(meta_res._mapping) if meta_res else {}
+        response = self._empty_response(meta_data)
+
+        price, vol = columns["price"], columns["vol"]
+        if len(price) == 0: return response
+
+        response["最新成交價"] = price[-1]
+        response["當日成交量"] = int(np.nansum(vol))
+
+        bars = aggregate_5m(columns["ts_sec"], price, vol, columns["best_bid"], columns["best_ask"])
+        self._append_bar_strings(response, bars, meta_data.get("day_open"))
         return response
+
+    def _append_bar_strings(self, response, bars, day_open):
+        """將 aggregate_5m 的欄位陣列轉為回應中的字串列表"""
+        labels = [format_hhmm(ts) for ts in bars["start_ts"].tolist()]
+        has_trade = ~np.isnan(bars["open"])
+
+        # 無成交的區間以前一根有成交K棒的收盤價補齊 (最前面則用開盤價)
+        prev_close = pd.Series(bars["close"]).ffill().shift(1).tolist()
+        fill = [day_open if pd.isna(c) else c for c in prev_close] if not has_trade.all() else None
+
+        response["推估五分買賣量"] = [f"{t},B:{b},S:{s}" for t, b, s in
+                                zip(labels, bars["buy_vol"].tolist(), bars["sell_vol"].tolist())]
+        response["即時5分"] = [
+            f"{t},O:{o},H:{h},L:{l},C:{c}" if traded else f"{t},O:{fill[i]},H:{fill[i]},L:{fill[i]},C:-"
+            for i, (t, traded, o, h, l, c) in enumerate(zip(
+                labels, has_trade.tolist(), bars["open"].tolist(), bars["high"].tolist(),
+                bars["low"].tolist(), bars["close"].tolist()))
+        ]
+        has_vwap = ~np.isnan(bars["vwap"])
+        response["均價"] = [f"{labels[i]},{v:.2f}" for i, v in
+                          zip(np.flatnonzero(has_vwap).tolist(), bars["vwap"][has_vwap].tolist())]
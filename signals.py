@@ -0,0 +1,219 @@
+"""盤中訊號引擎：每檔股票在記憶體中保留最近幾根 5 分 K，每輪對所有有變動的股票以 numpy 一次評估全部規則
+
+新增規則只需繼承 Rule、實作 evaluate / describe，並以 @register_rule 登記名稱，
+即可透過 SIGNAL_RULES 環境變數 (逗號分隔) 啟用，不會多一次 DB 或 pandas 計算。
+"""
+import numpy as np
+from bars import format_hhmm
+
+# 視窗中每根 K 棒的欄位 (day_vwap 為開盤至該根的累計均價)
+F_START, F_OPEN, F_HIGH, F_LOW, F_CLOSE, F_VOLUME, F_DAY_VWAP = range(7)
+N_FIELDS = 7
+
+RULES = {}
+
+
+def register_rule(name):
+    def decorator(cls):
+        cls.name = name
+        RULES[name] = cls
+        return cls
+    return decorator
+
+
+class Rule:
+    """規則基底類別：evaluate 接收 (k, window, N_FIELDS) 的視窗陣列 (最後一根為最新)，回傳長度 k 的布林陣列"""
+    name = None
+    label = None
+    min_bars = 1
+
+    def evaluate(self, w):
+        raise NotImplementedError
+
+    def describe(self, w):
+        """單一股票觸發時的說明 (w 為該股票的 (window, N_FIELDS) 視窗)"""
+        return {"時間": format_hhmm(int(w[-1, F_START])), "價格": f"{w[-1, F_CLOSE]}"}
+
+
+@register_rule("v_shape")
+class VShapeRule(Rule):
+    """V 型反轉：最近三根 K 棒的低點 l1 > l2 且 l3 > l2"""
+    label = "V型反轉"
+    min_bars = 3
+
+    def evaluate(self, w):
+        l1, l2, l3 = w[:, -3, F_LOW], w[:, -2, F_LOW], w[:, -1, F_LOW]
+        return (l1 > l2) & (l3 > l2)
+
+    def describe(self, w):
+        t1, t3 = format_hhmm(int(w[-3, F_START])), format_hhmm(int(w[-1, F_START]))
+        return {"時間": f"{t1}-{t3}", "價格": f"{w[-3, F_LOW]} > {w[-2, F_LOW]} > {w[-1, F_LOW]}"}
+
+
+@register_rule("breakout")
+class BreakoutRule(Rule):
+    """突破：最新收盤價高於前 lookback 根 K 棒的最高價"""
+    label = "突破"
+
+    def __init__(self, lookback=12):
+        self.lookback = lookback
+        self.min_bars = lookback + 1
+
+    def evaluate(self, w):
+        prior_high = w[:, -self.lookback - 1:-1, F_HIGH].max(axis=1)
+        return w[:, -1, F_CLOSE] > prior_high
+
+    def describe(self, w):
+        prior_high = w[-self.lookback - 1:-1, F_HIGH].max()
+        return {"時間": format_hhmm(int(w[-1, F_START])),
+                "價格": f"{w[-1, F_CLOSE]} > 前 {self.lookback} 根高點 {prior_high}"}
+
+
+@register_rule("volume_spike")
+class VolumeSpikeRule(Rule):
+    """爆量：最新 K 棒成交量達前 lookback 根平均量的 multiple 倍"""
+    label = "爆量"
+
+    def __init__(self, lookback=12, multiple=3.0):
+        self.lookback = lookback
+        self.multiple = multiple
+        self.min_bars = lookback + 1
+
+    def evaluate(self, w):
+        avg = w[:, -self.lookback - 1:-1, F_VOLUME].mean(axis=1)
+        return (avg > 0) & (w[:, -1, F_VOLUME] >= self.multiple * avg)
+
+    def describe(self, w):
+        avg = w[-self.lookback - 1:-1, F_VOLUME].mean()
+        return {"時間": format_hhmm(int(w[-1, F_START])),
+                "成交量": f"{int(w[-1, F_VOLUME])} (前 {self.lookback} 根平均 {avg:.0f})"}
+
+
+@register_rule("vwap_cross")
+class VwapCrossRule(Rule):
+    """均價穿越：收盤價由當日累計均價之下穿越至之上，或反之"""
+    label = "均價穿越"
+    min_bars = 2
+
+    def evaluate(self, w):
+        prev_diff = w[:, -2, F_CLOSE] - w[:, -2, F_DAY_VWAP]
+        diff = w[:, -1, F_CLOSE] - w[:, -1, F_DAY_VWAP]
+        return ((prev_diff < 0) & (diff > 0)) | ((prev_diff > 0) & (diff < 0))
+
+    def describe(self, w):
+        direction = "上穿" if w[-1, F_CLOSE] > w[-1, F_DAY_VWAP] else "下穿"
+        return {"時間": format_hhmm(int(w[-1, F_START])),
+                "價格": f"{w[-1, F_CLOSE]} {direction}均價 {w[-1, F_DAY_VWAP]:.2f}"}
+
+
+def build_rules(names):
+    """依逗號分隔的規則名稱建立規則 (未知名稱會被略過並印出警告)"""
+    rules = []
+    for name in (n.strip() for n in names.split(',')):
+        if not name: continue
+        if name not in RULES:
+            print(f"未知的訊號規則: {name} (可用: {', '.join(RULES)})")
+            continue
+        rules.append(RULES[name]())
+    return rules
+
+
+class SignalEngine:
+    """每檔股票一列固定長度的 K 棒視窗 (右對齊，最後一格為最新一根)，所有股票共用一個 numpy 陣列
+
+    update() 只寫入新出現的 K 棒與仍在進行中的一根；evaluate() 取出本輪有變動股票的視窗，
+    對每條規則做一次向量化判斷，同一規則對同一根 K 棒只觸發一次。
+    """
+
+    def __init__(self, rules, window=None, initial_capacity=256):
+        self.rules = rules
+        self.window = window or max([rule.min_bars for rule in rules] + [3])
+        self._rows = {}  # symbol -> 列號
+        self._data = np.full((initial_capacity, self.window, N_FIELDS), np.nan)
+        self._count = np.zeros(initial_capacity, dtype=np.int64)
+        self._newest_ts = np.full(initial_capacity, -1, dtype=np.int64)
+        self._done_value = np.zeros(initial_capacity)   # 已完成 K 棒的累計成交金額 (計算當日均價)
+        self._done_volume = np.zeros(initial_capacity)
+        self._last_fired = {rule.name: np.full(initial_capacity, -1, dtype=np.int64) for rule in rules}
+
+    def _row(self, symbol):
+        row = self._rows.get(symbol)
+        if row is not None: return row
+        row = self._rows[symbol] = len(self._rows)
+        if row >= len(self._count): self._grow()
+        return row
+
+    def _grow(self):
+        extra = len(self._count)
+        self._data = np.concatenate([self._data, np.full((extra, self.window, N_FIELDS), np.nan)])
+        self._count = np.concatenate([self._count, np.zeros(extra, dtype=np.int64)])
+        self._newest_ts = np.concatenate([self._newest_ts, np.full(extra, -1, dtype=np.int64)])
+        self._done_value = np.concatenate([self._done_value, np.zeros(extra)])
+        self._done_volume = np.concatenate([self._done_volume, np.zeros(extra)])
+        for name, fired in self._last_fired.items():
+            self._last_fired[name] = np.concatenate([fired, np.full(extra, -1, dtype=np.int64)])
+
+    def _reset_row(self, row):
+        self._data[row] = np.nan
+        self._count[row] = 0
+        self._newest_ts[row] = -1
+        self._done_value[row] = self._done_volume[row] = 0.0
+        for fired in self._last_fired.values():
+            fired[row] = -1
+
+    def update(self, symbol, bars):
+        """以 BarBuilder.bars (依時間排序，最後一根進行中) 更新該股票的視窗"""
+        if not bars: return
+        row = self._row(symbol)
+        newest = self._newest_ts[row]
+        if newest >= 0 and (bars[-1].start_ts < newest or bars[0].start_ts > newest):  # BarBuilder 已換日重建
+            self._reset_row(row)
+            newest = -1
+
+        # 需要寫入的 K 棒：上次的最新一根 (可能仍有更新或剛完成) 之後的所有 K 棒
+        start = len(bars) - 1
+        while start > 0 and bars[start - 1].start_ts >= newest:
+            start -= 1
+        new_bars = bars[start:]
+        n_shift = len(new_bars) - (1 if new_bars[0].start_ts == newest else 0)
+        data = self._data[row]
+        if n_shift:
+            if n_shift < self.window:
+                data[:-n_shift] = data[n_shift:]
+            self._count[row] = min(self.window, self._count[row] + n_shift)
+
+        done_value, done_volume = self._done_value[row], self._done_volume[row]
+        # 超出視窗的 K 棒只計入當日均價
+        for bar in new_bars[:-self.window]:
+            done_value += bar.value
+            done_volume += bar.volume
+        visible = new_bars[-self.window:]
+        for slot, bar in enumerate(visible, self.window - len(visible)):
+            volume = done_volume + bar.volume
+            data[slot] = (bar.start_ts, bar.open, bar.high, bar.low, bar.close, bar.volume,
+                          (done_value + bar.value) / volume if volume else np.nan)
+            if bar is not new_bars[-1]:  # 除了最後一根，其餘 K 棒在這次更新時已完成
+                done_value += bar.value
+                done_volume += bar.volume
+        self._done_value[row], self._done_volume[row] = done_value, done_volume
+        self._newest_ts[row] = bars[-1].start_ts
+
+    def evaluate(self, symbols):
+        """評估指定股票，回傳本輪新觸發的訊號 [{rule, label, symbol, bar_ts, detail}]"""
+        symbols = [symbol for symbol in symbols if symbol in self._rows]
+        if not symbols or not self.rules: return []
+        rows = np.fromiter((self._rows[symbol] for symbol in symbols), dtype=np.int64, count=len(symbols))
+        w = self._data[rows]
+        newest = self._newest_ts[rows]
+        count = self._count[rows]
+
+        signals = []
+        with np.errstate(invalid='ignore'):
+            for rule in self.rules:
+                fired = self._last_fired[rule.name]
+                mask = (count >= rule.min_bars) & rule.evaluate(w) & (fired[rows] != newest)
+                for i in np.flatnonzero(mask).tolist():
+                    fired[rows[i]] = newest[i]
+                    signals.append({"rule": rule.name, "label": rule.label, "symbol": symbols[i],
+                                    "bar_ts": int(newest[i]), "detail": rule.describe(w[i])})
+        return signals
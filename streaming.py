@@ -0,0 +1,118 @@
+import json
+import asyncio
+
+
+def format_sse(event, data):
+    """組成一則 Server-Sent Events 訊息"""
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False, separators=(',', ':'))}\n\n"
+
+
+def bar_event(symbol, bar, final):
+    return {"symbol": symbol, "time": bar.ts_str, "start_ts": bar.start_ts,
+            "open": bar.open, "high": bar.high, "low": bar.low, "close": bar.close,
+            "volume": bar.volume, "vwap": bar.vwap, "buy_vol": bar.buy_vol, "sell_vol": bar.sell_vol,
+            "final": final}
+
+
+class Subscription:
+    __slots__ = ('symbols', 'queue')
+
+    def __init__(self, symbols, max_queue):
+        self.symbols = symbols
+        self.queue = asyncio.Queue(maxsize=max_queue)
+
+
+class EventBroker:
+    """盤中事件的一對多推播：輪詢執行緒每輪發佈一次，事件迴圈把同一份已序列化的訊息分送給各訂閱者
+
+    - 每則事件只序列化一次，成本隨事件數而非訂閱者數 × 輪詢頻率成長
+    - 沒有人訂閱的股票不產生事件
+    - 每個訂閱者一個有上限的佇列；跟不上的訂閱者會被斷線 (重新連線即取得最新快照)，不拖慢其他人
+    """
+
+    def __init__(self, max_queue=1000, keepalive_seconds=15):
+        self.max_queue = max_queue
+        self.keepalive_seconds = keepalive_seconds
+        self._loop = None
+        self._by_symbol = {}  # symbol -> set(Subscription)，只在事件迴圈執行緒中修改
+        self._subscriptions = set()
+        self.stats = {"events_published": 0, "frames_delivered": 0, "overflow_disconnects": 0}
+
+    def has_subscribers(self, symbol):
+        return symbol in self._by_symbol
+
+    def publish(self, events):
+        """events 為 [(symbol, event, data)]，可由任何執行緒呼叫；整批只喚醒事件迴圈一次"""
+        loop = self._loop
+        if loop is None or not self._by_symbol: return
+        frames = [(symbol, format_sse(event, data)) for symbol, event, data in events if symbol in self._by_symbol]
+        if not frames: return
+        self.stats["events_published"] += len(frames)
+        try:
+            loop.call_soon_threadsafe(self._fanout, frames)
+        except RuntimeError:
+            pass  # 事件迴圈已關閉
+
+    async def stream(self, symbols, snapshot_fn=None):
+        """訂閱指定股票：先送出每檔目前的快照，之後持續送出增量事件；客戶端斷線時自動取消訂閱"""
+        sub = self._subscribe(symbols)
+        try:
+            # 訂閱與建立快照之間沒有 await，之後的增量事件必定排在快照之後
+            snapshots = [format_sse("snapshot", {"symbol": symbol, "summary": snapshot_fn(symbol)})
+                         for symbol in symbols] if snapshot_fn else []
+            if snapshots: yield "".join(snapshots)
+            while True:
+                try:
+                    frame = await asyncio.wait_for(sub.queue.get(), timeout=self.keepalive_seconds)
+                except asyncio.TimeoutError:
+                    yield ": keepalive\n\n"
+                    continue
+                if frame is None:
+                    yield format_sse("overflow", {"reason": "client too slow, please reconnect"})
+                    return
+                # 佇列中已累積的訊息一起送出，減少寫入次數
+                frames = [frame]
+                while not sub.queue.empty() and len(frames) < 256:
+                    frame = sub.queue.get_nowait()
+                    if frame is None: break
+                    frames.append(frame)
+                yield "".join(frames)
+                if frame is None:
+                    yield format_sse("overflow", {"reason": "client too slow, please reconnect"})
+                    return
+        finally:
+            self._unsubscribe(sub)
+
+    def _subscribe(self, symbols):
+        self._loop = asyncio.get_running_loop()
+        sub = Subscription(tuple(symbols), self.max_queue)
+        self._subscriptions.add(sub)
+        for symbol in sub.symbols:
+            self._by_symbol.setdefault(symbol, set()).add(sub)
+        return sub
+
+    def _unsubscribe(self, sub):
+        self._subscriptions.discard(sub)
+        for symbol in sub.symbols:
+            subs = self._by_symbol.get(symbol)
+            if subs is None: continue
+            subs.discard(sub)
+            if not subs: del self._by_symbol[symbol]
+
+    def _fanout(self, frames):
+        delivered = 0
+        for symbol, frame in frames:
+            for sub in tuple(self._by_symbol.get(symbol, ())):
+                try:
+                    sub.queue.put_nowait(frame)
+                    delivered += 1
+                except asyncio.QueueFull:
+                    # 清空佇列並放入結束標記，stream() 收到後通知客戶端重新連線
+                    self.stats["overflow_disconnects"] += 1
+                    self._unsubscribe(sub)
+                    while not sub.queue.empty(): sub.queue.get_nowait()
+                    sub.queue.put_nowait(None)
+        self.stats["frames_delivered"] += delivered
+
+    def metrics(self):
+        return dict(self.stats, subscribers=len(self._subscriptions), symbols=len(self._by_symbol))
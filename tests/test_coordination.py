@@ -0,0 +1,204 @@
+"""coordination.Coordinator 的租約與收盤屏障，以及 Poller 收盤彙總的多實例流程 (暫存 SQLite，不需要 MySQL)
+
+    python -m pytest tests/test_coordination.py
+"""
+import os
+import sys
+from datetime import datetime
+
+import pytest
+
+# --- GPS 導航：確保 Python 能找到上層資料夾的模組 ---
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT not in sys.path:
+    sys.path.append(ROOT)
+
+import coordination
+import poller as poller_module
+from coordination import Coordinator
+from database import create_database
+from poller import Poller
+from scheduler import TradingCalendar
+from utils import TAIPEI_TZ
+
+
+class FakeClock:
+    def __init__(self, now=1_800_000_000):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+
+class AfterCloseCalendar(TradingCalendar):
+    def is_after_close(self, now_tw):
+        return True
+
+
+class NullNotifier:
+    def submit(self, payload):
+        return True
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(coordination.time, "time", clock)
+    return clock
+
+
+@pytest.fixture
+def db(tmp_path):
+    db = create_database(f"sqlite:///{tmp_path / 'coordination.db'}")
+    db.ensure_schema()
+    yield db
+    db.engine.dispose()
+
+
+def make_node(db, node_id, ttl_seconds=20):
+    node = Coordinator(db, node_id, heartbeat_seconds=5, ttl_seconds=ttl_seconds)
+    node.ensure_schema()
+    node.heartbeat()
+    return node
+
+
+# --- 租約 ---
+def test_lease_is_exclusive_until_it_expires(db, clock):
+    a, b = make_node(db, "a"), make_node(db, "b")
+    assert a.try_acquire("materialize", 60)
+    assert not b.try_acquire("materialize", 60)
+    # 持有者可以延長
+    clock.now += 30
+    assert a.try_acquire("materialize", 60)
+    clock.now += 59
+    assert not b.try_acquire("materialize", 60)
+    # 到期後由其他實例取得，原持有者不能再延長
+    clock.now += 2
+    assert b.try_acquire("materialize", 60)
+    assert not a.try_acquire("materialize", 60)
+
+
+def test_lease_without_renew_runs_once_per_period(db, clock):
+    a = make_node(db, "a")
+    assert a.try_acquire("pruner", 86400, renew=False)
+    clock.now += 3600
+    assert not a.try_acquire("pruner", 86400, renew=False)
+    clock.now += 86400
+    assert a.try_acquire("pruner", 86400, renew=False)
+
+
+def test_different_leases_are_independent(db, clock):
+    a, b = make_node(db, "a"), make_node(db, "b")
+    assert a.try_acquire("materialize", 60)
+    assert b.try_acquire("pruner", 60)
+    assert not b.try_acquire("materialize", 60)
+
+
+# --- 收盤屏障 ---
+def test_barrier_waits_for_every_live_node(db, clock):
+    a, b, c = make_node(db, "a"), make_node(db, "b"), make_node(db, "c")
+    assert a.pending_closing_reports("2026-10-16") == ["a", "b", "c"]
+    assert a.report_closed("2026-10-16") and b.report_closed("2026-10-16")
+    assert a.pending_closing_reports("2026-10-16") == ["c"]
+    # 重複回報不會出錯；其他日期的回報不算數
+    assert a.report_closed("2026-10-16")
+    assert a.pending_closing_reports("2026-10-17") == ["a", "b", "c"]
+    assert c.report_closed("2026-10-16")
+    assert a.pending_closing_reports("2026-10-16") == []
+
+
+def test_barrier_completes_when_a_node_leaves_mid_close(db, clock):
+    a, b, c = make_node(db, "a"), make_node(db, "b"), make_node(db, "c")
+    a.report_closed("2026-10-16")
+    b.report_closed("2026-10-16")
+    c.stop()
+    assert a.pending_closing_reports("2026-10-16") == []
+
+
+def test_barrier_ignores_nodes_whose_heartbeat_expired(db, clock):
+    a, b = make_node(db, "a", ttl_seconds=20), make_node(db, "b", ttl_seconds=20)
+    a.report_closed("2026-10-16")
+    assert a.pending_closing_reports("2026-10-16") == ["b"]
+    clock.now += 10
+    a.heartbeat()
+    assert a.pending_closing_reports("2026-10-16") == ["b"]
+    clock.now += 15  # b 已 25 秒沒有心跳
+    a.heartbeat()
+    assert a.pending_closing_reports("2026-10-16") == []
+
+
+def test_withdrawn_report_blocks_the_barrier_again(db, clock):
+    a, b = make_node(db, "a"), make_node(db, "b")
+    a.report_closed("2026-10-16")
+    b.report_closed("2026-10-16")
+    assert b.withdraw_closed("2026-10-16")
+    assert a.pending_closing_reports("2026-10-16") == ["b"]
+
+
+def test_daily_job_done_marker(db, clock):
+    a, b = make_node(db, "a"), make_node(db, "b")
+    assert not b.is_done("materialize", "2026-10-16")
+    assert a.mark_done("materialize", "2026-10-16")
+    assert a.mark_done("materialize", "2026-10-16")
+    assert b.is_done("materialize", "2026-10-16")
+    assert not b.is_done("materialize", "2026-10-17")
+
+
+# --- Poller 收盤彙總 ---
+@pytest.fixture
+def materialized(monkeypatch):
+    calls = []
+    monkeypatch.setattr(poller_module, "materialize_bars", lambda db, date_str: calls.append(date_str))
+    return calls
+
+
+def make_poller(db, node):
+    return Poller({}, db, None, notifier=NullNotifier(), calendar=AfterCloseCalendar(), coordinator=node)
+
+
+def finish_closing_poll(p, today):
+    """模擬收盤補抓已完成 (不實際連線 MIS)"""
+    p.closing_poll_date = today
+    p._closing_membership = p.coordinator.membership_changes
+
+
+def test_materialize_waits_for_all_nodes_and_runs_once(db, clock, materialized):
+    today = datetime.now(TAIPEI_TZ).strftime('%Y-%m-%d')
+    a, b = make_node(db, "a"), make_node(db, "b")
+    a.heartbeat()
+    pa, pb = make_poller(db, a), make_poller(db, b)
+
+    # 收盤補抓尚未完成時不回報也不彙總
+    pa._materialize_after_close()
+    assert materialized == [] and a.pending_closing_reports(today) == ["a", "b"]
+
+    finish_closing_poll(pa, today)
+    pa._materialize_after_close()
+    assert materialized == [] and pa.materialized_date is None
+
+    finish_closing_poll(pb, today)
+    pb._materialize_after_close()
+    assert materialized == [today] and pb.materialized_date == today
+
+    # 另一個實例看到完成紀錄才視為當日完成，不再重複彙總
+    pa._materialize_after_close()
+    assert materialized == [today] and pa.materialized_date == today
+
+
+def test_materialize_proceeds_when_a_node_leaves_before_reporting(db, clock, materialized):
+    today = datetime.now(TAIPEI_TZ).strftime('%Y-%m-%d')
+    a, b = make_node(db, "a"), make_node(db, "b")
+    a.heartbeat()
+    pa = make_poller(db, a)
+    finish_closing_poll(pa, today)
+    pa._materialize_after_close()
+    assert materialized == []
+
+    b.stop()
+    a.heartbeat()
+    # 成員變動後需重新補抓 (接手 b 的股票)，補抓完成前不彙總
+    pa._materialize_after_close()
+    assert materialized == []
+    finish_closing_poll(pa, today)
+    pa._materialize_after_close()
+    assert materialized == [today] and pa.materialized_date == today
@@ -1,4 +1,7 @@
-from datetime import datetime
+from datetime import datetime, time
+from pytz import timezone
+
+TAIPEI_TZ = timezone('Asia/Taipei')
 
 def to_float(x):
     try:
@@ -16,5 +19,14 @@ def first_px(levels):
     except Exception:
         return None
 
-def get_today_date_str():
-    return datetime.today().strftime('%Y-%m-%d')
+def get_today_date_str(ts=None):
+    """今日日期字串；指定 ts (epoch 秒) 時回傳該時間點在台北的日期 (replay 使用)"""
+    if ts is None:
+        return datetime.today().strftime('%Y-%m-%d')
+    return datetime.fromtimestamp(ts, TAIPEI_TZ).strftime('%Y-%m-%d')
+
+def taipei_day_start_ts(date=None):
+    """取得台北時間指定日期 (預設今日) 00:00 的 epoch 秒數"""
+    if date is None:
+        date = datetime.now(TAIPEI_TZ).date()
+    return int(TAIPEI_TZ.localize(datetime.combine(date, time.min)).timestamp())
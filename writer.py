@@ -0,0 +1,189 @@
+import time
+import threading
+from live_cache import COALESCE_META_FIELDS
+
+
+def merge_meta(old, new):
+    """合併同一 (symbol, trade_date) 的兩筆 meta，語意與 bulk_upsert_daily_meta 的 COALESCE 相同"""
+    merged = dict(new)
+    for key in COALESCE_META_FIELDS:
+        if merged.get(key) is None:
+            merged[key] = old.get(key)
+    return merged
+
+
+class WriteBehindWriter:
+    """write-behind 緩衝區：輪詢執行緒只把資料放進記憶體，由專屬執行緒合併多輪資料後批次寫入 DB
+
+    - 相同主鍵的資料在緩衝區內直接合併 (後到覆蓋先到)，與 DB 的 upsert 結果一致
+    - 累積達 flush_rows 筆或距上次寫入超過 flush_seconds 秒時觸發寫入
+    - 緩衝區滿 (max_pending_rows) 時 submit 最多等待 put_timeout 秒，仍無空間則丟棄新的 ticks 並計數
+    - 寫入失敗的批次會放回緩衝區 (不覆蓋之後收到的較新資料)，下次再試
+    """
+
+    def __init__(self, db, flush_rows=2000, flush_seconds=1.0, max_pending_rows=50000, put_timeout=1.0):
+        self.db = db
+        self.flush_rows = flush_rows
+        self.flush_seconds = flush_seconds
+        self.max_pending_rows = max_pending_rows
+        self.put_timeout = put_timeout
+
+        self._cond = threading.Condition()
+        self._meta = {}   # (symbol, trade_date) -> record
+        self._ticks = {}  # (symbol, ts_sec) -> record
+        self._flushing = False
+        self._flush_requested = False
+        self._closed = False
+
+        self.stats = {
+            "rows_submitted": 0, "rows_written": 0, "rows_dropped": 0, "rows_merged": 0,
+            "flushes": 0, "flush_failures": 0, "last_flush_rows": 0, "last_flush_ms": 0.0,
+            "max_pending_rows": 0, "backpressure_waits": 0, "backpressure_wait_ms": 0.0,
+        }
+        self._thread = threading.Thread(target=self._run, name='write-behind', daemon=True)
+        self._thread.start()
+
+    @property
+    def pending_rows(self):
+        return len(self._meta) + len(self._ticks)
+
+    def submit(self, meta_records, tick_records):
+        """放入一輪輪詢的資料，除非緩衝區已滿，否則不會等待 DB"""
+        with self._cond:
+            if self.pending_rows + len(tick_records) > self.max_pending_rows:
+                wait_start = time.perf_counter()
+                self.stats["backpressure_waits"] += 1
+                self._flush_requested = True
+                self._cond.notify_all()
+                self._cond.wait_for(lambda: self.pending_rows + len(tick_records) <= self.max_pending_rows or self._closed,
+                                    timeout=self.put_timeout)
+                self.stats["backpressure_wait_ms"] += (time.perf_counter() - wait_start) * 1000
+
+            for record in meta_records:
+                key = (record["symbol"], record["trade_date"])
+                old = self._meta.get(key)
+                self._meta[key] = merge_meta(old, record) if old else record
+
+            room = self.max_pending_rows - self.pending_rows
+            for record in tick_records:
+                key = (record.symbol, record.ts_sec)
+                if key in self._ticks:
+                    self.stats["rows_merged"] += 1
+                elif room <= 0:
+                    self.stats["rows_dropped"] += 1
+                    continue
+                else:
+                    room -= 1
+                self._ticks[key] = record
+
+            self.stats["rows_submitted"] += len(meta_records) + len(tick_records)
+            self.stats["max_pending_rows"] = max(self.stats["max_pending_rows"], self.pending_rows)
+            if self.pending_rows >= self.flush_rows:
+                self._cond.notify_all()
+
+    def flush(self, timeout=30):
+        """要求立即寫入並等待緩衝區清空 (例如收盤彙總前)，回傳是否成功清空"""
+        with self._cond:
+            self._flush_requested = True
+            self._cond.notify_all()
+            # 寫入執行緒已結束時不再等待，但緩衝區仍有資料就回報失敗
+            self._cond.wait_for(lambda: (self.pending_rows == 0 and not self._flushing) or not self._thread.is_alive(),
+                                timeout=timeout)
+            return self.pending_rows == 0 and not self._flushing
+
+    def close(self, timeout=30):
+        """停止寫入執行緒，並保證在結束前把緩衝區全部寫入"""
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+        self._thread.join(timeout)
+        if self.pending_rows:
+            print(f"write-behind 關閉時仍有 {self.pending_rows} 筆資料未寫入。")
+
+    def metrics(self):
+        with self._cond:
+            return dict(self.stats, pending_rows=self.pending_rows)
+
+    def _run(self):
+        last_flush = time.monotonic()
+        while True:
+            with self._cond:
+                self._cond.wait_for(
+                    lambda: self._closed or self._flush_requested or self.pending_rows >= self.flush_rows
+                    or (self.pending_rows and time.monotonic() - last_flush >= self.flush_seconds),
+                    timeout=self.flush_seconds)
+                if not self.pending_rows:
+                    self._flush_requested = False
+                    self._cond.notify_all()
+                    if self._closed: return
+                    continue
+                meta, ticks = self._meta, self._ticks
+                self._meta, self._ticks = {}, {}
+                self._flushing = True
+                self._flush_requested = False
+
+            ok = self._write(list(meta.values()), list(ticks.values()))
+            last_flush = time.monotonic()
+
+            with self._cond:
+                self._flushing = False
+                if not ok:
+                    self._requeue(meta, ticks)
+                self._cond.notify_all()
+            if not ok:
+                if self._closed: return
+                time.sleep(min(self.flush_seconds, 1.0))  # DB 異常時稍候再試，避免連續重試
+
+    def _write(self, meta_records, tick_records):
+        started = time.perf_counter()
+        ok = True
+        if meta_records: ok = self.db.bulk_upsert_daily_meta(meta_records) is not False
+        if ok and tick_records: ok = self.db.bulk_upsert_ticks(tick_records) is not False
+
+        with self._cond:
+            if ok:
+                self.stats["flushes"] += 1
+                self.stats["rows_written"] += len(meta_records) + len(tick_records)
+                self.stats["last_flush_rows"] = len(meta_records) + len(tick_records)
+                self.stats["last_flush_ms"] = round((time.perf_counter() - started) * 1000, 1)
+            else:
+                self.stats["flush_failures"] += 1
+        return ok
+
+    def _requeue(self, meta, ticks):
+        """寫入失敗的資料放回緩衝區，已有較新資料的主鍵則保留較新者"""
+        for key, record in meta.items():
+            newer = self._meta.get(key)
+            self._meta[key] = merge_meta(record, newer) if newer else record
+        for key, record in ticks.items():
+            self._ticks.setdefault(key, record)
+
+
+class ChangeFilter:
+    """記錄每檔股票最後送出的 meta 與成交，濾掉 MIS 重複回傳的相同快照，讓寫入量隨實際成交而非輪詢次數成長"""
+
+    def __init__(self):
+        self._last_meta = {}   # symbol -> meta 快照 (交易日與 MIS 原始欄位字串)
+        self._last_tick = {}   # symbol -> (tlong, z, tv, v) 原始字串
+        self.stats = {"meta_passed": 0, "meta_suppressed": 0, "ticks_passed": 0, "ticks_suppressed": 0}
+
+    def meta_changed(self, symbol, key):
+        if self._last_meta.get(symbol) == key:
+            self.stats["meta_suppressed"] += 1
+            return False
+        self._last_meta[symbol] = key
+        self.stats["meta_passed"] += 1
+        return True
+
+    def tick_changed(self, symbol, key):
+        if self._last_tick.get(symbol) == key:
+            self.stats["ticks_suppressed"] += 1
+            return False
+        self._last_tick[symbol] = key
+        self.stats["ticks_passed"] += 1
+        return True
+
+    def forget(self, symbol):
+        """下次收到該股票的快照時一定視為有變動"""
+        self._last_meta.pop(symbol, None)
+        self._last_tick.pop(symbol, None)